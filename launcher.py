@@ -1,9 +1,80 @@
 from lib.bot import MOCBOT
+from lib.socket.Router import SocketRouter
+from utils.ConfigHandler import Config
 import argparse
+import asyncio
+import logging
+import multiprocessing
+import sys
 
-parser = argparse.ArgumentParser(description="Runs MOCBOT.")
-parser.add_argument("--dev", action="store_true", help="Enable development mode.")
-args = parser.parse_args()
 
-bot = MOCBOT(args.dev)
-bot.run()
+def run_worker(is_dev: bool, shard_count: int, shard_ids: list[int], worker_id: int, port: int) -> None:
+    MOCBOT(
+        is_dev,
+        shard_count=shard_count,
+        shard_ids=shard_ids,
+        worker_id=worker_id,
+        socket_address=("127.0.0.1", port),
+    ).run()
+
+
+async def supervise(router: SocketRouter, processes: list[multiprocessing.Process]) -> int:
+    """Run the socket router until a worker exits, returning its exit code."""
+    config = Config.fetch()["SOCKET"]
+    await router.start(config["HOST"], config["PORT"])
+    while all(process.is_alive() for process in processes):
+        await asyncio.sleep(5)
+
+    exited = next(process for process in processes if not process.is_alive())
+    logging.getLogger(__name__).error("%s exited with code %s, shutting down", exited.name, exited.exitcode)
+    return exited.exitcode or 1
+
+
+def run_workers(is_dev: bool, shard_count: int, workers: int) -> None:
+    """Split the shards into contiguous ranges, run each range in its own process, and route socket events from
+    this process to the worker owning each guild."""
+    MOCBOT.configure_logging("logs/router.log")
+    shard_ranges = [list(range(i * shard_count // workers, (i + 1) * shard_count // workers)) for i in range(workers)]
+    base_port = Config.fetch()["SOCKET"].get("WORKER_PORTS_START", 65400)
+    ports = [base_port + i for i in range(workers)]
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=run_worker, args=(is_dev, shard_count, shards, i, ports[i]), name=f"mocbot-worker-{i}"
+        )
+        for i, shards in enumerate(shard_ranges)
+    ]
+    for process in processes:
+        process.start()
+
+    router = SocketRouter(shard_count, shard_ranges, [f"http://127.0.0.1:{port}" for port in ports])
+    exit_code = 0
+    try:
+        exit_code = asyncio.run(supervise(router, processes))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs MOCBOT.")
+    parser.add_argument("--dev", action="store_true", help="Enable development mode.")
+    parser.add_argument("--shards", type=int, default=1, help="Total number of shards to run.")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of processes to split the shards across, each on its own core."
+    )
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        if args.shards < args.workers:
+            parser.error("--shards must be at least --workers")
+        run_workers(args.dev, args.shards, args.workers)
+    else:
+        bot = MOCBOT(args.dev, shard_count=args.shards)
+        bot.run()
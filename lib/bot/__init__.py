@@ -1,48 +1,162 @@
 import asyncio
 from utils.APIHandler import API
+from utils.LocalQueueHandler import LocalQueueHandler
 from discord.ext import commands
+from logging.handlers import QueueListener
 import logging.config
 import logging
 import discord
+import atexit
+import queue
 import os
 import typing
 import json
 
 from discord import Embed, Colour, Interaction, Message
+from utils.MemoryProfile import MemoryProfile
+from lib.cogs.Cogs import Cogs
 from lib.socket.Socket import Socket
 from lib.music.MusicService import MusicService
+from utils.ConfigHandler import Config
+from utils.LoopWatchdog import LoopWatchdog
+from utils.Metrics import metrics, monitor_event_loop_lag
+from utils.RestScheduler import RestScheduler
+from utils.Resolver import Resolver
+from lib.joins.JoinPipeline import JoinPipeline
 
+COMMAND_SECONDS = metrics.histogram(
+    "mocbot_command_seconds", "Time from a command being invoked to it completing, by command", ["command"]
+)
 
-class MOCBOT(commands.Bot):
+
+class MOCBOT(commands.AutoShardedBot):
     music_service: MusicService
+    log_listener: typing.Optional[QueueListener] = None
 
-    def __init__(self, is_dev: bool) -> None:
+    def __init__(
+        self,
+        is_dev: bool,
+        shard_count: int = 1,
+        shard_ids: typing.Optional[list[int]] = None,
+        worker_id: typing.Optional[int] = None,
+        socket_address: typing.Optional[tuple[str, int]] = None,
+    ) -> None:
+        self.memory_profile = MemoryProfile.build(
+            Config.fetch().get("MEMORY_PROFILE", "full"), Cogs.get_enabled_cogs(is_dev)
+        )
         super().__init__(command_prefix="!",
-                         intents=discord.Intents.all(),
-                         allowed_mentions=discord.AllowedMentions.none())
+                         intents=self.memory_profile.intents,
+                         member_cache_flags=self.memory_profile.member_cache_flags,
+                         chunk_guilds_at_startup=self.memory_profile.chunk_guilds_at_startup,
+                         allowed_mentions=discord.AllowedMentions.none(),
+                         shard_count=shard_count,
+                         shard_ids=shard_ids)
         self.is_dev = is_dev
+        # Set when running as one of several worker processes, see launcher.py
+        self.worker_id = worker_id
+        self.socket_address = socket_address
         self.mode = "DEVELOPMENT" if is_dev else "PRODUCTION"
-        self.developers = API.get("/developers")
+        self.developers = []
+        self.watchdog: typing.Optional[LoopWatchdog] = None
+        # Outbound Discord requests that are not interaction responses go through here, see RestScheduler
+        self.rest = RestScheduler()
+        # Looks up guilds, members and channels in the cache before falling back to REST
+        self.resolver = Resolver(self)
+        join_config = Config.fetch().get("JOIN_PIPELINE", {})
+        # Member joins are batched per guild, see JoinPipeline. Cogs register what to do for each member
+        self.joins = JoinPipeline(
+            self,
+            window=join_config.get("WINDOW_MS", 1000) / 1000,
+            max_batch=join_config.get("MAX_BATCH", 100),
+            target_joins_per_second=join_config.get("TARGET_JOINS_PER_SECOND", 15),
+        )
         self.WEBSITE_BASE_URL = os.environ["WEBSITE_BASE_URL"]
 
     async def setup_hook(self) -> None:
         self.setup_logger()
+        # Boot phase: blocking startup I/O runs off the event loop, alongside loading the cogs
+        developers = asyncio.create_task(asyncio.to_thread(API.get, "/developers"))
         self.music_service = MusicService(self)
+        self.register_metrics()
+        self.rest.start()
         await self.load_cog_manager()
+        self.developers = await developers
         self.appinfo = await super().application_info()
         if self.appinfo.icon is not None:
             self.avatar_url = self.appinfo.icon.url
         else:
             self.avatar_url = f"https://cdn.discordapp.com/embed/avatars/" f"{int(self.user.discriminator) % 5}.png"
 
+    def register_metrics(self) -> None:
+        watchdog_config = Config.fetch().get("WATCHDOG", {})
+        if watchdog_config.get("ENABLED", True):
+            # Measures loop lag from its own thread, so it also catches the loop being blocked outright
+            self.watchdog = LoopWatchdog(asyncio.get_running_loop(), watchdog_config.get("THRESHOLD_MS", 250) / 1000)
+            self.watchdog.start()
+        else:
+            self.loop_lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+        metrics.gauge("mocbot_guilds", "Guilds the bot is in", function=lambda: len(self.guilds))
+        metrics.gauge(
+            "mocbot_gateway_latency_seconds", "Heartbeat latency of each shard", ["shard"],
+            function=lambda: [((str(shard_id),), latency) for shard_id, latency in self.latencies],
+        )
+
+    async def close(self) -> None:
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        self.rest.stop()
+        await super().close()
+
     def setup_logger(self):
-        with open("./logging.json") as f:
-            logging.config.dictConfig(json.loads(f.read()))
+        MOCBOT.configure_logging("logs/latest.log" if self.worker_id is None else f"logs/worker-{self.worker_id}.log")
         self.logger = logging.getLogger(__name__)
-        for handler in logging.getLogger().handlers:
-            if handler.name == "file" and os.path.isfile("logs/latest.log"):
+
+    @staticmethod
+    def configure_logging(log_file: str) -> None:
+        """Configure logging from logging.json, writing to log_file. Each process needs its own log file.
+
+        The configured handlers run on a background thread and loggers only queue records, so writing and rolling
+        over the log file never blocks the event loop. Set LOG_FORMAT=json to write the log file as JSON lines.
+        """
+        with open("./logging.json") as f:
+            config = json.loads(f.read())
+        config["handlers"]["file"]["filename"] = log_file
+        if os.environ.get("LOG_FORMAT") == "json":
+            config["handlers"]["file"]["formatter"] = "json"
+
+        MOCBOT.stop_logging()
+        logging.config.dictConfig(config)
+        root = logging.getLogger()
+        handlers = root.handlers
+        for handler in handlers:
+            if handler.name == "file" and os.path.isfile(log_file):
                 handler.doRollover()
-        logging.getLogger("discord").setLevel(logging.DEBUG)
+
+        # Filters on the root logger only see records logged to it directly. On the queue handler they see every
+        # record, and sampled out records are dropped before being queued
+        queue_handler = LocalQueueHandler(queue.SimpleQueue())
+        queue_handler.filters, root.filters = root.filters, []
+        root.handlers = [queue_handler]
+        MOCBOT.log_listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        MOCBOT.log_listener.start()
+        atexit.register(MOCBOT.stop_logging)
+
+    @staticmethod
+    def stop_logging() -> None:
+        """Write out any queued records and stop the logging thread."""
+        if MOCBOT.log_listener is not None:
+            MOCBOT.log_listener.stop()
+            MOCBOT.log_listener = None
+
+    async def ensure_chunked(self, guild: discord.Guild) -> None:
+        """Request every member of a guild if they have not been yet. Only needed under the lean memory profile,
+        which does not chunk guilds at startup."""
+        if guild.chunked or not self.memory_profile.chunks_lazily:
+            return
+        try:
+            await asyncio.wait_for(guild.chunk(), timeout=max(5.0, (guild.member_count or 0) / 10000))
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Timed out chunking members of {guild} ({guild.id})")
 
     async def load_cog_manager(self) -> None:
         await self.load_extension("lib.cogs.Cogs")
@@ -53,7 +167,7 @@ class MOCBOT(commands.Bot):
 
         await asyncio.gather(
             super().start(token, reconnect=True),
-            Socket.start(self),
+            Socket.start(self, *(self.socket_address or ())),
         )
 
     def run(self) -> None:
@@ -107,15 +221,31 @@ class MOCBOT(commands.Bot):
     async def on_ready(self) -> None:
         self.appinfo = await super().application_info()
         self.avatar_url = self.appinfo.icon.url
-        self.logger.info(f"Connected on {self.user.name} ({self.mode}) | d.py v{str(discord.__version__)}")
+        self.logger.info(
+            f"Connected on {self.user.name} ({self.mode}) | shards {sorted(self.shards)} of {self.shard_count} | "
+            f"{self.memory_profile.name} memory profile | d.py v{str(discord.__version__)}"
+        )
 
     async def on_interaction(self, interaction: Interaction) -> None:
+        self.rest.note_interaction()
         if interaction.type is discord.InteractionType.application_command:
             self.logger.info(
                 f"[COMMAND] [{interaction.guild} // {interaction.guild.id}] {interaction.user} ({interaction.user.id})"
-                f" used command {interaction.command.name}"
+                f" used command {interaction.command.name}",
+                extra={"guild_id": interaction.guild_id, "command": interaction.command.name},
             )
 
+    async def on_member_join(self, member: discord.Member) -> None:
+        self.joins.submit(member)
+
+    async def on_app_command_completion(self, interaction: Interaction, command) -> None:
+        latency_ms = round((discord.utils.utcnow() - interaction.created_at).total_seconds() * 1000)
+        COMMAND_SECONDS.observe(latency_ms / 1000, command=command.qualified_name)
+        self.logger.debug(
+            f"[COMMAND] {command.qualified_name} completed in {latency_ms}ms",
+            extra={"guild_id": interaction.guild_id, "command": command.qualified_name, "latency_ms": latency_ms},
+        )
+
     async def on_message(self, message: Message) -> None:
         await self.wait_until_ready()
         if isinstance(message.channel, discord.DMChannel) and message.author.id in self.developers:
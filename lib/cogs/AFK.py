@@ -1,24 +1,91 @@
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands, DMChannel
 from utils.APIHandler import API
+from utils.APIModels import AFKEntry
+from utils.Cache import Cache
+from utils.RestScheduler import Priority
 from requests.exceptions import HTTPError
 import discord
-from expiringdict import ExpiringDict
 
 import typing
 import asyncio
 import logging
 
+# How long each reconciliation spreads its reloads of already loaded guilds over
+RECONCILE_SPREAD_SECONDS = 5 * 60
+# How many guilds that are not loaded yet are loaded at once
+LOAD_CONCURRENCY = 4
+
 
 class AFK(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.logger = logging.getLogger(__name__)
-        self.cache = ExpiringDict(max_len=500, max_age_seconds=300, items=None)
+        # guild_id -> user_id -> AFK data, for every guild whose AFK users have been loaded
+        self.afk_users: dict[int, dict[int, AFKEntry]] = {}
+        # guild_id -> number of local changes, so a reconciliation never overwrites a change made while it ran
+        self._versions: dict[int, int] = {}
+        # "guild_id/user_id" -> AFK data or None, for lookups in guilds that are not loaded yet
+        self.fallback: Cache[str, typing.Optional[AFKEntry]] = Cache("afk", maxsize=500, ttl=300, negative_ttl=300)
+        self.reconcile_afk_users.start()
 
     async def cog_load(self):
         self.logger.info(f"[COG] Loaded {self.__class__.__name__}")
 
+    async def cog_unload(self):
+        self.reconcile_afk_users.cancel()
+
+    async def load_guild(self, guild_id: int):
+        """Replace the AFK index of a guild with the AFK users stored in the API."""
+        version = self._versions.get(guild_id, 0)
+        try:
+            users = await asyncio.to_thread(API.get, f"/afk/{guild_id}", model=AFKEntry)
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                self.logger.error("Failed to load AFK users for guild %s: %s", guild_id, e)
+                return
+            users = []
+
+        if self._versions.get(guild_id, 0) != version:
+            return
+        self.afk_users[guild_id] = {user.user_id: user for user in users or []}
+
+    @tasks.loop(minutes=10)
+    async def reconcile_afk_users(self):
+        # Guilds that are not loaded yet are served by the API until they are, so are loaded first. The rest are
+        # reloaded one at a time, spread out rather than all at once
+        unloaded = [guild.id for guild in self.bot.guilds if guild.id not in self.afk_users]
+        loaded = [guild.id for guild in self.bot.guilds if guild.id in self.afk_users]
+
+        semaphore = asyncio.Semaphore(LOAD_CONCURRENCY)
+
+        async def load(guild_id):
+            async with semaphore:
+                await self.load_guild(guild_id)
+
+        await asyncio.gather(*(load(guild_id) for guild_id in unloaded))
+        for guild_id in loaded:
+            await self.load_guild(guild_id)
+            await asyncio.sleep(RECONCILE_SPREAD_SECONDS / len(loaded))
+
+    @reconcile_afk_users.before_loop
+    async def before_reconcile_afk_users(self):
+        await self.bot.wait_until_ready()
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        await self.load_guild(guild.id)
+
+    def _set_entry(self, guild_id, user_id, entry):
+        self._versions[guild_id] = self._versions.get(guild_id, 0) + 1
+        self.fallback.set(f"{guild_id}/{user_id}", entry)
+        if guild_id not in self.afk_users:
+            return
+        if entry is None:
+            self.afk_users[guild_id].pop(user_id, None)
+        else:
+            self.afk_users[guild_id][user_id] = entry
+
     def add_user(self, data: object):
         route = f'/afk/{data["guild_id"]}/{data["user_id"]}'
         newData = API.post(
@@ -29,34 +96,37 @@ class AFK(commands.Cog):
                 "OldName": data["old_name"],
                 "Reason": data["reason"],
             },
+            model=AFKEntry,
         )
-        self.cache[f'{data["guild_id"]}/{data["user_id"]}'] = {
-            key: value for key, value in newData.items() if key not in ["UserID", "GuildID"]
-        }
+        self._set_entry(data["guild_id"], data["user_id"], newData)
 
     def remove_user(self, data: object):
         route = f'/afk/{data["guild_id"]}/{data["user_id"]}'
         API.delete(route)
-        try:
-            del self.cache[f'{data["guild_id"]}/{data["user_id"]}']
-        except KeyError:
-            pass
+        self._set_entry(data["guild_id"], data["user_id"], None)
 
-    def get_user(self, guild_id, user_id):
-        data = self.cache.get(f"{guild_id}/{user_id}", None)
-        if data is None:
-            try:
-                data = API.get(f"/afk/{guild_id}/{user_id}")
-            except HTTPError as e:
-                if e.response.status_code == 404:
-                    self.cache[f"{guild_id}/{user_id}"] = {}
-            else:
-                self.cache[f"{guild_id}/{user_id}"] = data
-        return data
+    async def get_user(self, guild_id, user_id) -> typing.Optional[AFKEntry]:
+        """Get the AFK data of a user, or None if they are not AFK. Served from the index once the guild is
+        loaded, and from a cache of API lookups until then."""
+        if guild_id in self.afk_users:
+            return self.afk_users[guild_id].get(user_id)
+
+        return await self.fallback.get_or_load(
+            f"{guild_id}/{user_id}", lambda: asyncio.to_thread(self.fetch_user, guild_id, user_id)
+        )
+
+    @staticmethod
+    def fetch_user(guild_id, user_id) -> typing.Optional[AFKEntry]:
+        try:
+            return API.get(f"/afk/{guild_id}/{user_id}", model=AFKEntry)
+        except HTTPError as e:
+            if e.response.status_code == 404:
+                return None
+            raise e
 
-    async def get_message(self, data):
-        channel = self.bot.get_channel(data["ChannelID"])
-        return await channel.fetch_message(data["MessageID"])
+    async def get_message(self, data: AFKEntry):
+        channel = self.bot.get_channel(data.channel_id)
+        return await channel.fetch_message(data.message_id)
 
     @app_commands.command(name="afk", description="Set an AFK status.")
     async def afk(
@@ -64,41 +134,43 @@ class AFK(commands.Cog):
         interaction: discord.Interaction,
         reason: typing.Optional[str] = "N/A",
     ):
-        route = f"/afk/{interaction.guild.id}/{interaction.user.id}"
-        try:
-            data = API.get(route)
-        except HTTPError as e:
-            if e.response.status_code == 404:
-                afk_embed = self.bot.create_embed(
-                    "MOCBOT AFK",
-                    f"{interaction.user.mention} is now AFK.",
-                    None,
-                )
-                afk_embed.add_field(name="REASON:", value="{}".format(reason)).set_thumbnail(
-                    url=interaction.user.display_avatar.url
-                )
-                await interaction.response.send_message(embed=afk_embed)
-                msg = await interaction.original_response()
-                self.add_user(
-                    {
-                        "msg_id": str(msg.id),
-                        "channel_id": str(msg.channel.id),
-                        "old_name": interaction.user.display_name,
-                        "reason": reason,
-                        "user_id": interaction.user.id,
-                        "guild_id": interaction.guild.id,
-                    }
+        data = await self.get_user(interaction.guild.id, interaction.user.id)
+        if data is None:
+            afk_embed = self.bot.create_embed(
+                "MOCBOT AFK",
+                f"{interaction.user.mention} is now AFK.",
+                None,
+            )
+            afk_embed.add_field(name="REASON:", value="{}".format(reason)).set_thumbnail(
+                url=interaction.user.display_avatar.url
+            )
+            await interaction.response.send_message(embed=afk_embed)
+            msg = await interaction.original_response()
+            self.add_user(
+                {
+                    "msg_id": str(msg.id),
+                    "channel_id": str(msg.channel.id),
+                    "old_name": interaction.user.display_name,
+                    "reason": reason,
+                    "user_id": interaction.user.id,
+                    "guild_id": interaction.guild.id,
+                }
+            )
+            if interaction.user.id != interaction.guild.owner_id:
+                await self.bot.rest.run(
+                    Priority.INTERACTION,
+                    lambda: interaction.user.edit(
+                        nick=f"[AFK] {interaction.user.display_name}", reason="User went AFK"
+                    ),
+                    bucket=("member", interaction.guild.id, interaction.user.id),
                 )
-                if interaction.user.id != interaction.guild.owner_id:
-                    await interaction.user.edit(
-                        nick=f"[AFK] {interaction.user.display_name}",
-                        reason="User went AFK",
-                    )
-            else:
-                raise e
         else:
             if interaction.user.id != interaction.guild.owner_id:
-                await interaction.user.edit(nick=data["OldName"], reason="User removed from AFK")
+                await self.bot.rest.run(
+                    Priority.INTERACTION,
+                    lambda: interaction.user.edit(nick=data.old_name, reason="User removed from AFK"),
+                    bucket=("member", interaction.guild.id, interaction.user.id),
+                )
             try:
                 message_to_delete = await self.get_message(data)
                 await message_to_delete.delete()
@@ -117,14 +189,25 @@ class AFK(commands.Cog):
             await asyncio.sleep(5)
             await interaction.delete_original_response()
 
+    def restore_nick(self, member: discord.Member, nick: str):
+        """Queue restoring a member's nickname on their return. It must not be shed, or they would keep the
+        [AFK] prefix."""
+        self.bot.rest.schedule(
+            Priority.BACKGROUND,
+            lambda: member.edit(nick=nick, reason="User removed from AFK"),
+            bucket=("member", member.guild.id, member.id),
+            key=("afk_nick", member.guild.id, member.id),
+            sheddable=False,
+        )
+
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author.bot or isinstance(message.channel, DMChannel):
             return
-        data = self.get_user(message.guild.id, message.author.id)
-        if data is not None and data != {}:
+        data = await self.get_user(message.guild.id, message.author.id)
+        if data is not None:
             if message.author.id != message.channel.guild.owner_id:
-                await message.author.edit(nick=data["OldName"], reason="User removed from AFK")
+                self.restore_nick(message.author, data.old_name)
             try:
                 message_to_delete = await self.get_message(data)
             except discord.errors.NotFound:
@@ -136,27 +219,31 @@ class AFK(commands.Cog):
             afk_embed.set_thumbnail(url=message.author.display_avatar.url)
             return await message.channel.send(embed=afk_embed, delete_after=5)
 
-        if message.mentions and not message.author.bot:
-            for id in [x.id for x in message.mentions]:
-                data = self.get_user(message.guild.id, id)
-                if data is not None and data != {}:
-                    user = self.bot.get_user(id)
-                    afk_embed = self.bot.create_embed("MOCBOT AFK", f"{user.mention} is currently AFK.", None)
-                    afk_embed.add_field(name="REASON:", value="{}".format(data["Reason"])).set_thumbnail(
-                        url=user.display_avatar.url
-                    )
-                    return await message.channel.send(message.author.mention, embed=afk_embed, delete_after=5)
+        afk_mentions = []
+        for user in {user.id: user for user in message.mentions}.values():
+            data = await self.get_user(message.guild.id, user.id)
+            if data is not None:
+                afk_mentions.append((user, data))
+        if afk_mentions:
+            embeds = []
+            for user, data in afk_mentions[:10]:
+                afk_embed = self.bot.create_embed("MOCBOT AFK", f"{user.mention} is currently AFK.", None)
+                afk_embed.add_field(name="REASON:", value="{}".format(data.reason)).set_thumbnail(
+                    url=user.display_avatar.url
+                )
+                embeds.append(afk_embed)
+            return await message.channel.send(message.author.mention, embeds=embeds, delete_after=5)
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
         if before.channel != after.channel:
-            data = self.get_user(member.guild.id, member.id)
-            if data is not None and data != {}:
-                channel = self.bot.get_channel(data["ChannelID"])
+            data = await self.get_user(member.guild.id, member.id)
+            if data is not None:
+                channel = self.bot.get_channel(data.channel_id)
                 if member.id != channel.guild.owner_id:
-                    await member.edit(nick=data["OldName"], reason="User removed from AFK")
+                    self.restore_nick(member, data.old_name)
                 try:
-                    message_to_delete = await channel.fetch_message(data["MessageID"])
+                    message_to_delete = await channel.fetch_message(data.message_id)
                 except discord.errors.NotFound:
                     pass
                 else:
@@ -1,40 +1,86 @@
 from discord.ext import commands
 from discord import app_commands
 from utils.ConfigHandler import Config
+from pathlib import Path
 import discord
+import asyncio
+import importlib
 import logging
-from glob import glob
-import os
+import time
 import traceback
 
+COGS_DIRECTORY = Path(__file__).parent
+
 
 class Cogs(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.disabled_cogs = []
+        self.disabled_cogs = Cogs.get_disabled_cogs(self.bot.is_dev)
         self.unloaded_cogs = []
         self.logger = logging.getLogger(__name__)
 
         if self.bot.is_dev:
             self.logger.warn("--dev flag activated. Additional cogs will not be loaded.")
-            for cog in [
-                (path.split("\\")[-1][:-3] if os.name == "nt" else path.split("\\")[-1][:-3].split("/")[-1])
-                for path in glob("./lib/cogs/*.py")
-            ]:
-                if cog not in ["Cogs", "ErrorHandler"]:
-                    self.disabled_cogs.append(cog)
-        else:
-            self.disabled_cogs.extend(["Template"] + Config.fetch()["DISABLED_COGS"])
 
     async def cog_load(self):
         self.logger.info(f"[COG] Loaded {self.__class__.__name__}")
 
+    @staticmethod
+    def discover_cogs() -> list[str]:
+        """Names of every cog module in lib/cogs."""
+        return sorted(path.stem for path in COGS_DIRECTORY.glob("*.py"))
+
+    @staticmethod
+    def get_disabled_cogs(is_dev: bool) -> list[str]:
+        """Names of the cogs that are not loaded at startup."""
+        if is_dev:
+            return [cog for cog in Cogs.discover_cogs() if cog not in ["Cogs", "ErrorHandler"]]
+        return ["Template"] + Config.fetch()["DISABLED_COGS"]
+
+    @staticmethod
+    def get_enabled_cogs(is_dev: bool) -> set[str]:
+        return set(Cogs.discover_cogs()) - set(Cogs.get_disabled_cogs(is_dev))
+
+    @staticmethod
+    def resolve_load_order(
+        cogs: list[str], dependencies: dict[str, list[str]], loaded: set[str]
+    ) -> tuple[list[list[str]], dict[str, str]]:
+        """Group cogs into layers that can be loaded concurrently, each depending only on earlier layers or on
+        already loaded cogs. Returns the layers, and the cogs that cannot be loaded with the reason why."""
+        pending = {cog: set(dependencies.get(cog, [])) - loaded for cog in cogs}
+        skipped = {}
+
+        # Drop cogs that depend on something that will never be loaded, and anything depending on those
+        changed = True
+        while changed:
+            changed = False
+            for cog, deps in list(pending.items()):
+                missing = [dep for dep in deps if dep not in pending]
+                if missing:
+                    skipped[cog] = f"missing dependencies {', '.join(sorted(missing))}"
+                    del pending[cog]
+                    changed = True
+
+        layers = []
+        while pending:
+            layer = sorted(cog for cog, deps in pending.items() if not deps)
+            if not layer:
+                # Everything left depends on itself through a cycle
+                for cog in pending:
+                    skipped[cog] = f"dependency cycle between {', '.join(sorted(pending))}"
+                break
+
+            layers.append(layer)
+            for cog in layer:
+                del pending[cog]
+            for deps in pending.values():
+                deps.difference_update(layer)
+
+        return layers, skipped
+
     async def fetch_cogs(self):
-        for cog in [
-            (path.split("\\")[-1][:-3] if os.name == "nt" else path.split("\\")[-1][:-3].split("/")[-1])
-            for path in glob("./lib/cogs/*.py")
-        ]:
+        for cog in Cogs.discover_cogs():
             if cog != "Cogs" and cog not in self.disabled_cogs:
                 self.unloaded_cogs.append(cog)
 
@@ -63,20 +109,48 @@ class Cogs(commands.Cog):
             traceback.print_exc()
             raise e
 
+    async def load_cog_timed(self, cog):
+        """Load a cog at startup, logging how long importing it and setting it up took. The import runs in a
+        thread, so cogs in the same layer import their dependencies concurrently."""
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(importlib.import_module, f"lib.cogs.{cog}")
+        except Exception as e:
+            self.logger.error(f"[COG] {cog} failed to import. {e}")
+            traceback.print_exc()
+            raise e
+        imported = time.perf_counter()
+        # load_extension executes the cog's module again, but its dependencies are already imported by then, so what
+        # it takes is almost all setup
+        await self.load_cog(cog)
+        self.unloaded_cogs.remove(cog)
+        self.logger.info(
+            "[COG] %s imported in %.0fms, set up in %.0fms",
+            cog,
+            (imported - started) * 1000,
+            (time.perf_counter() - imported) * 1000,
+        )
+
     async def load_cogs(self):
         if not self.unloaded_cogs:
             await self.fetch_cogs()
         [self.logger.warn(f"[COG] Skipping {cog} because it is disabled.") for cog in self.disabled_cogs]
-        while self.unloaded_cogs:
-            cog = self.unloaded_cogs.pop(0)
-            if cog in Config.fetch()["DEPENDENCIES"]:
-                if all([dependency in self.bot.cogs for dependency in Config.fetch()["DEPENDENCIES"][cog]]):
-                    await self.load_cog(cog)
-                else:
-                    self.logger.warning(f"[COG] Deferring {cog}")
-                    self.unloaded_cogs.append(cog)
-            else:
-                await self.load_cog(cog)
+
+        layers, skipped = Cogs.resolve_load_order(
+            self.unloaded_cogs, Config.fetch().get("DEPENDENCIES") or {}, set(self.bot.cogs)
+        )
+        for cog, reason in skipped.items():
+            self.logger.error(f"[COG] Skipping {cog} because of {reason}.")
+
+        started = time.perf_counter()
+        for layer in layers:
+            results = await asyncio.gather(*(self.load_cog_timed(cog) for cog in layer), return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        self.logger.info(
+            "[COG] Loaded %s cogs in %.0fms", sum(map(len, layers)), (time.perf_counter() - started) * 1000
+        )
 
     CogGroup = app_commands.Group(name="cog", description="Manages MOCBOT cogs.")
 
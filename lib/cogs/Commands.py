@@ -1,11 +1,13 @@
 from discord.ext import commands
 from discord.ui import Button, View
 from discord import app_commands
+from datetime import timedelta
 from typing import Literal, Optional
 
+from utils.Purge import PurgeEngine
+
 import discord
 import logging
-import asyncio
 
 
 class ConfirmButtons(View):
@@ -68,22 +70,19 @@ class Commands(commands.Cog):
     @app_commands.command(name="purge", description="Remove content from a channel.")
     @app_commands.checks.has_permissions(manage_messages=True)
     @app_commands.describe(
-        quantity="The amount of messages to purge. Limited to 100.",
+        quantity="The amount of messages to purge. Limited to 1000.",
         user="The user to purge. Omit for channel purging.",
+        within_days="Only purge messages sent within this many days.",
     )
     async def purge(
         self,
         interaction: discord.Interaction,
-        quantity: app_commands.Range[int, 1, 100],
+        quantity: app_commands.Range[int, 1, 1000],
         user: Optional[discord.User],
+        within_days: Optional[app_commands.Range[int, 1, 365]] = None,
     ):
         await interaction.response.defer(ephemeral=True, thinking=True)
 
-        async def delete_older_messages(messages):
-            for msg in messages:
-                await msg.delete()
-                await asyncio.sleep(0.75)
-
         async def convert(seconds):
             minutes = (seconds % 3600) // 60
             seconds %= 60
@@ -94,25 +93,29 @@ class Commands(commands.Cog):
                 return_str += f"{int(seconds)}s"
             return return_str
 
-        to_purge = []
-        async for x in interaction.channel.history(limit=None):
-            if user and x.author == user:
-                to_purge.append(x)
-            elif not user:
-                to_purge.append(x)
-            if len(to_purge) == quantity:
-                break
+        async def report_progress(deleted, total):
+            await interaction.edit_original_response(
+                content=f"Deleting messages... **{deleted}**/**{total}**", embed=None, view=None
+            )
 
-        older_messages = [msg for msg in to_purge if (discord.utils.utcnow() - msg.created_at).days >= 14]
-        recent_messages = [msg for msg in to_purge if (discord.utils.utcnow() - msg.created_at).days < 14]
+        engine = PurgeEngine(
+            interaction.channel,
+            quantity,
+            user=user,
+            after=discord.utils.utcnow() - timedelta(days=within_days) if within_days else None,
+            progress=report_progress,
+            scheduler=self.bot.rest,
+        )
+        await engine.collect()
 
-        if older_messages:
+        if engine.older_messages:
             view = ConfirmButtons()
             await interaction.followup.send(
                 embed=self.bot.create_embed(
                     "MOCBOT PURGE",
-                    f"**{len(older_messages)}** message(s) over 14 days old were found. This will take roughly"
-                    f" {await convert(0.75 * len(older_messages))} to delete. Are you sure you'd like to continue?",
+                    f"**{len(engine.older_messages)}** message(s) over 14 days old were found. This will take roughly"
+                    f" {await convert(engine.estimate_seconds()) or '1s'} to delete. Are you sure you'd like to "
+                    "continue?",
                     0xFFA500,
                 ),
                 ephemeral=True,
@@ -120,22 +123,14 @@ class Commands(commands.Cog):
             )
             view.message = await interaction.original_response()
             await view.wait()
-            if view.confirmed:
-                await delete_older_messages(older_messages)
-                await interaction.channel.delete_messages(
-                    recent_messages,
-                    reason=f"{interaction.user} purged messages",
-                )
-                await interaction.followup.send(
-                    f"**{len(to_purge)}** messages deleted. Channel purge complete.",
-                    ephemeral=True,
-                )
-        else:
-            await interaction.channel.delete_messages(recent_messages, reason=f"{interaction.user} purged messages")
-            await interaction.followup.send(
-                f"**{len(to_purge)}** messages deleted. Channel purge complete.",
-                ephemeral=True,
-            )
+            if not view.confirmed:
+                return
+
+        deleted = await engine.delete(reason=f"{interaction.user} purged messages")
+        summary = f"**{deleted}** messages deleted. Channel purge complete."
+        if engine.scan_limit_reached:
+            summary += f" Only the latest {engine.max_scan} messages were searched."
+        await interaction.followup.send(summary, ephemeral=True)
 
     @app_commands.command(name="setup", description="Configure MOCBOT server settings.")
     async def setup(self, interaction: discord.Interaction):
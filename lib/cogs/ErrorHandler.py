@@ -1,9 +1,13 @@
 from discord.ext import commands
+from utils.Metrics import metrics
 import logging
 
 import traceback
 
 
+COMMAND_ERRORS = metrics.counter("mocbot_command_errors_total", "Commands that raised an unhandled error", ["command"])
+
+
 class ErrorHandler(commands.Cog):
 
     def __init__(self, bot):
@@ -16,6 +20,7 @@ class ErrorHandler(commands.Cog):
         self.logger.info(f"[COG] Loaded {self.__class__.__name__}")
 
     async def on_app_command_error(self, interaction, error):
+        COMMAND_ERRORS.inc(command=interaction.command.qualified_name if interaction.command else "unknown")
         embed = self.bot.create_embed("MOCBOT ERROR", "An unexpected error has occurred.", 0xFF0000)
         embed.add_field(
             name="ERROR:",
@@ -2,13 +2,15 @@ from discord.ext import commands, tasks
 from discord.ui import View
 from discord import app_commands, File, Object, Status
 from utils.APIHandler import API
+from utils.APIModels import GuildSettings, XPRow
+from utils.Cache import Cache
+from utils.RestScheduler import Priority
+from lib.levels.LevelRoles import LevelRoleTable, level_roles
 from requests.exceptions import HTTPError
-from expiringdict import ExpiringDict
 
 import discord
 import logging
 
-from PIL import Image, ImageDraw, ImageFont
 import requests
 import asyncio
 from io import BytesIO
@@ -27,7 +29,9 @@ class Levels(commands.Cog):
         self.messages_xp = 4
         self.voice_xp_rate = 48  # per hour
         self.logger = logging.getLogger(__name__)
-        self.cache = ExpiringDict(max_len=1000, max_age_seconds=60)
+        # Remembers members with no XP. Not served stale, as add_xp writes back the cached XP plus what was gained,
+        # which would overwrite changes made elsewhere since it was loaded, e.g. by the website
+        self.cache = Cache("xp", maxsize=1000, ttl=60, negative_ttl=60)
 
     async def cog_load(self):
         self.logger.info(f"[COG] Loaded {self.__class__.__name__}")
@@ -49,55 +53,54 @@ class Levels(commands.Cog):
     async def xp_away(self, member):
         data = await self.get_xp_data(member)
         if data is not None:
-            required_xp = 6 * ((data.get("Level", None) + 1)) ** 2 + 94
-            xp_difference = required_xp - data.get("XP", None)
+            required_xp = 6 * ((data.level + 1)) ** 2 + 94
+            xp_difference = required_xp - data.xp
             return xp_difference
 
-    async def get_xp_data(self, member):
-        data = self.cache.get(f"{member.guild.id}/{member.id}")
-        if data:
-            return data
+    async def get_xp_data(self, member) -> Optional[XPRow]:
+        return await self.cache.get_or_load(
+            f"{member.guild.id}/{member.id}", lambda: asyncio.to_thread(self.fetch_xp_data, member)
+        )
+
+    @staticmethod
+    def fetch_xp_data(member) -> Optional[XPRow]:
         try:
-            data = API.get(f"/xp/{member.guild.id}/{member.id}")
+            return API.get(f"/xp/{member.guild.id}/{member.id}", model=XPRow)
         except HTTPError as e:
             if e.response.status_code == 404:
                 return None
             else:
                 raise e
-        else:
-            self.update_xp_cache(member, data)
-            return data
 
-    def update_xp_data(self, member, data, route):
+    def update_xp_data(self, member, data, route) -> XPRow:
         if route == "PATCH":
-            res = API.patch(f"/xp/{member.guild.id}/{member.id}", data)
+            res = API.patch(f"/xp/{member.guild.id}/{member.id}", data, model=XPRow)
         elif route == "POST":
-            res = API.post(f"/xp/{member.guild.id}/{member.id}", data)
+            res = API.post(f"/xp/{member.guild.id}/{member.id}", data, model=XPRow)
         self.update_xp_cache(member, res)
         return res
 
-    def update_xp_cache(self, member, data):
-        self.cache[f"{member.guild.id}/{member.id}"] = {
-            k: v for k, v in data.items() if k not in ["guild_id", "user_id"]
-        }
+    def update_xp_cache(self, member, data: Optional[XPRow]):
+        self.cache.set(f"{member.guild.id}/{member.id}", data)
 
     def delete_xp_data(self, member):
         API.delete(f"/xp/{member.guild.id}/{member.id}")
-        del self.cache[f"{member.guild.id}/{member.id}"]
+        self.update_xp_cache(member, None)
 
     async def get_rank(self, member):
-        guild_xp = API.get(f"/xp/{member.guild.id}")
+        guild_xp = API.get(f"/xp/{member.guild.id}", model=XPRow)
         if not guild_xp:
             return None
-        guild_xp.sort(key=lambda user: int(user["XP"]), reverse=True)
+        guild_xp.sort(key=lambda user: user.xp, reverse=True)
+        await self.bot.ensure_chunked(member.guild)
         guild_member_ids = list(map(lambda member: member.id, member.guild.members))
-        return [id for id in map(lambda user: int(user["UserID"]), guild_xp) if id in guild_member_ids].index(
+        return [id for id in map(lambda user: user.user_id, guild_xp) if id in guild_member_ids].index(
             member.id
         ) + 1
 
     async def add_xp(self, member, newData: object, oldData=None):
         data = oldData or await self.get_xp_data(member)
-        xp = data.get("XP", None) if data is not None else None
+        xp = data.xp if data is not None else None
         new_xp = newData.get("XP", None)
         if xp is not None:
             if max(xp + new_xp, 0) != 0:
@@ -118,7 +121,7 @@ class Levels(commands.Cog):
     async def set_xp(self, member, value: int):
         if value > 0:
             data = await self.get_xp_data(member)
-            current_xp = data.get("XP") if data is not None else 0
+            current_xp = data.xp if data is not None else 0
             await self.add_xp(member, {"XP": value - current_xp}, data)
         else:
             self.delete_xp_data(member)
@@ -126,7 +129,7 @@ class Levels(commands.Cog):
 
     async def message_xp(self, message):
         res = await self.get_xp_data(message.author)
-        xp_lock = res.get("XPLock", None) if res is not None else None
+        xp_lock = res.xp_lock if res is not None else None
         if xp_lock:
             if datetime.datetime.now() > datetime.datetime.fromtimestamp(xp_lock):
                 newData = {
@@ -134,9 +137,13 @@ class Levels(commands.Cog):
                     "XPLock": (datetime.datetime.now() + datetime.timedelta(seconds=60)).timestamp(),
                 }
                 if await self.add_xp(message.author, newData, res) and self.check_level_up_perms(message.guild.id):
-                    await message.channel.send(
-                        message.author.mention,
-                        file=await self.generate_level_up_card(message.author),
+                    card = await self.generate_level_up_card(message.author)
+                    self.bot.rest.schedule(
+                        Priority.BACKGROUND,
+                        lambda: message.channel.send(message.author.mention, file=card),
+                        bucket=("channel", message.channel.id),
+                        # Unlike other background work, a level up is not repeated later, so is never dropped
+                        sheddable=False,
                     )
         else:
             await self.add_xp(
@@ -151,14 +158,14 @@ class Levels(commands.Cog):
             await self.message_xp(message)
 
     def check_level_up_perms(self, guild_id):
-        data = API.get(f"/settings/{guild_id}")
-        return bool(int(data.get("XPLevelUpMessage", None))) if data is not None else False
+        data = API.get(f"/settings/{guild_id}", model=GuildSettings)
+        return data.xp_level_up_message if data is not None else False
 
     async def level_integrity(self, old_data=None, member=None):
         data = old_data or await self.get_xp_data(member)
         if member and data is not None:
-            correct_level = await self.calculate_correct_level(data.get("XP", None))
-            current_level = data.get("Level", None)
+            correct_level = await self.calculate_correct_level(data.xp)
+            current_level = data.level
             if current_level != correct_level:
                 self.update_xp_data(member, {"Level": correct_level}, "PATCH")
                 if current_level < correct_level:
@@ -166,34 +173,37 @@ class Levels(commands.Cog):
 
     async def update_roles(self, member=None, data=None):
         xp_data = data or await self.get_xp_data(member)
-        member_level = xp_data.get("Level", None) if xp_data is not None else 0
+        member_level = xp_data.level if xp_data is not None else 0
         if member:
-            res = API.get(f"/roles/{member.guild.id}")
-            role_map = res.get("LevelRoles", None) if res is not None else None
-            if role_map is not None:
-                role_map = {int(k): int(v) for k, v in role_map.items()}
-                member_roles = member.roles
-                low_difference = [
-                    role_map[x]
-                    for x in role_map
-                    if role_map[x] not in [role.id for role in member_roles] and x <= member_level
-                ]
-                high_difference = [
-                    role.id
-                    for role in member_roles
-                    if role.id in {value: key for key, value in role_map.items()}
-                    and {value: key for key, value in role_map.items()}[role.id] > member_level
-                ]
-                if low_difference:
-                    for x in low_difference:
-                        await member.add_roles(Object(id=int(x)), reason="Role Adjustment")
-                if high_difference:
-                    for x in high_difference:
-                        await member.remove_roles(Object(id=int(x)), reason="Role Adjustment")
+            table = await level_roles.get(member.guild.id)
+            if table.all_role_ids and table.reconcile({role.id for role in member.roles[1:]}, member_level):
+                # A newer adjustment for the member replaces one still queued
+                self.bot.rest.schedule(
+                    Priority.BACKGROUND,
+                    lambda: self.reconcile_roles(member, table, member_level),
+                    bucket=("member", member.guild.id, member.id),
+                    key=("level_roles", member.guild.id, member.id),
+                )
+
+    async def reconcile_roles(self, member, table: LevelRoleTable, level: int):
+        """Give a member the level roles for their level, and remove the others."""
+        # Diffed against the member's roles when sent, as they may have changed while queued. Roles are added and
+        # removed one by one rather than set as a whole, which would undo changes to them not seen yet
+        changes = table.reconcile({role.id for role in member.roles[1:]}, level)
+        if changes is None:
+            return
+        add, remove = changes
+        if remove:
+            await member.remove_roles(*(Object(id=role_id) for role_id in remove), reason="Role Adjustment")
+        if add:
+            await member.add_roles(*(Object(id=role_id) for role_id in add), reason="Role Adjustment")
 
     async def generate_level_up_card(self, member):
+        # Pillow is only needed for cards, so it is imported on first use to keep startup fast
+        from PIL import Image, ImageDraw, ImageFont
+
         data = await self.get_xp_data(member)
-        level = data.get("Level", None)
+        level = data.level
 
         template = Image.open("./assets/levels/template.jpg")
         raw_avatar = requests.get(member.display_avatar.url, stream=True)
@@ -237,6 +247,8 @@ class Levels(commands.Cog):
         return File(tempFile, "level_up.png")
 
     async def generate_rank_card(self, member):
+        from PIL import Image, ImageDraw, ImageFont
+
         XP_DATA = await self.get_xp_data(member)
 
         template = Image.open("./assets/levels/template.jpg")
@@ -260,8 +272,8 @@ class Levels(commands.Cog):
         )
 
         if XP_DATA:
-            user_level = XP_DATA["Level"]
-            user_xp = XP_DATA["XP"]
+            user_level = XP_DATA.level
+            user_xp = XP_DATA.xp
             user_rank = await self.get_rank(member)
             if user_level != 0:
                 difference = await Levels.get_required_xp(user_level + 1) - await Levels.get_required_xp(user_level)
@@ -350,6 +362,8 @@ class Levels(commands.Cog):
                     if not member.bot and not (member.voice.self_mute or member.voice.self_deaf)
                 ]
                 if len(real_members) >= 2:
+                    # Statuses of voice members are only known once the guild's members are loaded
+                    await self.bot.ensure_chunked(guild)
                     if len(real_members) > 2:
                         local_multiplier = 0.125 * (len(real_members) - 2)
                     else:
@@ -363,7 +377,7 @@ class Levels(commands.Cog):
                             data = await self.get_xp_data(member)
                             if data is not None:
                                 if datetime.datetime.now() > datetime.datetime.fromtimestamp(
-                                    data.get("VoiceChannelXPLock", None)
+                                    data.voice_channel_xp_lock or 0
                                 ):
                                     await self.add_xp(
                                         member,
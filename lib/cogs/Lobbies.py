@@ -1,4 +1,4 @@
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.ui import Button, View, Modal, TextInput
 from discord import (
     app_commands,
@@ -6,22 +6,23 @@ from discord import (
     PermissionOverwrite,
     Status,
 )
-from requests.exceptions import HTTPError
+from requests.exceptions import RequestException
 
 from utils.APIHandler import API
+from utils.RestScheduler import Priority
+from lib.lobbies.LobbyRegistry import MemberLobby, lobby_registry
+from utils.APIModels import Lobby
 import discord
 import logging
 import asyncio
 
 
 class LobbyPrompt(View):
-    def __init__(self, *, timeout=180, interaction: discord.Interaction):
+    def __init__(self, *, timeout=180, interaction: discord.Interaction, lobby_category_id: int):
         super().__init__(timeout=timeout)
-        settings = API.get(f"/settings/{interaction.guild.id}")
-        self.lobby_category = interaction.guild.get_channel(
-            int(settings.get("LobbyCategory") if settings is not None else None)
-        )
+        self.lobby_category = interaction.guild.get_channel(lobby_category_id)
         self.interaction = interaction
+        self.member_lobby: MemberLobby | None = None
         self.updateOptions()
 
     async def on_timeout(self) -> None:
@@ -31,27 +32,36 @@ class LobbyPrompt(View):
         return interaction.user and interaction.user.id == self.interaction.user.id
 
     def getEmbed(self):
-        lobby_data = LobbyPrompt.get_lobby_details(self.interaction.user)
-        if LobbyPrompt.is_lobby_leader(self.interaction.user, lobby_data):
-            lobby_users = API.get(f"/lobby/{self.interaction.guild.id}/{self.interaction.user.id}/users")
+        member_lobby = self.member_lobby
+        if member_lobby is not None and member_lobby.is_leader:
+            lobby_data = member_lobby.lobby
+            lobby_users = [
+                member for member in map(self.interaction.guild.get_member, member_lobby.members) if member is not None
+            ]
             if lobby_users:
                 embed = self.interaction.client.create_embed(
                     "MOCBOT LOBBIES",
-                    f"It appears you are the lobby leader for **{lobby_data.get('LobbyName')}**",
+                    f"It appears you are the lobby leader for **{lobby_data.lobby_name}**",
                     None,
                 )
                 embed.add_field(
                     name="MEMBERS:",
-                    value="\n".join([self.interaction.guild.get_member(int(x)).mention for x in lobby_users]),
+                    value="\n".join([member.mention for member in lobby_users]),
                     inline=True,
                 )
             else:
                 embed = self.interaction.client.create_embed(
                     "MOCBOT LOBBIES",
-                    f"It appears you are the lobby leader for **{lobby_data.get('LobbyName')}**\nYour lobby is "
+                    f"It appears you are the lobby leader for **{lobby_data.lobby_name}**\nYour lobby is "
                     "currently empty. Invite people with the button below.",
                     None,
                 )
+        elif member_lobby is not None:
+            embed = self.interaction.client.create_embed(
+                "MOCBOT LOBBIES",
+                f"It appears you a member of **{member_lobby.lobby.lobby_name}**",
+                None,
+            )
         else:
             embed = self.interaction.client.create_embed(
                 "MOCBOT LOBBIES",
@@ -63,23 +73,24 @@ class LobbyPrompt(View):
 
     async def invite_user(self, member, lobby_data, lobby_users):
         await member.add_roles(
-            member.guild.get_role(lobby_data.get("RoleID")),
-            reason=f"{member} added to {lobby_data.get('LobbyName')}",
+            member.guild.get_role(lobby_data.role_id),
+            reason=f"{member} added to {lobby_data.lobby_name}",
         )
         embed = self.interaction.client.create_embed(
             "MOCBOT LOBBIES",
-            f"You have been invited to join **{lobby_data.get('LobbyName')}**",
+            f"You have been invited to join **{lobby_data.lobby_name}**",
             None,
         )
         embed.add_field(
             name="LEADER:",
-            value=f'{member.guild.get_member(lobby_data.get("LeaderID")).mention}',
+            value=f'{member.guild.get_member(lobby_data.leader_id).mention}',
             inline=True,
         )
+        lobby_users = [user for user in map(member.guild.get_member, lobby_users) if user is not None]
         if lobby_users:
             embed.add_field(
                 name="CURRENT USERS:",
-                value="\n".join([member.guild.get_member(int(x)).mention for x in lobby_users]),
+                value="\n".join([user.mention for user in lobby_users]),
                 inline=True,
             )
         await member.send(
@@ -89,8 +100,8 @@ class LobbyPrompt(View):
                     label="Join lobby",
                     style=discord.ButtonStyle.link,
                     url=str(
-                        await member.guild.get_channel(lobby_data.get("VoiceChannelID")).create_invite(
-                            reason=f"{member} invited to {lobby_data.get('LobbyName')}"
+                        await member.guild.get_channel(lobby_data.voice_channel_id).create_invite(
+                            reason=f"{member} invited to {lobby_data.lobby_name}"
                         )
                     ),
                 )
@@ -99,17 +110,18 @@ class LobbyPrompt(View):
 
     async def remove_user(self, member, lobby_data):
         await member.remove_roles(
-            member.guild.get_role(lobby_data.get("RoleID")),
-            reason=f"{member} kicked from {lobby_data.get('LobbyName')}",
+            member.guild.get_role(lobby_data.role_id),
+            reason=f"{member} kicked from {lobby_data.lobby_name}",
         )
         await member.send(
             embed=self.interaction.client.create_embed(
                 "MOCBOT LOBBIES",
-                f"You have been kicked from **{lobby_data.get('LobbyName')}**",
+                f"You have been kicked from **{lobby_data.lobby_name}**",
                 None,
             )
         )
-        API.delete(f'/lobby/{member.guild.id}/{lobby_data.get("LeaderID")}/{member.id}')
+        API.delete(f'/lobby/{member.guild.id}/{lobby_data.leader_id}/{member.id}')
+        lobby_registry.remove_member(member.guild.id, lobby_data.leader_id, member.id)
 
     async def create_lobby(self, name, leader):
         lobby_role = await leader.guild.create_role(name=name, reason=f"{leader} created a lobby.")
@@ -145,23 +157,35 @@ class LobbyPrompt(View):
                 "InviteOnly": False,
             },
         )
+        lobby_registry.add(
+            leader.guild.id,
+            Lobby(
+                leader_id=leader.id,
+                voice_channel_id=voice_channel.id,
+                text_channel_id=text_channel.id,
+                role_id=lobby_role.id,
+                lobby_name=name,
+            ),
+            members=[],
+        )
 
     async def delete_lobby(self, leader):
-        lobby_details = LobbyPrompt.get_lobby_details(leader)
-        await self.interaction.client.get_channel(lobby_details.get("VoiceChannelID")).delete(
-            reason=f"{leader} deleted {lobby_details.get('LobbyName')}"
+        lobby_details = lobby_registry.get(leader.guild.id, leader.id)
+        await self.interaction.client.get_channel(lobby_details.voice_channel_id).delete(
+            reason=f"{leader} deleted {lobby_details.lobby_name}"
         )
-        await self.interaction.client.get_channel(lobby_details.get("TextChannelID")).delete(
-            reason=f"{leader} deleted {lobby_details.get('LobbyName')}"
+        await self.interaction.client.get_channel(lobby_details.text_channel_id).delete(
+            reason=f"{leader} deleted {lobby_details.lobby_name}"
         )
-        await leader.guild.get_role(lobby_details.get("RoleID")).delete(
-            reason=f"{leader} deleted {lobby_details.get('LobbyName')}"
+        await leader.guild.get_role(lobby_details.role_id).delete(
+            reason=f"{leader} deleted {lobby_details.lobby_name}"
         )
         API.delete(f"/lobby/{leader.guild.id}/{leader.id}")
+        lobby_registry.remove(leader.guild.id, leader.id)
 
     async def rename_lobby(self, leader, new_name):
-        lobby_details = LobbyPrompt.get_lobby_details(leader)
-        lobby_role = leader.guild.get_role(lobby_details.get("RoleID"))
+        lobby_details = lobby_registry.get(leader.guild.id, leader.id)
+        lobby_role = leader.guild.get_role(lobby_details.role_id)
         vc_perms = {
             lobby_role: PermissionOverwrite(speak=True, connect=True, view_channel=True),
             leader.guild.default_role: PermissionOverwrite(view_channel=True, connect=False),
@@ -170,104 +194,92 @@ class LobbyPrompt(View):
             lobby_role: PermissionOverwrite(read_messages=True, send_messages=True),
             leader.guild.default_role: PermissionOverwrite(read_messages=False),
         }
-        await self.interaction.client.get_channel(lobby_details.get("VoiceChannelID")).edit(
+        await self.interaction.client.get_channel(lobby_details.voice_channel_id).edit(
             name=new_name,
             overwrites=vc_perms,
-            reason=f"{leader} renamed {lobby_details.get('LobbyName')} to {new_name}",
+            reason=f"{leader} renamed {lobby_details.lobby_name} to {new_name}",
         )
-        await self.interaction.client.get_channel(lobby_details.get("TextChannelID")).edit(
+        await self.interaction.client.get_channel(lobby_details.text_channel_id).edit(
             name=new_name,
             overwrites=text_perms,
-            reason=f"{leader} renamed {lobby_details.get('LobbyName')} to {new_name}",
+            reason=f"{leader} renamed {lobby_details.lobby_name} to {new_name}",
         )
-        await leader.guild.get_role(lobby_details.get("RoleID")).edit(
+        await leader.guild.get_role(lobby_details.role_id).edit(
             name=new_name,
-            reason=f"{leader} renamed {lobby_details.get('LobbyName')} to {new_name}",
+            reason=f"{leader} renamed {lobby_details.lobby_name} to {new_name}",
         )
         API.patch(f"/lobby/{leader.guild.id}/{leader.id}", {"LobbyName": new_name})
+        lobby_registry.update(leader.guild.id, leader.id, lobby_name=new_name)
 
     async def transfer_lobby(self, new_leader, lobby_details):
         await new_leader.add_roles(
-            new_leader.guild.get_role(lobby_details.get("RoleID")),
-            reason=f"{new_leader} became leader of {lobby_details.get('LobbyName')}",
-        )
-        route = f'/lobby/{new_leader.guild.id}/{lobby_details.get("LeaderID")}/users'
-        lobby_users = API.get(f'/lobby/{self.interaction.guild.id}/{lobby_details.get("LeaderID")}/users')
-        if LobbyPrompt.is_lobby_user(new_leader, lobby_details, lobby_users):
-            API.delete(f'/lobby/{new_leader.guild.id}/{lobby_details.get("LeaderID")}/{new_leader.id}')
-        API.post(route, [str(lobby_details.get("LeaderID"))])
+            new_leader.guild.get_role(lobby_details.role_id),
+            reason=f"{new_leader} became leader of {lobby_details.lobby_name}",
+        )
+        route = f'/lobby/{new_leader.guild.id}/{lobby_details.leader_id}/users'
+        lobby_users = lobby_registry.get_members(new_leader.guild.id, lobby_details.leader_id)
+        if new_leader.id in lobby_users:
+            API.delete(f'/lobby/{new_leader.guild.id}/{lobby_details.leader_id}/{new_leader.id}')
+        API.post(route, [str(lobby_details.leader_id)])
         API.patch(
-            f'/lobby/{new_leader.guild.id}/{lobby_details.get("LeaderID")}',
+            f'/lobby/{new_leader.guild.id}/{lobby_details.leader_id}',
             {"LeaderID": str(new_leader.id)},
         )
+        lobby_registry.update(new_leader.guild.id, lobby_details.leader_id, leader_id=new_leader.id)
 
     async def setInviteOnly(self, member, value):
-        lobby_details = LobbyPrompt.get_lobby_details(member)
-        lobby_channel = self.interaction.client.get_channel(lobby_details.get("VoiceChannelID"))
+        lobby_details = lobby_registry.get(member.guild.id, member.id)
+        lobby_channel = self.interaction.client.get_channel(lobby_details.voice_channel_id)
         API.patch(f"/lobby/{member.guild.id}/{member.id}", {"InviteOnly": value})
+        lobby_registry.update(member.guild.id, member.id, invite_only=bool(value))
         if value:
             overwrites = {
-                member.guild.get_role(lobby_details.get("RoleID")): PermissionOverwrite(
+                member.guild.get_role(lobby_details.role_id): PermissionOverwrite(
                     speak=True, connect=True, view_channel=True
                 ),
                 member.guild.default_role: PermissionOverwrite(connect=False, view_channel=False),
             }
         else:
             overwrites = {
-                member.guild.get_role(lobby_details.get("RoleID")): PermissionOverwrite(
+                member.guild.get_role(lobby_details.role_id): PermissionOverwrite(
                     speak=True, connect=True, view_channel=True
                 ),
                 member.guild.default_role: PermissionOverwrite(connect=False, view_channel=True),
             }
         await lobby_channel.edit(overwrites=overwrites)
 
-    def is_lobby_hidden(self, member):
-        lobby_data = API.get(f"/lobby/{member.guild.id}/{member.id}")
-        return lobby_data.get("InviteOnly") == 1
+    def is_lobby_hidden(self):
+        return self.member_lobby is not None and self.member_lobby.invite_only
 
     def is_lobby_leader(member, data=None):
         lobby_data = data or LobbyPrompt.get_lobby_details(member)
-        return bool(lobby_data.get("LeaderID") == member.id)
+        return lobby_data is not None and lobby_data.leader_id == member.id
 
     def is_lobby_user(member, lobby_details, lobby_users=None):
         lobby_users = (
             lobby_users
             if lobby_users is not None
-            else API.get(f'/lobby/{member.guild.id}/{lobby_details.get("LeaderID")}/users')
+            else lobby_registry.get_members(member.guild.id, lobby_details.leader_id)
         )
-        return str(member.id) in lobby_users
+        return member.id in lobby_users
 
     def get_lobby_details(member):
-        data = None
-        try:
-            data = API.get(f"/lobby/{member.guild.id}/{member.id}")
-        except HTTPError as e:
-            if e.response.status_code == 404:
-                try:
-                    data = API.get(f"/lobbies/{member.guild.id}/{member.id}")
-                except HTTPError as e:
-                    if e.response.status_code == 404:
-                        pass
-                    else:
-                        raise e
-                return {} if data is None else data
-        else:
-            return data
+        member_lobby = lobby_registry.resolve(member)
+        return member_lobby.lobby if member_lobby is not None else None
 
     async def updateView(self, embed=None):
         await self.interaction.edit_original_response(embed=embed or self.getEmbed(), view=self)
 
     def updateOptions(self):
         self.clear_items()
-        lobby_data = LobbyPrompt.get_lobby_details(self.interaction.user)
+        self.member_lobby = lobby_registry.resolve(self.interaction.user)
 
-        if lobby_data != {}:
-            if LobbyPrompt.is_lobby_leader(self.interaction.user, lobby_data):
-                self.lobby_leader_prompt()
-            elif LobbyPrompt.is_lobby_user(self.interaction.user, lobby_data):
-                self.lobby_user_prompt()
-        else:
+        if self.member_lobby is None:
             self.new_lobby_prompt()
+        elif self.member_lobby.is_leader:
+            self.lobby_leader_prompt()
+        else:
+            self.lobby_user_prompt()
 
     def new_lobby_prompt(self):
         create_button = Button(label="Create Lobby", style=discord.ButtonStyle.green, row=1)
@@ -306,7 +318,7 @@ class LobbyPrompt(View):
         kick_button.callback = self.kick_button_callback
         self.add_item(kick_button)
 
-        if self.is_lobby_hidden(self.interaction.user):
+        if self.is_lobby_hidden():
             show_button = Button(
                 label="Show Lobby",
                 style=discord.ButtonStyle.grey,
@@ -348,7 +360,7 @@ class LobbyPrompt(View):
 
     async def check_lobby_exists(self, interaction):
         lobby_details = LobbyPrompt.get_lobby_details(interaction.user)
-        if lobby_details == {}:
+        if lobby_details is None:
             await self.delete_prompt()
             await interaction.response.send_message(
                 embed=self.interaction.client.create_embed(
@@ -374,14 +386,14 @@ class LobbyPrompt(View):
 
     async def leave_button_callback(self, interaction: discord.Interaction):
         lobby_details = await self.check_lobby_exists(interaction)
-        if lobby_details == {}:
+        if lobby_details is None:
             return
         await self.remove_user(interaction.user, lobby_details)
         await self.delete_prompt()
         await interaction.response.send_message(
             embed=self.interaction.client.create_embed(
                 "MOCBOT LOBBIES",
-                f"You have successfully left {lobby_details.get('LobbyName')}",
+                f"You have successfully left {lobby_details.lobby_name}",
                 None,
             ),
             ephemeral=True,
@@ -389,7 +401,7 @@ class LobbyPrompt(View):
 
     async def invite_button_callback(self, interaction: discord.Interaction):
         lobby_details = await self.check_lobby_exists(interaction)
-        if lobby_details == {}:
+        if lobby_details is None:
             return
         await interaction.response.send_message(
             embed=self.interaction.client.create_embed(
@@ -410,12 +422,12 @@ class LobbyPrompt(View):
         else:
             await msg.delete()
             await prompt.delete()
-            lobby_users = API.get(f'/lobby/{self.interaction.guild.id}/{lobby_details.get("LeaderID")}/users')
+            lobby_users = lobby_registry.get_members(self.interaction.guild.id, lobby_details.leader_id)
             members_to_add = []
             await self.updateView(
                 self.interaction.client.create_embed(
                     "MOCBOT LOBBIES",
-                    f"It appears you are the lobby leader for **{lobby_details.get('LobbyName')}**.\n\n **MEMBERS:**\n"
+                    f"It appears you are the lobby leader for **{lobby_details.lobby_name}**.\n\n **MEMBERS:**\n"
                     "Inviting Users...",
                     None,
                 )
@@ -432,14 +444,18 @@ class LobbyPrompt(View):
                         members_to_add.append(str(member.id))
             if len(members_to_add) != 0:
                 API.post(
-                    f'/lobby/{self.interaction.guild.id}/{lobby_details.get("LeaderID")}/users',
+                    f'/lobby/{self.interaction.guild.id}/{lobby_details.leader_id}/users',
                     members_to_add,
                 )
+                lobby_registry.add_members(
+                    self.interaction.guild.id, lobby_details.leader_id, [int(x) for x in members_to_add]
+                )
+            self.updateOptions()
             await self.updateView()
 
     async def kick_button_callback(self, interaction: discord.Interaction):
         lobby_details = await self.check_lobby_exists(interaction)
-        if lobby_details == {}:
+        if lobby_details is None:
             return
         await interaction.response.send_message(
             embed=self.interaction.client.create_embed(
@@ -460,11 +476,11 @@ class LobbyPrompt(View):
         else:
             await msg.delete()
             await prompt.delete()
-            lobby_users = API.get(f'/lobby/{self.interaction.guild.id}/{lobby_details.get("LeaderID")}/users')
+            lobby_users = lobby_registry.get_members(self.interaction.guild.id, lobby_details.leader_id)
             await self.updateView(
                 self.interaction.client.create_embed(
                     "MOCBOT LOBBIES",
-                    f"It appears you are the lobby leader for **{lobby_details.get('LobbyName')}**.\n\n **MEMBERS:**\n"
+                    f"It appears you are the lobby leader for **{lobby_details.lobby_name}**.\n\n **MEMBERS:**\n"
                     "Removing Users...",
                     None,
                 )
@@ -480,11 +496,12 @@ class LobbyPrompt(View):
                     await self.remove_user(member, lobby_details)
                 except (discord.errors.HTTPException, AttributeError):
                     pass
+            self.updateOptions()
             await self.updateView()
 
     async def transfer_button_callback(self, interaction: discord.Interaction):
         lobby_details = await self.check_lobby_exists(interaction)
-        if lobby_details == {}:
+        if lobby_details is None:
             return
         await interaction.response.send_message(
             embed=self.interaction.client.create_embed(
@@ -512,7 +529,7 @@ class LobbyPrompt(View):
                     await msg.mentions[0].send(
                         embed=self.interaction.client.create_embed(
                             "MOCBOT LOBBIES",
-                            f"**{interaction.user}** has transferred their lobby **{lobby_details.get('LobbyName')}** "
+                            f"**{interaction.user}** has transferred their lobby **{lobby_details.lobby_name}** "
                             "to you.",
                             None,
                         )
@@ -539,13 +556,13 @@ class LobbyPrompt(View):
 
     async def rename_button_callback(self, interaction: discord.Interaction):
         lobby_details = await self.check_lobby_exists(interaction)
-        if lobby_details == {}:
+        if lobby_details is None:
             return
         await interaction.response.send_modal(LobbyRename(self))
 
     async def delete_button_callback(self, interaction: discord.Interaction):
         lobby_details = await self.check_lobby_exists(interaction)
-        if lobby_details == {}:
+        if lobby_details is None:
             return
         await interaction.response.defer(thinking=False)
         await self.updateView(self.interaction.client.create_embed("MOCBOT LOBBIES", "Removing lobby...", None))
@@ -562,7 +579,7 @@ class LobbyPrompt(View):
 
     async def hide_button_callback(self, interaction: discord.Interaction):
         lobby_details = await self.check_lobby_exists(interaction)
-        if lobby_details == {}:
+        if lobby_details is None:
             return
         await self.setInviteOnly(interaction.user, 1)
         await self.delete_prompt()
@@ -577,7 +594,7 @@ class LobbyPrompt(View):
 
     async def show_button_callback(self, interaction: discord.Interaction):
         lobby_details = await self.check_lobby_exists(interaction)
-        if lobby_details == {}:
+        if lobby_details is None:
             return
         await self.setInviteOnly(interaction.user, 0)
         await self.delete_prompt()
@@ -603,7 +620,7 @@ class LobbyCreation(Modal, title="Lobby Creation"):
         self.LobbyPrompt.clear_items()
         lobby_details = LobbyPrompt.get_lobby_details(interaction.user)
 
-        if lobby_details != {}:
+        if lobby_details is not None:
             await self.LobbyPrompt.delete_prompt()
             return await interaction.followup.send(
                 embed=interaction.client.create_embed(
@@ -618,7 +635,6 @@ class LobbyCreation(Modal, title="Lobby Creation"):
             interaction.client.create_embed("MOCBOT LOBBIES", f"Creating lobby **{self.lobby_name.value}**", None)
         )
         await self.LobbyPrompt.create_lobby(self.lobby_name.value, interaction.user)
-        await asyncio.sleep(1)
         self.LobbyPrompt.updateOptions()
         await self.LobbyPrompt.updateView()
 
@@ -634,7 +650,6 @@ class LobbyRename(Modal, title="Rename Lobby"):
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(thinking=False)
         await self.LobbyPrompt.rename_lobby(interaction.user, self.lobby_name.value)
-        await asyncio.sleep(1)
         self.LobbyPrompt.updateOptions()
         await self.LobbyPrompt.updateView()
 
@@ -643,97 +658,156 @@ class Lobbies(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.lobby_offline_detection.start()
         self.logger = logging.getLogger(__name__)
+        # (guild_id, leader_id) of lobbies currently being handed off or deleted
+        self._handling: set[tuple[int, int]] = set()
+        self._hydrate_task: asyncio.Task | None = None
 
     async def cog_load(self):
+        lobby_registry.start()
+        self._hydrate_task = asyncio.create_task(self.hydrate_registry())
         self.logger.info(f"[COG] Loaded {self.__class__.__name__}")
 
+    async def cog_unload(self):
+        if self._hydrate_task is not None:
+            self._hydrate_task.cancel()
+        lobby_registry.stop()
+
     def ensure_lobbies():
-        def predicate(interaction: discord.Interaction) -> bool:
-            settings = API.get(f"/settings/{interaction.guild.id}")
-            return bool(settings.get("LobbyCategory", None) if settings is not None else False)
+        async def predicate(interaction: discord.Interaction) -> bool:
+            return await lobby_registry.get_lobby_category(interaction.guild.id) is not None
 
         return app_commands.check(predicate)
 
-    @tasks.loop(seconds=120)
-    async def lobby_offline_detection(self):
+    async def hydrate_registry(self):
+        """Load every lobby into the registry once the bot is ready, then hand off any whose leader is offline."""
+        await self.bot.wait_until_ready()
+        while not lobby_registry.hydrated:
+            try:
+                await lobby_registry.hydrate()
+            except RequestException as e:
+                self.logger.error("Failed to load lobbies, retrying in 30 seconds: %s", e)
+                await asyncio.sleep(30)
+
+        for lobby in lobby_registry.all():
+            guild = self.bot.get_guild(lobby.guild_id)
+            if guild is not None:
+                # Leaders must be cached for their presence to be known
+                await self.bot.ensure_chunked(guild)
+                await self.check_lobby_leader(guild, lobby)
+
+    async def check_lobby_leader(self, guild: discord.Guild, lobby: Lobby):
+        """Transfer a lobby to another online member of its voice channel if its leader is offline, otherwise
+        delete it."""
+        key = (lobby.guild_id, lobby.leader_id)
+        old_leader = guild.get_member(lobby.leader_id)
+        if old_leader is None or old_leader.status != Status.offline or key in self._handling:
+            return
+
+        self._handling.add(key)
         try:
-            lobbies = API.get("/lobbies/")
-        except HTTPError as e:
-            if e.response.status_code == 404:
-                return
+            vc_channel = guild.get_channel(lobby.voice_channel_id)
+            new_lobby_leader = next(
+                (
+                    member
+                    for member in (vc_channel.members if vc_channel is not None else [])
+                    if not member.bot and member.status != Status.offline and member != old_leader
+                ),
+                None,
+            )
+
+            if new_lobby_leader is not None:
+                await self.transfer_offline_lobby(guild, lobby, old_leader, new_lobby_leader)
+            else:
+                await self.delete_offline_lobby(guild, lobby, old_leader)
+        finally:
+            self._handling.discard(key)
+
+    async def transfer_offline_lobby(self, guild, lobby, old_leader, new_lobby_leader):
+        lobby_registry.update(guild.id, old_leader.id, leader_id=new_lobby_leader.id)
+        lobby_registry.queue_write("DELETE", f"/lobby/{guild.id}/{old_leader.id}/{new_lobby_leader.id}")
+        lobby_registry.queue_write("POST", f"/lobby/{guild.id}/{old_leader.id}/users", [str(old_leader.id)])
+        lobby_registry.queue_write(
+            "PATCH", f"/lobby/{guild.id}/{old_leader.id}", {"LeaderID": str(new_lobby_leader.id)}
+        )
+
+        new_leader_embed = self.bot.create_embed(
+            "MOCBOT LOBBIES",
+            f"You are now the lobby leader for **{lobby.lobby_name}** because the original lobby leader "
+            "went offline.",
+            None,
+        )
+        old_leader_embed = self.bot.create_embed(
+            "MOCBOT LOBBIES",
+            f"Your lobby has been transferred to {new_lobby_leader} because you went offline.",
+            None,
+        )
+        self.bot.rest.schedule(
+            Priority.BACKGROUND,
+            lambda: new_lobby_leader.send(embed=new_leader_embed, view=None),
+            bucket=("dm", new_lobby_leader.id),
+        )
+        self.bot.rest.schedule(
+            Priority.BACKGROUND, lambda: old_leader.send(embed=old_leader_embed), bucket=("dm", old_leader.id)
+        )
+
+    async def delete_offline_lobby(self, guild, lobby, old_leader):
+        lobby_registry.remove(guild.id, old_leader.id)
+        lobby_registry.queue_write("DELETE", f"/lobby/{guild.id}/{old_leader.id}")
+
+        # Deletions must not be shed, or the lobby's channels and role would be left behind
+        for channel_id in (lobby.voice_channel_id, lobby.text_channel_id):
+            channel = guild.get_channel(channel_id)
+            if channel is not None:
+                self.bot.rest.schedule(
+                    Priority.BACKGROUND,
+                    lambda channel=channel: channel.delete(
+                        reason=f"[AUTO DELETE {lobby.lobby_name}] {old_leader} went offline"
+                    ),
+                    bucket=("guild", guild.id),
+                    sheddable=False,
+                )
+        role = guild.get_role(lobby.role_id)
+        if role is not None:
+            self.bot.rest.schedule(
+                Priority.BACKGROUND,
+                lambda: role.delete(reason=f"{old_leader} deleted {lobby.lobby_name}"),
+                bucket=("guild", guild.id),
+                sheddable=False,
+            )
+
+        embed = self.bot.create_embed("MOCBOT LOBBIES", "Your lobby has been deleted because you went offline.", None)
+        self.bot.rest.schedule(Priority.BACKGROUND, lambda: old_leader.send(embed=embed), bucket=("dm", old_leader.id))
 
-            self.logger.error("Skipping lobby offline detection due to API error: %s", e)
+    @commands.Cog.listener()
+    async def on_presence_update(self, before: discord.Member, after: discord.Member):
+        if after.status != Status.offline or before.status == Status.offline:
             return
 
-        for lobby in lobbies:
-            guild = self.bot.get_guild(int(lobby.get("GuildID")))
-            if guild is None:
-                continue
-            old_leader = guild.get_member(int(lobby.get("LeaderID")))
-            if old_leader is not None:
-                if old_leader.status == Status.offline:
-                    vc_channel = guild.get_channel(int(lobby.get("VoiceChannelID")))
-                    if vc_channel.members:
-                        new_lobby_leader = None
-                        for member in vc_channel.members:
-                            if not member.bot and member.status != Status.offline and member != old_leader:
-                                new_lobby_leader = member
-                        if new_lobby_leader is not None:
-                            API.delete(f'/lobby/{lobby.get("GuildID")}/{lobby.get("LeaderID")}/{new_lobby_leader.id}')
-                            API.post(
-                                f'/lobby/{lobby.get("GuildID")}/{lobby.get("LeaderID")}/users',
-                                [str(lobby.get("LeaderID"))],
-                            )
-                            API.patch(
-                                f'/lobby/{lobby.get("GuildID")}/{lobby.get("LeaderID")}',
-                                {"LeaderID": str(new_lobby_leader.id)},
-                            )
-                            await new_lobby_leader.send(
-                                embed=self.bot.create_embed(
-                                    "MOCBOT LOBBIES",
-                                    f"You are now the lobby leader for **{lobby.get('LobbyName')}** because the "
-                                    "original lobby leader went offline.",
-                                    None,
-                                ),
-                                view=None,
-                            )
-                            await old_leader.send(
-                                embed=self.bot.create_embed(
-                                    "MOCBOT LOBBIES",
-                                    f"Your lobby has been transferred to {new_lobby_leader} because you went offline.",
-                                    None,
-                                )
-                            )
-                            return
-                    await self.bot.get_channel(int(lobby.get("VoiceChannelID"))).delete(
-                        reason=f"[AUTO DELETE {lobby.get('LobbyName')}] {old_leader} went offline"
-                    )
-                    await self.bot.get_channel(int(lobby.get("TextChannelID"))).delete(
-                        reason=f"[AUTO DELETE {lobby.get('LobbyName')}] {old_leader} deleted {lobby.get('LobbyName')}"
-                    )
-                    await guild.get_role(int(lobby.get("RoleID"))).delete(
-                        reason=f"{old_leader} deleted {lobby.get('LobbyName')}"
-                    )
-                    API.delete(f'/lobby/{lobby.get("GuildID")}/{lobby.get("LeaderID")}')
-                    await old_leader.send(
-                        embed=self.bot.create_embed(
-                            "MOCBOT LOBBIES",
-                            "Your lobby has been deleted because you went offline.",
-                            None,
-                        )
-                    )
+        lobby = lobby_registry.get(after.guild.id, after.id)
+        if lobby is not None:
+            await self.check_lobby_leader(after.guild, lobby)
 
-    @lobby_offline_detection.before_loop
-    async def before_lobby_offline_detection(self):
-        await self.bot.wait_until_ready()
+    @commands.Cog.listener()
+    async def on_voice_state_update(
+        self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState
+    ):
+        if before.channel == after.channel:
+            return
+
+        # Someone joining or leaving a lobby whose leader is offline, e.g. a leader who went offline while the bot
+        # was down, can now be handed off or deleted
+        for channel in (before.channel, after.channel):
+            lobby = lobby_registry.get_by_voice_channel(channel.id) if channel is not None else None
+            if lobby is not None:
+                await self.check_lobby_leader(member.guild, lobby)
 
     @app_commands.command(name="lobby", description="Open/manage a MOCBOT lobby.")
     @ensure_lobbies()
     async def lobby(self, interaction: discord.Interaction):
         await interaction.response.defer(thinking=True)
         guild = self.bot.get_guild(interaction.guild.id)
+        await self.bot.ensure_chunked(guild)
         user = guild.get_member(interaction.user.id)
         if user.status == Status.offline:
             return await interaction.followup.send(
@@ -745,44 +819,12 @@ class Lobbies(commands.Cog):
                 ),
                 ephemeral=True,
             )
-        view = LobbyPrompt(timeout=60, interaction=interaction)
-        lobby_data = LobbyPrompt.get_lobby_details(interaction.user)
-        embed = None
-        if lobby_data != {}:
-            if LobbyPrompt.is_lobby_leader(interaction.user, lobby_data):
-                users = API.get(f'/lobby/{interaction.guild.id}/{lobby_data.get("LeaderID", None)}/users')
-                if users:
-                    embed = interaction.client.create_embed(
-                        "MOCBOT LOBBIES",
-                        f"It appears you are the lobby leader for **{lobby_data.get('LobbyName', None)}**",
-                        None,
-                    )
-                    embed.add_field(
-                        name="MEMBERS:",
-                        value="\n".join([interaction.guild.get_member(int(x)).mention for x in users]),
-                        inline=True,
-                    )
-                else:
-                    embed = interaction.client.create_embed(
-                        "MOCBOT LOBBIES",
-                        f"It appears you are the lobby leader for **{lobby_data.get('LobbyName', None)}**\nYour lobby "
-                        "is currently empty. Invite people with the button below.",
-                        None,
-                    )
-            elif LobbyPrompt.is_lobby_user(interaction.user, lobby_data):
-                embed = interaction.client.create_embed(
-                    "MOCBOT LOBBIES",
-                    f"It appears you a member of **{lobby_data.get('LobbyName', None)}**",
-                    None,
-                )
-        else:
-            embed = self.bot.create_embed(
-                "MOCBOT LOBBIES",
-                "MOCBOT lobbies allows users to create their own private parties. Create a lobby to enjoy private "
-                "sessions!",
-                None,
-            )
-        await interaction.followup.send(embed=embed, view=view)
+        view = LobbyPrompt(
+            timeout=60,
+            interaction=interaction,
+            lobby_category_id=await lobby_registry.get_lobby_category(interaction.guild.id),
+        )
+        await interaction.followup.send(embed=view.getEmbed(), view=view)
 
     @lobby.error
     async def lobby_error(self, interaction, error):
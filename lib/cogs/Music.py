@@ -15,6 +15,8 @@ from discord import app_commands
 from lavalink import DefaultPlayer
 
 from utils.APIHandler import API, ArchiveAPI
+from utils.APIModels import GuildSettings, RecentTracks
+from utils.RestScheduler import Priority
 from utils.Music import (convert_to_ms,
                          format_duration,
                          format_lyrics_for_display,
@@ -180,13 +182,25 @@ class Music(commands.Cog):
         )
 
     async def update_now_playing(self, guild: Guild, player: DefaultPlayer):
-        """Update the now playing message for a guild"""
-        channel = guild.get_channel(self.players[guild.id]["CHANNEL"])
-        message = await channel.fetch_message(self.players[guild.id]["MESSAGE_ID"])
-        # For some reason edit causes a ping despite the global disable, explicitly set allowed_mentions to none
-        await message.edit(
-            view=build_view(NowPlayingContainer(self.service, player, player.current, self.bot)),
-            allowed_mentions=discord.AllowedMentions.none())
+        """Update the now playing message for a guild. Updates queued while one is waiting to be sent are merged
+        into it, and the message is rendered from the player's state when it is sent."""
+
+        async def edit():
+            if guild.id not in self.players:
+                return
+            channel = guild.get_channel(self.players[guild.id]["CHANNEL"])
+            message = channel.get_partial_message(self.players[guild.id]["MESSAGE_ID"])
+            # For some reason edit causes a ping despite the global disable, explicitly set allowed_mentions to none
+            await message.edit(
+                view=build_view(NowPlayingContainer(self.service, player, player.current, self.bot)),
+                allowed_mentions=discord.AllowedMentions.none())
+
+        await self.bot.rest.run(
+            Priority.PLAYBACK,
+            edit,
+            bucket=("channel", self.players[guild.id]["CHANNEL"]),
+            key=("now_playing", guild.id),
+        )
 
     async def send_new_now_playing(self, guild: Guild, player: DefaultPlayer, track=None):
         """Send a new now playing message for a guild"""
@@ -219,13 +233,13 @@ class Music(commands.Cog):
         """Get the channel to send the now playing message to"""
         settings = None
         try:
-            settings = API.get(f"/settings/{guild.id}")
+            settings = API.get(f"/settings/{guild.id}", model=GuildSettings)
         except HTTPError:
             pass  # Ignore errors, we'll find a channel otherwise
 
         channel = None
-        if settings is not None and settings.get("MusicChannel") is not None:
-            channel = self.bot.get_channel(int(settings.get("MusicChannel")))
+        if settings is not None and settings.music_channel is not None:
+            channel = self.bot.get_channel(settings.music_channel)
 
         if channel is None:
             text_channels = [c for c in guild.text_channels if c.permissions_for(guild.me).send_messages]
@@ -658,11 +672,10 @@ class Music(commands.Cog):
         is_personal = server_recents == "No"
         await interaction.response.defer(ephemeral=is_personal, thinking=True)
 
-        recents = []
         if not is_personal:
-            recents = ArchiveAPI.get(f"/guilds/{interaction.guild.id}/tracks/recent?limit=50")
+            recents = ArchiveAPI.get(f"/guilds/{interaction.guild.id}/tracks/recent?limit=50", model=RecentTracks)
         else:
-            recents = ArchiveAPI.get(f"/users/{interaction.user.id}/tracks/recent?limit=50")
+            recents = ArchiveAPI.get(f"/users/{interaction.user.id}/tracks/recent?limit=50", model=RecentTracks)
 
         container = RecentsContainer(
             service=self.service,
@@ -1,7 +1,9 @@
 from discord.ext import commands
+import asyncio
 import logging
 from discord import Member, Object, HTTPException
 
+from lib.joins.JoinPipeline import JoinBatch
 from utils.APIHandler import API
 from requests.exceptions import HTTPError
 
@@ -13,29 +15,40 @@ class Roles(commands.Cog):
         self.logger = logging.getLogger(__name__)
 
     async def cog_load(self):
+        self.bot.joins.register("roles", self.plan_join_roles)
         self.logger.info(f"[COG] Loaded {self.__class__.__name__}")
 
+    async def cog_unload(self):
+        self.bot.joins.unregister("roles")
+
     @staticmethod
-    async def give_join_roles(member: Member):
+    def get_join_roles(guild_id: int) -> list[int]:
         try:
-            rolesData = API.get(f"/roles/{member.guild.id}")
+            rolesData = API.get(f"/roles/{guild_id}")
         except HTTPError as e:
             if e.response.status_code == 404:
-                return
+                return []
             else:
                 raise e
-        if rolesData and rolesData.get("JoinRoles"):
-            for roleID in rolesData.get("JoinRoles"):
-                try:
-                    await member.add_roles(Object(id=int(roleID)), reason="Join Role")
-                except HTTPException:
-                    continue
-
-    @commands.Cog.listener()
-    async def on_member_join(self, member: Member):
-        settingsData = API.get(f"/settings/{member.guild.id}")
-        if "Verification" not in settingsData.get("EnabledModules"):
-            await Roles.give_join_roles(member)
+        return [int(roleID) for roleID in (rolesData or {}).get("JoinRoles") or []]
+
+    @staticmethod
+    async def give_join_roles(member: Member):
+        # One request per role rather than a single edit, as an edit would set the member's full role list from a
+        # cached member, undoing changes made since it was cached such as the verification role swap
+        for roleID in Roles.get_join_roles(member.guild.id):
+            try:
+                await member.add_roles(Object(id=roleID), reason="Join Role")
+            except HTTPException:
+                continue
+
+    async def plan_join_roles(self, batch: JoinBatch):
+        """Give members who joined the guild's join roles, unless verification gives them once they verify."""
+        if batch.settings is None or "Verification" in batch.settings.enabled_modules:
+            return
+        join_roles = await asyncio.to_thread(Roles.get_join_roles, batch.guild.id)
+        for join in batch.joins:
+            join.add_roles.update(join_roles)
 
 
 async def setup(bot):
@@ -1,5 +1,6 @@
-from discord.ext import commands, tasks
+from discord.ext import commands
 from utils.APIHandler import API
+from utils.APIModels import GuildSettings, VerificationSettings
 from discord import (
     app_commands,
     Member,
@@ -11,7 +12,12 @@ from discord import (
 from typing import Optional
 from enum import Enum
 from lib.socket.Socket import Socket
-from requests.exceptions import HTTPError
+from lib.socket.namespaces.Verification import verification_queue
+from lib.joins.JoinPipeline import JoinBatch
+from lib.verification.LockdownSweeper import lockdown_sweeper
+from utils.RestScheduler import Priority
+from requests.exceptions import HTTPError, RequestException
+import asyncio
 import logging
 from discord.ui import Button, View
 import discord
@@ -31,23 +37,36 @@ class Verification(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.logger = logging.getLogger(__name__)
-        self.check_lockdown_users_loop.start()
+        self._hydrate_task: Optional[asyncio.Task] = None
 
     def reload_cogs(self):
         self.logger.info(f"[COG] Reloaded {self.__class__.__name__}")
 
     async def cog_load(self):
+        self.bot.joins.register("verification", self.plan_verification)
+        lockdown_sweeper.start(self.expire_verification)
+        self._hydrate_task = asyncio.create_task(self.hydrate_sweeper())
+        verification_queue.ready.set()
         self.logger.info(f"[COG] Loaded {self.__class__.__name__}")
 
+    async def cog_unload(self):
+        # Hold dashboard requests until the cog is loaded again
+        verification_queue.ready.clear()
+        self.bot.joins.unregister("verification")
+        if self._hydrate_task is not None:
+            self._hydrate_task.cancel()
+        lockdown_sweeper.stop()
+
     @staticmethod
     async def web_verify_user(userID: str, guildID: str, **kwargs):
-        settings = API.get(f"/settings/{guildID}")
-        guild = await Verification.bot.fetch_guild(guildID)
-        member = await guild.fetch_member(userID)
-        admin = await guild.fetch_member(kwargs.get("adminID")) if kwargs.get("adminID") else None
-        if not bool(settings.get("Verification", None) if settings is not None else False):
+        settings = API.get(f"/settings/{guildID}", model=GuildSettings)
+        resolver = Verification.bot.resolver
+        guild = await resolver.guild(guildID)
+        member = await resolver.member(guild, userID)
+        admin = await resolver.member(guild, kwargs.get("adminID")) if kwargs.get("adminID") else None
+        if settings is None or settings.verification is None:
             return await Socket.emit("verify_error", namespace="/verification")
-        match await Verification.verify_user(member, settings.get("Verification"), admin=admin, **kwargs):
+        match await Verification.verify_user(member, settings.verification, admin=admin, **kwargs):
             case VerificationStatus.SUCCESS:
                 await Socket.emit("verify_success", namespace="/verification")
                 await Roles.give_join_roles(member)
@@ -58,9 +77,10 @@ class Verification(commands.Cog):
 
     @staticmethod
     async def web_kick_user(userID: str, guildID: str, adminID: str):
-        guild = await Verification.bot.fetch_guild(guildID)
-        member = await guild.fetch_member(userID)
-        admin = await guild.fetch_member(adminID)
+        resolver = Verification.bot.resolver
+        guild = await resolver.guild(guildID)
+        member = await resolver.member(guild, userID)
+        admin = await resolver.member(guild, adminID)
         await Verification.kick_user(member, admin=admin)
 
     @staticmethod
@@ -73,14 +93,9 @@ class Verification(commands.Cog):
             else:
                 raise e
         else:
-            if data.get("ChannelID") and data.get("MessageID"):
-                try:
-                    channel = await member.guild.fetch_channel(int(data.get("ChannelID")))
-                    message = await channel.fetch_message(int(data.get("MessageID")))
-                    await message.delete()
-                except (HTTPException, Forbidden):
-                    pass
+            await Verification.delete_lockdown_message(member.guild, data)
         API.delete(f"/verification/{member.guild.id}/{member.id}")
+        lockdown_sweeper.remove(member.guild.id, member.id)
         try:
             await member.send(
                 embed=Verification.bot.create_embed(
@@ -94,21 +109,51 @@ class Verification(commands.Cog):
         await member.kick(reason=f"Denied access by {admin}")
 
     @staticmethod
-    async def verify_user(member: Member, settings: Object, **kwargs):
+    async def delete_lockdown_message(guild: discord.Guild, data: dict):
+        """Delete the lockdown approval message of a verification record, if it still exists."""
+        if not (data.get("ChannelID") and data.get("MessageID")):
+            return
+        try:
+            channel = await Verification.bot.resolver.channel(guild, data.get("ChannelID"))
+            # Deleting a partial message saves fetching it first
+            await channel.get_partial_message(int(data.get("MessageID"))).delete()
+        except (HTTPException, Forbidden):
+            pass
+
+    @staticmethod
+    async def swap_roles(member: Member, remove: list[int], add: list[int], reason: str):
+        """Add and remove roles of a member, skipping those they already have or lack and those that are not set up,
+        given as None. Roles are changed one by one rather than set as a whole, which would undo changes to the
+        member's other roles not seen yet. Roles are added first, so a failure never leaves them with neither."""
+        member_role_ids = {role.id for role in member.roles}
+        add = [Object(id=role_id) for role_id in add if role_id is not None and role_id not in member_role_ids]
+        remove = [Object(id=role_id) for role_id in remove if role_id in member_role_ids and role_id is not None]
+        if add:
+            await member.add_roles(*add, reason=reason)
+        if remove:
+            await member.remove_roles(*remove, reason=reason)
+
+    @staticmethod
+    async def verify_user(member: Member, settings: VerificationSettings, **kwargs):
         member_role_ids = [role.id for role in member.roles]
-        verification_role_id = settings.get("VerificationRoleID")
-        lockdown_role_id = settings.get("LockdownRoleID")
+        verification_role_id = settings.verification_role_id
+        lockdown_role_id = settings.lockdown_role_id
         admin = kwargs.get("admin")
 
-        if (int(verification_role_id) in member_role_ids or int(lockdown_role_id) in member_role_ids) and len(
+        if (verification_role_id in member_role_ids or lockdown_role_id in member_role_ids) and len(
             member_role_ids
         ) >= 2:
             if kwargs.get("captcha") is None or (
                 kwargs.get("captcha") is not None and kwargs.get("captcha")["score"] >= 0.7
             ):
                 try:
-                    if int(lockdown_role_id) in member_role_ids:
-                        await member.remove_roles(Object(id=lockdown_role_id))
+                    await Verification.swap_roles(
+                        member,
+                        [verification_role_id, lockdown_role_id],
+                        [settings.verified_role_id],
+                        reason=f"{member} successfully verified",
+                    )
+                    if lockdown_role_id in member_role_ids:
                         try:
                             data = API.get(f"/verification/{member.guild.id}/{member.id}")
                         except HTTPError as e:
@@ -117,22 +162,7 @@ class Verification(commands.Cog):
                             else:
                                 raise e
                         else:
-                            try:
-                                channel = await member.guild.fetch_channel(int(data.get("ChannelID")))
-                                message = await channel.fetch_message(int(data.get("MessageID")))
-                                await message.delete()
-                            except (HTTPException, Forbidden):
-                                pass
-
-                    if int(verification_role_id) in member_role_ids:
-                        await member.remove_roles(
-                            Object(id=verification_role_id),
-                            reason=f"{member} successfully verified",
-                        )
-                    await member.add_roles(
-                        Object(id=settings.get("VerifiedRoleID")),
-                        reason=f"{member} successfully verified",
-                    )
+                            await Verification.delete_lockdown_message(member.guild, data)
                 except HTTPException:
                     return VerificationStatus.ERROR
                 else:
@@ -149,19 +179,22 @@ class Verification(commands.Cog):
                     except (HTTPException, Forbidden):
                         pass
                     API.delete(f"/verification/{member.guild.id}/{member.id}")
+                    lockdown_sweeper.remove(member.guild.id, member.id)
                 return VerificationStatus.SUCCESS
             else:
                 try:
-                    await member.remove_roles(
-                        Object(id=settings.get("VerificationRoleID")),
+                    await Verification.swap_roles(
+                        member,
+                        [verification_role_id],
+                        [lockdown_role_id],
                         reason=f"{member} placed in lockdown",
                     )
-                    await member.add_roles(Object(id=settings.get("LockdownRoleID")))
                 except HTTPException:
                     return VerificationStatus.ERROR
                 else:
-                    guild = await Verification.bot.fetch_guild(member.guild.id)
-                    channel = await guild.fetch_channel(int(settings.get("LockdownApprovalsChannelID")))
+                    channel = await Verification.bot.resolver.channel(
+                        member.guild, settings.lockdown_approvals_channel_id
+                    )
                     view = View()
                     view.add_item(
                         Button(
@@ -200,78 +233,85 @@ class Verification(commands.Cog):
                             "ChannelID": str(channel.id),
                         },
                     )
+                    lockdown_sweeper.update(
+                        member.guild.id, member.id, MessageID=str(message.id), ChannelID=str(channel.id)
+                    )
                     return VerificationStatus.LOCKDOWN
         return VerificationStatus.ERROR
 
-    @commands.Cog.listener()
-    async def on_member_join(self, member: Member):
+    @staticmethod
+    def get_verification_record(guild_id: int, user_id: int) -> Optional[dict]:
         try:
-            settings = API.get(f"/settings/{member.guild.id}").get("Verification")
+            return API.get(f"/verification/{guild_id}/{user_id}")
         except HTTPError as e:
-            if e.response.status_code == 404:
-                return
+            if e.response.status_code in [404, 429]:
+                return None
             else:
                 raise e
+
+    async def plan_verification(self, batch: JoinBatch):
+        """Put members who joined into verification, or back into lockdown if they were in it when they left."""
+        settings = batch.settings.verification if batch.settings is not None else None
         if settings is None:
             return
 
-        if member.bot:
-            return await member.add_roles(Object(id=settings.get("VerifiedRoleID")))
+        guild = batch.guild
+        humans = [join for join in batch.joins if not join.member.bot]
+        records = await asyncio.gather(
+            *(asyncio.to_thread(Verification.get_verification_record, guild.id, join.member.id) for join in humans)
+        )
+        records = {join.member.id: record for join, record in zip(humans, records)}
+        for join in batch.joins:
+            member = join.member
+            if member.bot:
+                if settings.verified_role_id is not None:
+                    join.add_roles.add(settings.verified_role_id)
+                continue
 
-        try:
-            user = API.get(f"/verification/{member.guild.id}/{member.id}")
-        except HTTPError as e:
-            if e.response.status_code in [404, 429]:
-                pass
-            else:
-                raise e
-        else:
-            if all([user.get("MessageID"), user.get("ChannelID")]):
+            user = records[member.id]
+            if user is not None and all([user.get("MessageID"), user.get("ChannelID")]):
                 user_join_time = user.get("JoinTime")
                 if user_join_time is not None and self.user_verification_elapsed(user_join_time):
-                    guild = self.bot.get_guild(user.get("GuildID"))
-                    try:
-                        await member.send(
-                            embed=Verification.bot.create_embed(
-                                "MOCBOT VERIFICATION",
-                                f"You have been in lockdown in the **{member.guild}** server for more than 7 days, and "
-                                f"thus have been kicked. Please contact {guild.owner.mention} if you believe this is "
-                                "a mistake.",
-                                None,
-                            )
-                        )
-                    except (HTTPException, Forbidden):
-                        pass
-                    return await guild.kick(member, reason="User in lockdown for more than 7 days.")
+                    embed = Verification.bot.create_embed(
+                        "MOCBOT VERIFICATION",
+                        f"You have been in lockdown in the **{guild}** server for more than 7 days, and thus have been "
+                        f"kicked. Please contact <@{guild.owner_id}> if you believe this is a mistake.",
+                        None,
+                    )
+                    join.notifications.append(lambda member=member, embed=embed: member.send(embed=embed))
+                    join.kick_reason = "User in lockdown for more than 7 days."
                 else:
-                    return await member.add_roles(Object(id=settings.get("LockdownRoleID")))
-        await member.add_roles(Object(id=settings.get("VerificationRoleID")))
-        API.post(f"/verification/{member.guild.id}/{member.id}", {})
-        try:
+                    lockdown_sweeper.add(guild.id, member.id, user)
+                    if settings.lockdown_role_id is not None:
+                        join.add_roles.add(settings.lockdown_role_id)
+                continue
+
+            if settings.verification_role_id is not None:
+                join.add_roles.add(settings.verification_role_id)
+            batch.writes.append(("POST", f"/verification/{guild.id}/{member.id}", {}))
+            lockdown_sweeper.add(
+                guild.id, member.id, {"GuildID": str(guild.id), "UserID": str(member.id), "JoinTime": int(time.time())}
+            )
             view = View()
             view.add_item(
                 Button(
                     label="Verify here",
                     style=discord.ButtonStyle.link,
-                    url=f"{self.bot.WEBSITE_BASE_URL}/verify/{member.guild.id}/{member.id}",
+                    url=f"{self.bot.WEBSITE_BASE_URL}/verify/{guild.id}/{member.id}",
                 )
             )
-            await member.send(
-                embed=self.bot.create_embed(
-                    "MOCBOT VERIFICATION",
-                    f"**Welcome to {member.guild}!**\n\nTo ensure you have access to this server, you must complete a "
-                    "quick one-click verification process to verify you are not a bot.",
-                    None,
-                ),
-                view=view,
+            embed = self.bot.create_embed(
+                "MOCBOT VERIFICATION",
+                f"**Welcome to {guild}!**\n\nTo ensure you have access to this server, you must complete a quick "
+                "one-click verification process to verify you are not a bot.",
+                None,
             )
-        except (HTTPException, Forbidden):
-            pass
+            join.notifications.append(lambda member=member, embed=embed, view=view: member.send(embed=embed, view=view))
 
     @commands.Cog.listener()
     async def on_member_remove(self, member: Member):
         try:
-            settings = API.get(f"/settings/{member.guild.id}").get("Verification")
+            settings = API.get(f"/settings/{member.guild.id}", model=GuildSettings).verification
         except HTTPError as e:
             if e.response.status_code == 404:
                 return
@@ -279,6 +319,8 @@ class Verification(commands.Cog):
                 raise e
         if settings is None:
             return
+        # Lockdown records are kept for when they rejoin, at which point they are added back
+        lockdown_sweeper.remove(member.guild.id, member.id)
         try:
             user = API.get(f"/verification/{member.guild.id}/{member.id}")
         except HTTPError as e:
@@ -303,8 +345,8 @@ class Verification(commands.Cog):
     )
     async def verify(self, interaction: Interaction, user: Optional[Member]):
         await interaction.response.defer(thinking=True, ephemeral=True)
-        settings = API.get(f"/settings/{interaction.guild.id}")
-        if not bool(settings.get("Verification") if settings is not None else False):
+        settings = API.get(f"/settings/{interaction.guild.id}", model=GuildSettings)
+        if settings is None or settings.verification is None:
             return await interaction.followup.send(
                 embed=self.bot.create_embed(
                     "MOCBOT VERIFICATION",
@@ -312,7 +354,7 @@ class Verification(commands.Cog):
                     None,
                 )
             )
-        verification_roles = settings.get("Verification")
+        verification_roles = settings.verification
 
         if user is not None:
             if not interaction.permissions.manage_guild:
@@ -342,7 +384,7 @@ class Verification(commands.Cog):
                         )
                     )
         else:
-            if int(verification_roles.get("VerifiedRoleID")) in [role.id for role in interaction.user.roles]:
+            if verification_roles.verified_role_id in [role.id for role in interaction.user.roles]:
                 await interaction.followup.send(
                     embed=self.bot.create_embed(
                         "MOCBOT VERIFICATION",
@@ -372,49 +414,62 @@ class Verification(commands.Cog):
     def user_verification_elapsed(self, join_time):
         return (datetime.datetime.fromtimestamp(int(join_time)) + datetime.timedelta(days=7)) < datetime.datetime.now()
 
-    @tasks.loop(
-        time=[
-            datetime.time(
-                0,
-                0,
-                tzinfo=datetime.timezone(datetime.timedelta(hours=+11 if time.localtime().tm_isdst else +10)),
+    async def hydrate_sweeper(self):
+        """Load pending verifications of this bot's guilds into the sweeper once the bot is ready."""
+        await self.bot.wait_until_ready()
+        while not lockdown_sweeper.hydrated:
+            try:
+                await lockdown_sweeper.hydrate(lambda guild_id: self.bot.get_guild(guild_id) is not None)
+            except RequestException as e:
+                self.logger.error("Failed to load pending verifications, retrying in 30 seconds: %s", e)
+                await asyncio.sleep(30)
+
+    async def expire_verification(self, guild_id: int, user_id: int, record: dict) -> bool:
+        """Kick a member who has not verified within 7 days of joining. Returns whether they were kicked."""
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return False
+        try:
+            # The record may have been resolved outside this process, e.g. by another worker
+            record = await asyncio.to_thread(API.get, f"/verification/{guild_id}/{user_id}")
+        except HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return False
+            raise
+        try:
+            member = await self.bot.resolver.member(guild, user_id)
+        except discord.NotFound:
+            return False
+
+        if all([record.get("MessageID"), record.get("ChannelID")]):
+            description = (
+                f"You have been in lockdown in the **{guild}** server for more than 7 days, and thus have been kicked. "
+                f"Please contact the server owner <@{guild.owner_id}> if you believe this is a mistake."
             )
-        ]
-    )
-    async def check_lockdown_users_loop(self):
-        users = API.get("/verification")
-        for user in users:
-            user_join_time = user.get("JoinTime")
-            if user_join_time is not None and self.user_verification_elapsed(user_join_time):
-                guild = self.bot.get_guild(int(user.get("GuildID")))
-                member = guild.get_member(int(user.get("UserID"))) if guild is not None else None
-                if member is None:
-                    continue
-                if all([user.get("MessageID"), user.get("ChannelID")]):
-                    await member.send(
-                        embed=Verification.bot.create_embed(
-                            "MOCBOT VERIFICATION",
-                            f"You have been in lockdown in the **{member.guild}** server for more than 7 days, and thus"
-                            " have been kicked. Please contact the server owner {guild.owner.mention} if you believe "
-                            "this is a mistake. ",
-                            None,
-                        )
-                    )
-                    await guild.kick(member, reason="User in lockdown for more than 7 days.")
-                else:
-                    await member.send(
-                        embed=Verification.bot.create_embed(
-                            "MOCBOT VERIFICATION",
-                            f"You were not verified within 7 days of joining the **{member.guild}** server, and was "
-                            "thus kicked. If you wish to be a member of the server, please verify upon joining.",
-                            None,
-                        )
-                    )
-                    await guild.kick(member, reason="User failed to verify within 7 days.")
+            reason = "User in lockdown for more than 7 days."
+        else:
+            description = (
+                f"You were not verified within 7 days of joining the **{guild}** server, and was thus kicked. If you "
+                "wish to be a member of the server, please verify upon joining."
+            )
+            reason = "User failed to verify within 7 days."
 
-    @check_lockdown_users_loop.before_loop
-    async def before_check_lockdown_users_loop(self):
-        await self.bot.wait_until_ready()
+        try:
+            await self.bot.rest.run(
+                Priority.BACKGROUND,
+                lambda: member.send(embed=self.bot.create_embed("MOCBOT VERIFICATION", description, None)),
+                bucket=("dm", user_id),
+                sheddable=False,
+            )
+        except (HTTPException, Forbidden):
+            pass
+        await self.bot.rest.run(
+            Priority.BACKGROUND,
+            lambda: guild.kick(member, reason=reason),
+            bucket=("guild", guild_id),
+            sheddable=False,
+        )
+        return True
 
 
 async def setup(bot: commands.Bot):
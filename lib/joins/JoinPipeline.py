@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+import discord
+from requests.exceptions import HTTPError
+
+from utils.APIHandler import API
+from utils.APIHandler.WriteBehind import WriteBehindQueue
+from utils.APIModels import GuildSettings
+from utils.Metrics import metrics
+from utils.RestScheduler import Priority
+
+JOINS = metrics.counter("mocbot_joins_total", "Member joins processed by the join pipeline, by outcome", ["outcome"])
+JOIN_SECONDS = metrics.histogram(
+    "mocbot_join_seconds",
+    "Time from a member joining to their roles being set",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+JOIN_BATCH_SIZE = metrics.histogram(
+    "mocbot_join_batch_size", "Members per join pipeline batch", buckets=(1, 2, 5, 10, 25, 50, 100, 250)
+)
+
+
+@dataclass
+class MemberJoin:
+    """What to do for a member who joined, planned by the join handlers."""
+
+    member: discord.Member
+    joined_at: float = field(default_factory=time.monotonic)
+    add_roles: set[int] = field(default_factory=set)
+    remove_roles: set[int] = field(default_factory=set)
+    # Set to kick the member instead of editing their roles
+    kick_reason: Optional[str] = None
+    # Requests sent after the role edit, or before the kick, such as DMs
+    notifications: list[Callable[[], Awaitable]] = field(default_factory=list)
+
+
+@dataclass
+class JoinBatch:
+    """Members who joined a guild within one window, with the guild's settings resolved once for all of them."""
+
+    guild: discord.Guild
+    settings: Optional[GuildSettings]
+    joins: list[MemberJoin]
+    # API writes to send once the batch is planned, as (method, route, body)
+    writes: list[tuple[str, str, object]] = field(default_factory=list)
+
+
+JoinHandler = Callable[[JoinBatch], Awaitable[None]]
+
+
+class JoinPipeline:
+    """Collects member joins per guild over a short window and processes them as a batch.
+
+    Settings are fetched once per batch and handed to the join handlers registered by cogs, which plan what each
+    member needs rather than making requests themselves. Each member then gets a single role edit, the API writes
+    are sent together off the event loop, and notifications go out as background requests. During a raid, this
+    makes one Discord request per member instead of one per role, plus an API read per batch instead of per member.
+    """
+
+    def __init__(
+        self,
+        bot: discord.Client,
+        window: float = 1,
+        max_batch: int = 100,
+        concurrency: int = 8,
+        target_joins_per_second: float = 15,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.bot = bot
+        self.window = window
+        self.max_batch = max_batch
+        self.target_joins_per_second = target_joins_per_second
+        self._slots = asyncio.Semaphore(concurrency)
+        self._handlers: dict[str, JoinHandler] = {}
+        # guild_id -> joins waiting for the guild's window to close
+        self._pending: dict[int, list[MemberJoin]] = {}
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        # Writes that could not be sent while the API was down, sent once it is back
+        self._writes = WriteBehindQueue(API, "JOINS")
+        # When the current burst of joins started, and how many joins it has had so far
+        self._burst_started: Optional[float] = None
+        self._burst_joins = 0
+
+        metrics.gauge(
+            "mocbot_joins_pending", "Member joins waiting for their batch to be processed",
+            function=lambda: sum(len(joins) for joins in self._pending.values()),
+        )
+
+    def register(self, name: str, handler: JoinHandler):
+        """Register a handler called with every batch, replacing any handler of the same name."""
+        self._handlers[name] = handler
+
+    def unregister(self, name: str):
+        self._handlers.pop(name, None)
+
+    def submit(self, member: discord.Member):
+        """Queue a member who joined. Their guild's batch is processed when its window closes or it is full."""
+        if not self._handlers:
+            return
+
+        if self._burst_started is None:
+            self._burst_started = time.monotonic()
+        self._burst_joins += 1
+        guild_id = member.guild.id
+        self._pending.setdefault(guild_id, []).append(MemberJoin(member))
+        if len(self._pending[guild_id]) >= self.max_batch:
+            self._flush(guild_id)
+        elif guild_id not in self._timers:
+            self._timers[guild_id] = asyncio.get_running_loop().call_later(self.window, self._flush, guild_id)
+
+    def _flush(self, guild_id: int):
+        timer = self._timers.pop(guild_id, None)
+        if timer is not None:
+            timer.cancel()
+        joins = self._pending.pop(guild_id, [])
+        if joins:
+            task = asyncio.create_task(self._process(joins[0].member.guild, joins))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, guild: discord.Guild, joins: list[MemberJoin]):
+        JOIN_BATCH_SIZE.observe(len(joins))
+        try:
+            async with self._slots:
+                await self._process_batch(guild, joins)
+        finally:
+            if not self._pending and all(task.done() or task is asyncio.current_task() for task in self._tasks):
+                self._end_burst()
+
+    async def _process_batch(self, guild: discord.Guild, joins: list[MemberJoin]):
+        try:
+            batch = JoinBatch(guild, await asyncio.to_thread(self._get_settings, guild.id), joins)
+            for name, handler in list(self._handlers.items()):
+                try:
+                    await handler(batch)
+                except Exception:
+                    self.logger.exception("[JOINS] %s handler failed for %s members of %s", name, len(joins), guild)
+        except Exception:
+            JOINS.inc(len(joins), outcome="failed")
+            self.logger.exception("[JOINS] Failed to process %s joins in %s", len(joins), guild)
+            return
+
+        writes = asyncio.create_task(asyncio.to_thread(self._writes.send, batch.writes))
+        applied = await asyncio.gather(*(self._apply(join) for join in joins))
+        # Notifications wait for the writes, as they may link to records the writes create. Writes not sent because
+        # the API is down are queued until it is back
+        for method, route, body in batch.writes[await writes:]:
+            self._writes.put(method, route, body)
+        await asyncio.gather(
+            *(self._notify(join) for join, ok in zip(joins, applied) if ok and join.kick_reason is None)
+        )
+
+    def _end_burst(self):
+        """Report the throughput of a burst of joins once every join in it is processed."""
+        joins, elapsed = self._burst_joins, max(time.monotonic() - (self._burst_started or 0), 1e-3)
+        self._burst_started, self._burst_joins = None, 0
+        # Small bursts are dominated by the batching window and request latency rather than throughput
+        if joins >= 2 * self.target_joins_per_second and joins / elapsed < self.target_joins_per_second:
+            self.logger.warning(
+                "[JOINS] Processed a burst of %s joins at %.1f/s, below the target of %s/s",
+                joins, joins / elapsed, self.target_joins_per_second,
+            )
+
+    async def _apply(self, join: MemberJoin) -> bool:
+        """Kick the member or set their roles, returning whether it succeeded."""
+        member = join.member
+        try:
+            if join.kick_reason is not None:
+                await self._notify(join)
+                await self.bot.rest.run(
+                    Priority.BACKGROUND,
+                    lambda: member.kick(reason=join.kick_reason),
+                    bucket=("guild", member.guild.id),
+                    sheddable=False,
+                )
+                JOINS.inc(outcome="kicked")
+                return True
+
+            async def set_roles():
+                # Built from the member's roles when sent rather than when queued, so roles given meanwhile, e.g. by
+                # onboarding or other bots, are kept
+                current = member.guild.get_member(member.id) or member
+                roles = [role for role in current.roles[1:] if role.id not in join.remove_roles]
+                added = join.add_roles - {role.id for role in roles}
+                if added or len(roles) != len(current.roles) - 1:
+                    # One edit setting the full role list, rather than a request per role added or removed
+                    await current.edit(
+                        roles=roles + [discord.Object(id=role_id) for role_id in added], reason="Member joined"
+                    )
+
+            await self.bot.rest.run(
+                Priority.BACKGROUND, set_roles, bucket=("member", member.guild.id, member.id), sheddable=False
+            )
+            JOIN_SECONDS.observe(time.monotonic() - join.joined_at)
+            JOINS.inc(outcome="processed")
+        except discord.HTTPException as e:
+            JOINS.inc(outcome="failed")
+            self.logger.error("[JOINS] Failed to set up %s in %s: %s", member, member.guild, e)
+            return False
+        return True
+
+    async def _notify(self, join: MemberJoin):
+        for notification in join.notifications:
+            try:
+                await self.bot.rest.run(Priority.BACKGROUND, notification, bucket=("dm", join.member.id))
+            except discord.HTTPException:
+                pass
+
+    @staticmethod
+    def _get_settings(guild_id: int) -> Optional[GuildSettings]:
+        try:
+            return API.get(f"/settings/{guild_id}", model=GuildSettings)
+        except HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return None
+            raise
@@ -0,0 +1,71 @@
+import asyncio
+import bisect
+from dataclasses import dataclass
+from typing import Optional
+
+from requests.exceptions import HTTPError
+
+from utils.APIHandler import API
+from utils.Cache import Cache
+
+
+@dataclass(frozen=True)
+class LevelRoleTable:
+    """A guild's level roles, as level thresholds in ascending order and the role given at each."""
+
+    thresholds: tuple[int, ...] = ()
+    role_ids: tuple[int, ...] = ()
+    all_role_ids: frozenset[int] = frozenset()
+
+    @classmethod
+    def from_level_roles(cls, level_roles: Optional[dict]) -> "LevelRoleTable":
+        """Build a table from the LevelRoles of GET /roles, a map of level to role ID."""
+        pairs = sorted((int(level), int(role_id)) for level, role_id in (level_roles or {}).items())
+        return cls(
+            tuple(level for level, _ in pairs),
+            tuple(role_id for _, role_id in pairs),
+            frozenset(role_id for _, role_id in pairs),
+        )
+
+    def roles_for(self, level: int) -> set[int]:
+        """The level roles a member of a level should have: every role at or below their level."""
+        return set(self.role_ids[:bisect.bisect_right(self.thresholds, level)])
+
+    def reconcile(self, role_ids: set[int], level: int) -> Optional[tuple[set[int], set[int]]]:
+        """The level roles a member with role_ids should be given and have removed at a level, or None if they already
+        have the right ones. Other roles are left out, so changes to them are never undone."""
+        target = self.roles_for(level)
+        add, remove = target - role_ids, (role_ids & self.all_role_ids) - target
+        return (add, remove) if add or remove else None
+
+
+class LevelRoleCache:
+    """Per guild level role tables, fetched from the API on first use.
+
+    Tables are dropped when the website reports the guild's roles changed, and are refreshed in the background after
+    ttl_seconds in case such a report is missed.
+    """
+
+    def __init__(self, ttl_seconds: int = 10 * 60):
+        self._tables: Cache[int, LevelRoleTable] = Cache(
+            "level_roles", maxsize=1024, ttl=ttl_seconds, stale_ttl=ttl_seconds
+        )
+
+    async def get(self, guild_id: int) -> LevelRoleTable:
+        return await self._tables.get_or_load(guild_id, lambda: asyncio.to_thread(self._fetch, guild_id))
+
+    @staticmethod
+    def _fetch(guild_id: int) -> LevelRoleTable:
+        try:
+            res = API.get(f"/roles/{guild_id}")
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            res = None
+        return LevelRoleTable.from_level_roles(res.get("LevelRoles") if res else None)
+
+    def invalidate(self, guild_id: int):
+        self._tables.invalidate(guild_id)
+
+
+level_roles = LevelRoleCache()
@@ -0,0 +1,273 @@
+import asyncio
+import dataclasses
+import logging
+import time
+from dataclasses import dataclass
+
+import discord
+from requests.exceptions import HTTPError
+
+from utils.APIHandler import API
+from utils.APIHandler.WriteBehind import WriteBehindQueue
+from utils.APIModels import GuildSettings, Lobby
+from utils.Cache import MISSING, Cache
+from utils.Metrics import metrics
+
+
+@dataclass
+class MemberLobby:
+    """The lobby a member leads or belongs to, resolved from the registry"""
+
+    lobby: Lobby
+    is_leader: bool
+    members: list[int]
+
+    @property
+    def invite_only(self) -> bool:
+        return self.lobby.invite_only
+
+
+class LobbyRegistry:
+    """In-memory index of every lobby, keyed by (guild ID, leader ID) and by voice channel ID.
+
+    Hydrated once from the API at startup, then kept current by the bot's own writes. Lobby members are loaded
+    per lobby when they are needed, and loaded again once older than members_ttl_seconds, as they can also be changed
+    elsewhere, e.g. on the website. Members found to be in no lobby are remembered for as long. Writes made from event
+    handlers are queued and sent to the API by a background task, so handlers never block on HTTP, and are kept until
+    the API is back if it is down.
+    """
+
+    def __init__(self, settings_ttl_seconds: int = 5 * 60, members_ttl_seconds: int = 5 * 60):
+        self.logger = logging.getLogger(__name__)
+        # (guild_id, leader_id) -> lobby
+        self._lobbies: dict[tuple[int, int], Lobby] = {}
+        # voice_channel_id -> (guild_id, leader_id)
+        self._voice_channels: dict[int, tuple[int, int]] = {}
+        # (guild_id, leader_id) -> member IDs, excluding the leader. Only holds lobbies whose members are loaded
+        self._members: dict[tuple[int, int], set[int]] = {}
+        # (guild_id, leader_id) -> when the lobby's members were loaded
+        self._members_loaded_at: dict[tuple[int, int], float] = {}
+        self.members_ttl_seconds = members_ttl_seconds
+        # (guild_id, member_id) -> (guild_id, leader_id) of the lobby they belong to
+        self._memberships: dict[tuple[int, int], tuple[int, int]] = {}
+        # (guild_id, member_id) -> leader ID of the lobby the API says they belong to, or None if they belong to none
+        self._lookups: Cache[tuple[int, int], int | None] = Cache(
+            "lobby_memberships", maxsize=4096, ttl=members_ttl_seconds, negative_ttl=members_ttl_seconds
+        )
+        # guild_id -> lobby category ID, or None if lobbies are not enabled
+        self._categories: Cache[int, int | None] = Cache(
+            "lobby_settings", maxsize=1024, ttl=settings_ttl_seconds, negative_ttl=settings_ttl_seconds
+        )
+
+        self._writes = WriteBehindQueue(API, "LOBBIES")
+        self.hydrated = False
+
+    def start(self):
+        """Start the background task that sends queued writes to the API."""
+        self._writes.start()
+
+    def stop(self):
+        self._writes.stop()
+
+    async def hydrate(self):
+        """Load every lobby from the API, replacing the current index."""
+        try:
+            lobbies = await asyncio.to_thread(API.get, "/lobbies/", model=Lobby)
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            lobbies = []
+
+        self._lobbies.clear()
+        self._voice_channels.clear()
+        self._members.clear()
+        self._members_loaded_at.clear()
+        self._memberships.clear()
+        self._lookups.clear()
+        for lobby in lobbies:
+            self.add(lobby.guild_id, lobby)
+
+        self.hydrated = True
+        self.logger.info("[LOBBIES] Loaded %s lobbies", len(self._lobbies))
+
+    async def get_lobby_category(self, guild_id: int) -> int | None:
+        """Get the ID of the category lobbies are created in, or None if lobbies are not enabled in the guild."""
+        return await self._categories.get_or_load(guild_id, lambda: asyncio.to_thread(self._fetch_category, guild_id))
+
+    @staticmethod
+    def _fetch_category(guild_id: int) -> int | None:
+        settings = API.get(f"/settings/{guild_id}", model=GuildSettings)
+        return (settings.lobby_category or None) if settings is not None else None
+
+    def add(self, guild_id: int, lobby: Lobby, members: list[int] | None = None) -> Lobby:
+        """Add or replace a lobby in the index. members can be given when they are already known, e.g. for a new
+        lobby."""
+        lobby.guild_id = guild_id
+        key = (guild_id, lobby.leader_id)
+        self.remove(*key)
+        self._lobbies[key] = lobby
+        self._voice_channels[lobby.voice_channel_id] = key
+        if members is not None:
+            self._members[key] = set()
+            self._members_loaded_at[key] = time.monotonic()
+            self.add_members(guild_id, lobby.leader_id, members)
+        return lobby
+
+    def remove(self, guild_id: int, leader_id: int) -> Lobby | None:
+        key = (guild_id, leader_id)
+        lobby = self._lobbies.pop(key, None)
+        if lobby is not None:
+            self._voice_channels.pop(lobby.voice_channel_id, None)
+        self._forget_members(key)
+        return lobby
+
+    def _forget_members(self, key: tuple[int, int]):
+        """Drop the loaded members of a lobby, so they are loaded again when next needed."""
+        self._members_loaded_at.pop(key, None)
+        for member_id in self._members.pop(key, ()):
+            if self._memberships.get((key[0], member_id)) == key:
+                del self._memberships[(key[0], member_id)]
+            self._lookups.invalidate((key[0], member_id))
+
+    def update(self, guild_id: int, leader_id: int, /, **changes) -> Lobby | None:
+        """Update fields of a lobby, given by their Lobby attribute names, re-indexing it if its leader changes."""
+        key = (guild_id, leader_id)
+        lobby = self._lobbies.get(key)
+        if lobby is None:
+            return None
+
+        new_leader_id = changes.get("leader_id", leader_id)
+        if new_leader_id == leader_id:
+            for name, value in changes.items():
+                setattr(lobby, name, value)
+            return lobby
+
+        # The new leader stops being a member and the old leader becomes one
+        members = self._members.pop(key, None)
+        loaded_at = self._members_loaded_at.pop(key, None)
+        self._lobbies.pop(key)
+        lobby = self.add(guild_id, dataclasses.replace(lobby, **changes))
+        new_key = (guild_id, new_leader_id)
+        self._memberships.pop((guild_id, new_leader_id), None)
+        self._memberships[(guild_id, leader_id)] = new_key
+        self._lookups.invalidate((guild_id, new_leader_id))
+        self._lookups.invalidate((guild_id, leader_id))
+        if members is not None:
+            members.discard(new_leader_id)
+            members.add(leader_id)
+            self._members[new_key] = members
+            self._members_loaded_at[new_key] = loaded_at
+            for member_id in members:
+                self._memberships[(guild_id, member_id)] = new_key
+        return lobby
+
+    def get(self, guild_id: int, leader_id: int) -> Lobby | None:
+        """Get the lobby led by a member."""
+        return self._lobbies.get((guild_id, leader_id))
+
+    def get_by_voice_channel(self, channel_id: int) -> Lobby | None:
+        key = self._voice_channels.get(channel_id)
+        return self._lobbies.get(key) if key is not None else None
+
+    def all(self) -> list[Lobby]:
+        return list(self._lobbies.values())
+
+    def get_members(self, guild_id: int, leader_id: int) -> list[int]:
+        """Get the members of a lobby, excluding its leader. Loaded from the API if they are not loaded or are out of
+        date."""
+        key = (guild_id, leader_id)
+        if not self._members_fresh(key):
+            self._forget_members(key)
+            try:
+                users = API.get(f"/lobby/{guild_id}/{leader_id}/users") or []
+            except HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                users = []
+
+            self._members[key] = {int(user) for user in users}
+            self._members_loaded_at[key] = time.monotonic()
+            for member_id in self._members[key]:
+                self._memberships[(guild_id, member_id)] = key
+
+        return list(self._members[key])
+
+    def add_members(self, guild_id: int, leader_id: int, member_ids: list[int]):
+        key = (guild_id, leader_id)
+        for member_id in member_ids:
+            self._memberships[(guild_id, member_id)] = key
+            self._lookups.invalidate((guild_id, member_id))
+            if key in self._members:
+                self._members[key].add(member_id)
+
+    def remove_member(self, guild_id: int, leader_id: int, member_id: int):
+        key = (guild_id, leader_id)
+        if self._memberships.get((guild_id, member_id)) == key:
+            del self._memberships[(guild_id, member_id)]
+            self._lookups.set((guild_id, member_id), None)
+        if key in self._members:
+            self._members[key].discard(member_id)
+
+    def resolve(self, member: discord.Member) -> MemberLobby | None:
+        """Resolve the lobby a member leads or belongs to, along with its members.
+
+        Served from memory where possible, otherwise at most one API read is made, whose result is cached.
+        """
+        guild_id = member.guild.id
+        key = (guild_id, member.id)
+        if key in self._lobbies:
+            return MemberLobby(self._lobbies[key], True, self.get_members(*key))
+
+        leader_key = self._memberships.get(key)
+        if leader_key is not None and not self._members_fresh(leader_key):
+            # Loaded long enough ago that the member may have left since
+            self._forget_members(leader_key)
+            leader_key = None
+        if leader_key not in self._lobbies and not self._guild_members_loaded(guild_id):
+            leader_id = self._lookups.get(key)
+            if leader_id is MISSING:
+                try:
+                    data = API.get(f"/lobbies/{guild_id}/{member.id}", model=Lobby)
+                except HTTPError as e:
+                    if e.response is None or e.response.status_code != 404:
+                        raise
+                    data = None
+
+                leader_id = data.leader_id if data else None
+                if data and (guild_id, leader_id) not in self._lobbies:
+                    self.add(guild_id, data)
+                if leader_id is not None:
+                    self.add_members(guild_id, leader_id, [member.id])
+                self._lookups.set(key, leader_id)
+
+            if leader_id is not None:
+                leader_key = (guild_id, leader_id)
+
+        if leader_key not in self._lobbies:
+            return None
+
+        members = self._members.get(leader_key)
+        return MemberLobby(self._lobbies[leader_key], False, list(members) if members is not None else [])
+
+    def _guild_members_loaded(self, guild_id: int) -> bool:
+        """Whether the members of every lobby in a guild are loaded and current, so a missing membership means no
+        lobby."""
+        return all(self._members_fresh(key) for key in self._lobbies if key[0] == guild_id)
+
+    def _members_fresh(self, key: tuple[int, int]) -> bool:
+        loaded_at = self._members_loaded_at.get(key)
+        return loaded_at is not None and time.monotonic() - loaded_at < self.members_ttl_seconds
+
+    @property
+    def pending_writes(self) -> int:
+        return len(self._writes)
+
+    def queue_write(self, method: str, route: str, body: object = None):
+        """Queue an API write to be sent in the background, in the order it was queued."""
+        self._writes.put(method, route, body)
+
+
+lobby_registry = LobbyRegistry()
+metrics.gauge(
+    "mocbot_lobby_pending_writes", "Lobby writes queued for the API", function=lambda: lobby_registry.pending_writes
+)
@@ -1,34 +1,102 @@
+import asyncio
 import random
 import logging
+import time
+from bisect import bisect_right
 from collections import deque
-from cachetools import TTLCache
+from itertools import accumulate
+from typing import Callable, Iterable
 from lavalink import DefaultPlayer, AudioTrack
+from lib.music.TrackStore import TrackStore
 from utils.APIHandler import ArchiveAPI
+from utils.Cache import MISSING, Cache
 from utils.Music import create_id, is_youtube_url
 
 
+class RecommendationWeights:
+    """Recommended artists for a guild with precomputed cumulative weights for sampling."""
+
+    __slots__ = ("artists", "cumulative", "fetched_at")
+
+    def __init__(self, artists: list[dict]):
+        self.artists: tuple[str, ...] = tuple(a["artist"] for a in artists)
+        self.cumulative: list[float] = list(accumulate(a["weight"] for a in artists))
+        self.fetched_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.artists)
+
+    def choose(self) -> str:
+        """Pick an artist at random, weighted by recommendation weight."""
+        return self.artists[bisect_right(self.cumulative, random.random() * self.cumulative[-1])]
+
+
 class AutoplayService:
     """Service to handle autoplaying recommended tracks based on artist recommendations."""
 
     def __init__(
         self,
+        track_store: TrackStore,
         cache_ttl_seconds: int = 15 * 60,
+        cache_size: int = 2048,
+        cache_max_bytes: int = 16 * 1024 * 1024,
+        refresh_interval_seconds: int = 60,
         discovery_probability: float = 0.15,
         artist_cooldown_size: int = 3,
         intent_buffer_size: int = 3,
     ):
         self.logger = logging.getLogger(__name__)
         self.node = None
+        self.track_store = track_store
 
         self.discovery_probability = discovery_probability
         self.artist_cooldown_size = artist_cooldown_size
         self.intent_buffer_size = intent_buffer_size
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.refresh_interval_seconds = refresh_interval_seconds
 
         # guild_id -> recommendations
-        self._cache = TTLCache(maxsize=128, ttl=cache_ttl_seconds)
+        # Guilds that are not playing are served stale recommendations while they are refreshed. Bounded by memory as
+        # well, as the number of artists recommended varies by guild
+        self._cache: Cache[int, RecommendationWeights] = Cache(
+            "autoplay_recommendations",
+            maxsize=cache_size,
+            ttl=cache_ttl_seconds,
+            stale_ttl=cache_ttl_seconds,
+            maxbytes=cache_max_bytes,
+        )
+        self._refresher: asyncio.Task | None = None
 
         self._intent_buffer: dict[int, deque[str]] = {}
 
+    def start_refresher(self, get_active_guild_ids: Callable[[], Iterable[int]]):
+        """Start the background task that refreshes recommendations for active guilds before they expire."""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop(get_active_guild_ids))
+            self._refresher.add_done_callback(self._log_refresher_exit)
+
+    def _log_refresher_exit(self, task: asyncio.Task):
+        # Only failures outside a single guild's refresh end the loop, and would otherwise go unnoticed
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error("Recommendation refresher stopped: %s", task.exception(), exc_info=task.exception())
+
+    async def _refresh_loop(self, get_active_guild_ids: Callable[[], Iterable[int]]):
+        """Periodically re-fetch recommendations for active guilds whose cache entry is close to expiring."""
+        # Refresh anything that would otherwise expire before the next two passes
+        refresh_age = max(0, self.cache_ttl_seconds - 2 * self.refresh_interval_seconds)
+        while True:
+            await asyncio.sleep(self.refresh_interval_seconds)
+            for guild_id in list(get_active_guild_ids()):
+                recommendations = self._cache.peek(guild_id)
+                if recommendations is not MISSING and time.monotonic() - recommendations.fetched_at < refresh_age:
+                    continue
+
+                try:
+                    await self._load_recommendations(guild_id)
+                    await self.ensure_intent_buffer(guild_id)
+                except Exception:
+                    self.logger.exception("Failed to refresh recommendations for guild %s", guild_id)
+
     def set_node(self, player: DefaultPlayer):
         """Set the Lavalink node to use for track searches."""
         self.node = player.node
@@ -77,7 +145,9 @@ class AutoplayService:
 
         if not is_youtube_url(track.uri):
             # Using YouTube Music provides better related songs
-            youtube_res = await self.node.get_tracks(f"ytmsearch:{track.title} {track.author}")
+            youtube_res = await self.track_store.get_tracks(
+                f"ytmsearch:{track.title} {track.author}", self.node.get_tracks
+            )
             if not youtube_res or not youtube_res.tracks:
                 self.logger.error("Failed to find YouTube version of track: %s", track.title)
                 return None
@@ -85,7 +155,7 @@ class AutoplayService:
 
         # Get related tracks from YouTube mix
         mix_url = track.uri + f"&list=RD{track.identifier}"
-        results = await self.node.get_tracks(mix_url)
+        results = await self.track_store.get_tracks(mix_url, self.node.get_tracks)
 
         if not results or not results.tracks or len(results.tracks) < 2:
             self.logger.error("Failed to find related tracks for: %s", track.title)
@@ -105,11 +175,14 @@ class AutoplayService:
 
     async def ensure_intent_buffer(self, guild_id: int):
         """Ensure the intent buffer is filled for the guild."""
+        buffer = self._intent_buffer.get(guild_id)
+        if buffer is not None and len(buffer) == buffer.maxlen:
+            return None
+
         artists = await self._get_recommendations(guild_id)
         if not artists:
             return None
 
-        buffer = self._intent_buffer.get(guild_id)
         if buffer is None:
             buffer = deque(maxlen=self.intent_buffer_size)
             self._intent_buffer[guild_id] = buffer
@@ -120,19 +193,20 @@ class AutoplayService:
 
     async def refresh_intent_buffer(self, guild_id: int):
         """Refresh recommendation cache and rebuild the guild's intent buffer."""
-        self._cache.pop(guild_id, None)
+        await self._load_recommendations(guild_id)
         self._intent_buffer.pop(guild_id, None)
         await self.ensure_intent_buffer(guild_id)
 
     async def sample_recommended_artists(self, guild_id: int, count: int, refresh: bool = False) -> list[str]:
         """Sample weighted recommended artists for a guild.
-        This is intended for features that need recommendations on-demand.
+        This is intended for features that need recommendations on-demand. When refresh is set and the guild
+        already has cached recommendations, they are served immediately and refreshed in the background.
         """
         if count <= 0:
             return []
 
-        if refresh:
-            self._cache.pop(guild_id, None)
+        if refresh and guild_id in self._cache:
+            asyncio.create_task(self._load_recommendations(guild_id))
 
         artists = await self._get_recommendations(guild_id)
         if not artists:
@@ -153,7 +227,7 @@ class AutoplayService:
             picked.append(artist)
 
         if len(picked) < count:
-            for artist in [a["artist"] for a in artists]:
+            for artist in artists.artists:
                 if artist in seen:
                     continue
                 picked.append(artist)
@@ -162,38 +236,26 @@ class AutoplayService:
 
         return picked
 
-    async def _get_recommendations(self, guild_id: int) -> list[dict]:
-        if guild_id not in self._cache:
-            raw_recommendations = await self._fetch_recommendations(guild_id)
-            self._cache[guild_id] = self._normalise_weights(raw_recommendations.get("recommended_artists", []))
-        return self._cache[guild_id]
-
-    async def _fetch_recommendations(self, guild_id: int) -> dict:
-        return ArchiveAPI.get(f"/guilds/{guild_id}/artists/recommended")
+    async def _get_recommendations(self, guild_id: int) -> RecommendationWeights:
+        return await self._cache.get_or_load(guild_id, lambda: self._fetch_recommendations(guild_id))
 
-    def _normalise_weights(self, artists: list[dict]) -> list[dict]:
-        total = sum(a["weight"] for a in artists)
-        if total <= 0:
-            return []
+    async def _load_recommendations(self, guild_id: int) -> RecommendationWeights:
+        """Fetch recommendations for a guild and cache them, sharing any fetch already in progress."""
+        return await self._cache.refresh(guild_id, lambda: self._fetch_recommendations(guild_id))
 
-        return [
-            {
-                "artist": a["artist"],
-                "p": a["weight"] / total,
-            }
-            for a in artists
-        ]
+    async def _fetch_recommendations(self, guild_id: int) -> RecommendationWeights:
+        raw_recommendations = await asyncio.to_thread(ArchiveAPI.get, f"/guilds/{guild_id}/artists/recommended")
+        return self._normalise_weights(raw_recommendations.get("recommended_artists", []))
 
-    def _choose_artist(self, artists: list[dict]) -> str:
-        choices = [a["artist"] for a in artists]
-        weights = [a["p"] for a in artists]
+    def _normalise_weights(self, artists: list[dict]) -> RecommendationWeights:
+        return RecommendationWeights([a for a in artists if a["weight"] > 0])
 
-        artist = random.choices(choices, weights=weights, k=1)[0]
-        return artist
+    def _choose_artist(self, artists: RecommendationWeights) -> str:
+        return artists.choose()
 
     async def _search_track(self, query: str):
         # Using YouTube Music provides better related songs
-        results = await self.node.get_tracks(f"ytmsearch:{query}")
+        results = await self.track_store.get_tracks(f"ytmsearch:{query}", self.node.get_tracks)
 
         if not results or not results.tracks:
             return None
@@ -4,6 +4,7 @@ from lavalink.events import TrackEndEvent, TrackStartEvent
 from lavalink import DefaultPlayer
 
 from lib.music.Types import TrackInfo, PlayerStopped, TrackStarted
+from utils.Metrics import metrics
 
 EventName = Literal[
     "player_stopped",
@@ -22,6 +23,11 @@ QueueUpdatePayload = List[Dict[str, Any]]
 
 logger = logging.getLogger(__name__)
 
+EVENTS_EMITTED = metrics.counter("mocbot_music_events_total", "Music events emitted, by event", ["event"])
+LISTENER_ERRORS = metrics.counter(
+    "mocbot_music_listener_errors_total", "Music event listeners that raised, by event", ["event"]
+)
+
 
 class EventEmitter:
     """An event emitter for handling music-related events."""
@@ -54,10 +60,12 @@ class EventEmitter:
                        int],
     ) -> None:
         """Emit an event, calling all registered listeners with the provided payload."""
+        EVENTS_EMITTED.inc(event=event)
         for cb in self._listeners.get(event, []):
             try:
                 await cb(payload)
             except Exception:
+                LISTENER_ERRORS.inc(event=event)
                 logger.exception(
                     "Unhandled exception in music event listener",
                     extra={
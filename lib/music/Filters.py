@@ -1,7 +1,9 @@
-from typing import Callable, Awaitable, TYPE_CHECKING
+from itertools import combinations
+from typing import Any, TYPE_CHECKING
 import asyncio
 import discord
 from lavalink.filters import (
+    Filter as LavalinkFilter,
     LowPass,
     Rotation,
     Timescale,
@@ -15,19 +17,17 @@ from lavalink import DefaultPlayer
 if TYPE_CHECKING:
     from lib.music.MusicService import MusicService
 
+FilterSettings = dict[type[LavalinkFilter], dict[str, Any]]
+
 
 class Filter:
-    """Represents a single audio filter with its metadata and application logic."""
+    """Represents a single audio filter preset with its metadata and the Lavalink filter settings it applies."""
 
-    def __init__(self, name: str, label: str, description: str, apply_func: Callable[[DefaultPlayer], Awaitable[None]]):
+    def __init__(self, name: str, label: str, description: str, settings: FilterSettings):
         self.name = name
         self.label = label
         self.description = description
-        self.apply_func = apply_func
-
-    async def apply(self, player: DefaultPlayer) -> None:
-        """Apply this filter to the player."""
-        await self.apply_func(player)
+        self.settings = settings
 
     def to_select_option(self, player: DefaultPlayer) -> discord.SelectOption:
         """Convert this filter to a Discord SelectOption."""
@@ -40,88 +40,91 @@ class Filter:
 
 
 class FilterManager:
-    """Centralized manager for all audio filters."""
+    """Centralized manager for all audio filters.
+
+    Selected presets are merged into a single set of Lavalink filters so they can be applied in one player update.
+    When two presets set the same Lavalink filter, they are merged as follows:
+    - Timescale: speed, pitch and rate are multiplied together
+    - Equalizer: gains for the same band are summed, clamped to the range Lavalink accepts
+    - Anything else: presets registered later override the values of earlier ones
+    """
+
+    EQUALIZER_GAIN_RANGE = (-0.25, 1.0)
 
     def __init__(self):
         self._filters: dict[str, Filter] = {}
+        self._combined: dict[frozenset[str], tuple[LavalinkFilter, ...]] = {}
         self._register_default_filters()
+        self._precompute_combinations()
 
     def _register_default_filters(self):
         """Register all default filters."""
-
-        def _set_player_filter_property(player: DefaultPlayer, filter_name: str):
-            """Helper to set a filter property on the player."""
-            filters = player.fetch("filters", [])
-            player.store("filters", filters + [filter_name])
-
-        async def low_pass_apply(player: DefaultPlayer):
-            """Applies a low pass filter to the player."""
-            lp_filter = LowPass()
-            lp_filter.update(smoothing=50)
-            await player.set_filter(lp_filter)
-            _set_player_filter_property(player, "low_pass")
-
-        async def eight_d_apply(player: DefaultPlayer):
-            """Applies an 8D audio filter to the player."""
-            eight_d_filter = Rotation()
-            eight_d_filter.update(rotation_hz=0.2)
-            await player.set_filter(eight_d_filter)
-            _set_player_filter_property(player, "eight_d")
-
-        async def nightcore_apply(player: DefaultPlayer):
-            """Applies a nightcore filter to the player."""
-            nightcore_filter = Timescale()
-            nightcore_filter.update(speed=1.2, pitch=1.2, rate=1)
-            await player.set_filter(nightcore_filter)
-            _set_player_filter_property(player, "nightcore")
-
-        async def vibrato_apply(player: DefaultPlayer):
-            """Applies a vibrato filter to the player."""
-            vibrato_filter = Vibrato()
-            vibrato_filter.update(depth=1, frequency=10)
-            await player.set_filter(vibrato_filter)
-            _set_player_filter_property(player, "vibrato")
-
-        async def karaoke_apply(player: DefaultPlayer):
-            """Applies a karaoke filter to the player."""
-            karaoke_filter = Karaoke()
-            karaoke_filter.update(level=0.6, mono_level=0.95)
-            await player.set_filter(karaoke_filter)
-            _set_player_filter_property(player, "karaoke")
-
-        async def bass_boost_apply(player: DefaultPlayer):
-            """Applies a bass boost filter to the player."""
-            bb_filter = Equalizer()
-            bb_filter.update(bands=[(0, 0.2), (1, 0.2), (2, 0.2)])
-            await player.set_filter(bb_filter)
-            _set_player_filter_property(player, "bass_boost")
-
-        async def vapor_wave_apply(player: DefaultPlayer):
-            """Applies a vaporwave filter to the player."""
-            vw_filter = Equalizer()
-            vw_filter.update(bands=[(1, 0.3), (0, 0.3)])
-            timescale_filter = Timescale()
-            timescale_filter.update(pitch=0.7)
-            tremolo_filter = Tremolo()
-            tremolo_filter.update(depth=0.3, frequency=14)
-            await player.set_filter(vw_filter)
-            await player.set_filter(timescale_filter)
-            await player.set_filter(tremolo_filter)
-            _set_player_filter_property(player, "vapor_wave")
-
         filters_to_register = [
-            Filter("nightcore", "Nightcore", "Speeds up and raises the pitch of the song.", nightcore_apply),
-            Filter("vapor_wave", "Vaporwave", "Time to chill out.", vapor_wave_apply),
-            Filter("eight_d", "8D Audio", "I'm in your head.", eight_d_apply),
-            Filter("vibrato", "Vibrato", "Adds a 'wobbly' effect.", vibrato_apply),
-            Filter("low_pass", "Low Pass", "Club next door too loud?", low_pass_apply),
-            Filter("karaoke", "Karaoke", "Having a karaoke night?", karaoke_apply),
-            Filter("bass_boost", "Bass Boost", "Bass boosts the song.", bass_boost_apply),
+            Filter("nightcore", "Nightcore", "Speeds up and raises the pitch of the song.", {
+                Timescale: {"speed": 1.2, "pitch": 1.2, "rate": 1},
+            }),
+            Filter("vapor_wave", "Vaporwave", "Time to chill out.", {
+                Equalizer: {"bands": [(1, 0.3), (0, 0.3)]},
+                Timescale: {"pitch": 0.7},
+                Tremolo: {"depth": 0.3, "frequency": 14},
+            }),
+            Filter("eight_d", "8D Audio", "I'm in your head.", {
+                Rotation: {"rotation_hz": 0.2},
+            }),
+            Filter("vibrato", "Vibrato", "Adds a 'wobbly' effect.", {
+                Vibrato: {"depth": 1, "frequency": 10},
+            }),
+            Filter("low_pass", "Low Pass", "Club next door too loud?", {
+                LowPass: {"smoothing": 50},
+            }),
+            Filter("karaoke", "Karaoke", "Having a karaoke night?", {
+                Karaoke: {"level": 0.6, "mono_level": 0.95},
+            }),
+            Filter("bass_boost", "Bass Boost", "Bass boosts the song.", {
+                Equalizer: {"bands": [(0, 0.2), (1, 0.2), (2, 0.2)]},
+            }),
         ]
 
         for filter_obj in filters_to_register:
             self._filters[filter_obj.name] = filter_obj
 
+    def _precompute_combinations(self):
+        """Build the combined Lavalink filters for every combination of registered presets."""
+        names = list(self._filters)
+        for size in range(len(names) + 1):
+            for combination in combinations(names, size):
+                self._combined[frozenset(combination)] = self._combine(combination)
+
+    def _combine(self, filter_names: tuple[str, ...]) -> tuple[LavalinkFilter, ...]:
+        """Merge the settings of the given presets into one Lavalink filter per filter type."""
+        merged: FilterSettings = {}
+        # Merge in registration order so the result does not depend on the order filters were selected in
+        for filter_obj in self._filters.values():
+            if filter_obj.name not in filter_names:
+                continue
+
+            for filter_type, values in filter_obj.settings.items():
+                current = merged.setdefault(filter_type, {})
+                if filter_type is Timescale:
+                    for key, value in values.items():
+                        current[key] = current.get(key, 1.0) * value
+                elif filter_type is Equalizer:
+                    low, high = self.EQUALIZER_GAIN_RANGE
+                    gains = dict(current.get("bands", []))
+                    for band, gain in values["bands"]:
+                        gains[band] = min(high, max(low, gains.get(band, 0.0) + gain))
+                    current["bands"] = sorted(gains.items())
+                else:
+                    current.update(values)
+
+        combined = []
+        for filter_type, values in merged.items():
+            lavalink_filter = filter_type()
+            lavalink_filter.update(**values)
+            combined.append(lavalink_filter)
+
+        return tuple(combined)
+
     def get_filter(self, name: str) -> Filter | None:
         """Get a filter by name."""
         return self._filters.get(name)
@@ -130,16 +133,26 @@ class FilterManager:
         """Get Discord SelectOptions for all filters."""
         return [filter_obj.to_select_option(player) for filter_obj in self._filters.values()]
 
+    def get_combined_filters(self, filter_names: list[str]) -> tuple[LavalinkFilter, ...]:
+        """Get the precomputed Lavalink filters for a selection of presets. Unknown names are ignored."""
+        key = frozenset(name for name in filter_names if name in self._filters)
+        return self._combined[key]
+
     async def apply_filters(self, player: DefaultPlayer, filter_names: list[str]) -> list[str]:
-        """Apply multiple filters to a player. Returns list of invalid filter names."""
+        """Replace the player's filters with the given presets in a single update. Returns list of invalid filter
+        names."""
+        valid_filters = []
         invalid_filters = []
         for filter_name in filter_names:
-            filter_obj = self.get_filter(filter_name)
-            if filter_obj:
-                await filter_obj.apply(player)
+            if filter_name in self._filters:
+                if filter_name not in valid_filters:
+                    valid_filters.append(filter_name)
             else:
                 invalid_filters.append(filter_name)
 
+        await player.set_filters(*self.get_combined_filters(valid_filters), replace=True)
+        player.store("filters", valid_filters)
+
         return invalid_filters
 
     def create_dropdown_view(self, service: "MusicService", interaction: discord.Interaction) -> "FilterDropdownView":
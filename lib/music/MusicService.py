@@ -5,15 +5,17 @@ import os
 import re
 from typing import TYPE_CHECKING, Union
 
-from ytmusicapi import YTMusic
 import lavalink
 from lavalink import DefaultPlayer, LoadType, listener, LoadResult, AudioTrack
 from lavalink.events import TrackStartEvent, QueueEndEvent, TrackEndEvent, PlayerUpdateEvent
 
 from utils.APIHandler import ArchiveAPI
 from utils.ConfigHandler import Config
+from utils.Metrics import metrics
 from utils.Music import queue_length_msg, format_duration, create_id
 from lib.music.AutoplayService import AutoplayService
+from lib.music.VibePoolService import VibePoolService
+from lib.music.TrackStore import TrackStore
 from lib.music.Decorators import event_handler
 from lib.music.Lavalink import LavalinkVoiceClient
 from lib.music.Filters import filter_manager
@@ -35,28 +37,6 @@ from lib.music.Types import (
     RewindOrFFResponse,
 )
 
-VIBE_PLAYLIST_URLS = {
-    "chill": [
-        "https://www.youtube.com/playlist?list=PLgzTt0k8mXzEpH7-dOCHqRZOsakqXmzmG",
-        "https://www.youtube.com/playlist?list=PL4QNnZJr8sRPmuz_d87ygGR6YAYEF-fmw",
-    ],
-    "upbeat": [
-        "https://www.youtube.com/playlist?list=PLlplKg2KQ6rgi0Mom4KTTrURNIw6e_uxl",
-    ],
-    "trending": [
-        "https://www.youtube.com/playlist?list=PLHg022HMFzFCJNn0WN7UM0_0uY109bcv2",
-    ],
-    "throwback": [
-        "https://www.youtube.com/playlist?list=PLz8cxnYPx0tkfCi6drRRKALyIl2sJjEwq",
-        "https://www.youtube.com/playlist?list=PL4C44E2875308A280",
-    ],
-    "sad": [
-        "https://www.youtube.com/playlist?list=PL5D7fjEEs5yflZzSZAhxfgQmN6C_6UJ1W",
-    ],
-    "metal": [
-        "https://www.youtube.com/playlist?list=PLI_7Mg2Z_-4ILvVfREVnSZ6yIFKLeLaLQ",
-    ],
-}
 VIBE_MAX_TRACK_DURATION: int = 5 * 60 * 1000  # 5 minutes - to avoid long playlist tracks
 
 if TYPE_CHECKING:
@@ -74,6 +54,9 @@ class MusicService:
             "max_history": 30,
             "seek_time": 15000,  # in milliseconds
             "volume": 10,
+            "max_queue_size": 2500,
+            "ingest_chunk_size": 100,
+            "ingest_update_interval": 2,  # in seconds
         }
 
         with open(os.environ["LAVALINK_PASSWORD"], "r", encoding="utf-8") as f:
@@ -89,9 +72,64 @@ class MusicService:
         )
         self.lavalink.add_event_hooks(self)
 
-        self.autoplay_service = AutoplayService()
+        track_store_config = Config.fetch().get("TRACK_STORE", {})
+        self.track_store = TrackStore(
+            track_store_config.get("PATH", "data/tracks.sqlite3"),
+            max_bytes=track_store_config.get("MAX_SIZE_MB", 256) * 1024 * 1024,
+        )
+
+        self.autoplay_service = AutoplayService(self.track_store)
+        self.autoplay_service.start_refresher(lambda: self.lavalink.player_manager.players.keys())
+        self.vibe_pool = VibePoolService(lambda url: self.search(url, cached=False), self._filter_vibe_candidates)
+        self.vibe_pool.start()
         self.emitter.on("player_stopped", self.end_session)
         self.sessions = {}
+        # guild_id -> background tasks still appending playlist tracks to the queue
+        self._ingest_tasks: dict[int, set[asyncio.Task]] = {}
+        self._register_metrics()
+
+    def _register_metrics(self):
+        """Report Lavalink node stats and queue sizes, read when metrics are scraped."""
+        nodes = self.lavalink.node_manager.nodes
+        metrics.gauge(
+            "mocbot_lavalink_node_available", "Whether each Lavalink node is connected", ["node"],
+            function=lambda: [((node.name,), int(node.available)) for node in nodes],
+        )
+        metrics.gauge(
+            "mocbot_lavalink_players", "Players on each Lavalink node, by whether they are playing", ["node", "state"],
+            function=lambda: [
+                sample
+                for node in nodes
+                for sample in (((node.name, "total"), node.stats.players),
+                               ((node.name, "playing"), node.stats.playing_players))
+            ],
+        )
+        metrics.gauge(
+            "mocbot_lavalink_cpu_load", "CPU load of each Lavalink node, system wide and of Lavalink itself",
+            ["node", "kind"],
+            function=lambda: [
+                sample
+                for node in nodes
+                for sample in (((node.name, "system"), node.stats.system_load),
+                               ((node.name, "lavalink"), node.stats.lavalink_load))
+            ],
+        )
+        metrics.gauge(
+            "mocbot_lavalink_memory_used_bytes", "Memory used by each Lavalink node", ["node"],
+            function=lambda: [((node.name,), node.stats.memory_used) for node in nodes],
+        )
+        metrics.gauge(
+            "mocbot_lavalink_penalty", "Load balancing penalty of each Lavalink node", ["node"],
+            function=lambda: [((node.name,), node.stats.penalty.total) for node in nodes],
+        )
+        metrics.gauge(
+            "mocbot_music_queued_tracks", "Tracks queued across all players",
+            function=lambda: sum(len(player.queue) for player in self.lavalink.player_manager.players.values()),
+        )
+        metrics.gauge(
+            "mocbot_music_ingest_tasks", "Background tasks still adding playlist tracks to queues",
+            function=lambda: sum(len(tasks) for tasks in self._ingest_tasks.values()),
+        )
 
     async def ensure_voice(self, guild_id: int, user_id: int, should_connect: bool = False) -> DefaultPlayer:
         """Ensure the bot is connected to a voice channel and return the player."""
@@ -163,6 +201,8 @@ class MusicService:
         if guild_id is None:
             return
 
+        self._cancel_ingest(guild_id)
+
         session_id = self.sessions.get(guild_id)
         if session_id is None:
             return
@@ -345,7 +385,7 @@ class MusicService:
                 raise UserError(f"Invalid index. {queue_length_msg(len(player.queue))}")
 
         query, original_query = self._prepare_query(query)
-        results = await player.node.get_tracks(query)
+        results = await self.track_store.get_tracks(query, player.node.get_tracks)
 
         if not results or not results.tracks:
             raise UserError(f"No media matching the search query `{original_query}` was found")
@@ -355,20 +395,30 @@ class MusicService:
         if results.load_type != LoadType.PLAYLIST:
             results.tracks = [results.tracks[0]]
 
-        for track in results.tracks:
-            track.extra["id"] = create_id()
-            player.add(requester=user_id, track=track, index=index)
+        tracks = results.tracks[: self._queue_capacity(player)]
+        if not tracks:
+            raise UserError(f"The queue is full. {queue_length_msg(len(player.queue))}")
+
+        # Only the first track is queued before playback starts, the rest of a playlist is appended in the background
+        first_track, remaining_tracks = tracks[:1], tracks[1:]
+        self._add_tracks(player, user_id, first_track, index)
 
         is_playing = await self._finalize_playback(player, handle_new_player)
 
-        res = {"queue_position": index + 1 if index is not None else len(player.queue),
-               "track": results.tracks[-1],
+        if remaining_tracks:
+            self._start_ingest(
+                player, user_id, remaining_tracks, index=index + len(first_track) if index is not None else None
+            )
+
+        res = {"queue_position": index + 1 if index is not None else len(player.queue) + len(remaining_tracks),
+               "track": tracks[-1],
                "was_playing": is_playing}
 
         if results.load_type == LoadType.PLAYLIST:
             res["playlist_name"] = results.playlist_info.name
-            res["playlist_length"] = len(results.tracks)
+            res["playlist_length"] = len(tracks)
             res["playlist_url"] = original_query
+            res["playlist_truncated"] = len(results.tracks) - len(tracks)
 
         return res
 
@@ -394,7 +444,7 @@ class MusicService:
 
         for query in initial_queries:
             query, _ = self._prepare_query(query)
-            results = await player.node.get_tracks(query)
+            results = await self.track_store.get_tracks(query, player.node.get_tracks)
 
             if not results or not results.tracks:
                 failed_count += 1
@@ -403,11 +453,7 @@ class MusicService:
             if results.load_type != LoadType.PLAYLIST:
                 results.tracks = [results.tracks[0]]
 
-            for track in results.tracks:
-                track.extra["id"] = create_id()
-                player.add(requester=user_id, track=track)
-                total_tracks += 1
-
+            total_tracks += self._add_tracks(player, user_id, results.tracks)
             last_results = results
 
         is_playing = await self._finalize_playback(player, handle_new_player)
@@ -427,7 +473,7 @@ class MusicService:
         failed = 0
         for query in queries:
             query, _ = self._prepare_query(query)
-            results = await player.node.get_tracks(query)
+            results = await self.track_store.get_tracks(query, player.node.get_tracks)
 
             if not results or not results.tracks:
                 failed += 1
@@ -436,15 +482,71 @@ class MusicService:
             if results.load_type != LoadType.PLAYLIST:
                 results.tracks = [results.tracks[0]]
 
-            for track in results.tracks:
-                track.extra["id"] = create_id()
-                player.add(requester=user_id, track=track)
+            if not self._add_tracks(player, user_id, results.tracks):
+                break
 
         asyncio.create_task(self.emitter.emit("queue_update", player))
 
-    async def search(self, query: str) -> LoadResult | None:
-        """Search for tracks based on a query or URL."""
-        results = await self.lavalink.get_tracks(query)
+    def _queue_capacity(self, player: DefaultPlayer) -> int:
+        """Get the number of tracks that can still be added to the player's queue."""
+        return max(0, self.player_defaults["max_queue_size"] - len(player.queue))
+
+    def _add_tracks(self, player: DefaultPlayer, user_id: int, tracks: list[AudioTrack], index: int = None) -> int:
+        """Add tracks to the queue, up to the queue size cap. Returns the number of tracks added."""
+        tracks = tracks[: self._queue_capacity(player)]
+        for offset, track in enumerate(tracks):
+            track.extra["id"] = create_id()
+            player.add(requester=user_id, track=track, index=index + offset if index is not None else None)
+
+        return len(tracks)
+
+    def _start_ingest(self, player: DefaultPlayer, user_id: int, tracks: list[AudioTrack], index: int = None):
+        """Start appending tracks to the queue in the background."""
+        task = asyncio.create_task(self._ingest_tracks(player, user_id, tracks, index))
+        tasks = self._ingest_tasks.setdefault(player.guild_id, set())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def _cancel_ingest(self, guild_id: int):
+        """Cancel any background track ingestion for a guild."""
+        for task in self._ingest_tasks.pop(guild_id, set()):
+            task.cancel()
+
+    async def _ingest_tracks(self, player: DefaultPlayer, user_id: int, tracks: list[AudioTrack], index: int = None):
+        """Background task to add tracks to the queue in chunks, yielding to the event loop between chunks
+        and emitting queue updates at most once per ingest_update_interval."""
+        loop = asyncio.get_running_loop()
+        chunk_size = self.player_defaults["ingest_chunk_size"]
+        last_update = loop.time()
+
+        for start in range(0, len(tracks), chunk_size):
+            # Stop if the player was destroyed while we were ingesting
+            if self.get_player_by_guild(player.guild_id) is not player:
+                return
+
+            chunk = tracks[start : start + chunk_size]
+            added = self._add_tracks(player, user_id, chunk, index)
+            if index is not None:
+                index += added
+            if added < len(chunk):
+                self.logger.warning("[MUSIC] [%s] Queue size cap reached while adding a playlist", player.guild_id)
+                break
+
+            if loop.time() - last_update >= self.player_defaults["ingest_update_interval"]:
+                last_update = loop.time()
+                asyncio.create_task(self.emitter.emit("queue_update", player))
+
+            await asyncio.sleep(0)
+
+        asyncio.create_task(self.emitter.emit("queue_update", player))
+
+    async def search(self, query: str, cached: bool = True) -> LoadResult | None:
+        """Search for tracks based on a query or URL. cached=False bypasses the track store, for callers that
+        need a fresh result."""
+        if cached:
+            results = await self.track_store.get_tracks(query, self.lavalink.get_tracks)
+        else:
+            results = await self.lavalink.get_tracks(query)
         if not results or not results.tracks:
             return None
 
@@ -532,6 +634,7 @@ class MusicService:
         if not disconnect and not player.is_playing:
             raise UserError("MOCBOT is not playing any music.")
 
+        self._cancel_ingest(guild_id)
         player.queue.clear()
         # reset custom stored values
         player.store("recently_played", [])
@@ -650,6 +753,7 @@ class MusicService:
         if not player.queue or len(player.queue) == 0:
             raise UserError("The queue is already empty.")
 
+        self._cancel_ingest(guild_id)
         player.queue.clear()
         asyncio.create_task(self.emitter.emit("queue_update", player))
 
@@ -747,9 +851,6 @@ class MusicService:
         """Apply audio filters to the current player."""
         player = await self.ensure_voice(guild_id, user_id)
 
-        await player.clear_filters()
-        player.store("filters", [])
-
         invalid_filters = await filter_manager.apply_filters(player, filters)
         if invalid_filters:
             raise UserError(f"Invalid filters specified: {', '.join(invalid_filters)}")
@@ -767,6 +868,9 @@ class MusicService:
 
         err_msg = f"No lyrics found for {f'`{query}`' if query is not None else 'the current track'}."
 
+        # ytmusicapi is only needed for lyrics, so it is imported on first use to keep startup fast
+        from ytmusicapi import YTMusic
+
         ytmusic = YTMusic()
 
         search = query if query else f"{player.current.title} - {player.current.author}"
@@ -819,50 +923,41 @@ class MusicService:
         tracks: int = 5,
     ) -> tuple[list[str], list[str]]:
         """Build a randomized vibe selection and return (selected_track_uris, recommended_artists)."""
-        recommended_artists: list[str] = []
-        candidate_uris: list[str] = []
-
-        if mode == "recommended":
-            recommended_artists = await self.get_recommended_artists(
-                guild_id=guild_id,
-                user_id=user_id,
-                count=10,
-                refresh=True,
-            )
+        if mode != "recommended":
+            # Vibe modes are served from the warm playlist pool
+            return await self.vibe_pool.sample(mode, tracks), []
 
-            if not recommended_artists:
-                raise UserError(
-                    "No recommendations are available yet. Play some songs and try again."
-                )
+        candidate_uris: list[str] = []
+        recommended_artists = await self.get_recommended_artists(
+            guild_id=guild_id,
+            user_id=user_id,
+            count=10,
+            refresh=True,
+        )
 
-            selected_artists = random.sample(recommended_artists, k=min(tracks, len(recommended_artists)))
-            artist_queries = [self._prepare_query(artist)[0] for artist in selected_artists]
-            search_results = await asyncio.gather(
-                *(self.search(query) for query in artist_queries),
-                return_exceptions=True,
+        if not recommended_artists:
+            raise UserError(
+                "No recommendations are available yet. Play some songs and try again."
             )
 
-            for results in search_results:
-                if isinstance(results, Exception):
-                    self.logger.warning("[MUSIC] [%s] Failed to fetch a vibe artist result: %s", guild_id, results)
-                    continue
-                if not results or not results.tracks:
-                    continue
-
-                candidates = self._filter_vibe_candidates(results)
-                random_candidate = random.choice(candidates) if candidates else None
-                if random_candidate:
-                    candidate_uris.append(random_candidate.uri)
-        else:
-            mode_playlists = VIBE_PLAYLIST_URLS.get(mode, [])
-            if not mode_playlists:
-                return [], recommended_artists
+        selected_artists = random.sample(recommended_artists, k=min(tracks, len(recommended_artists)))
+        artist_queries = [self._prepare_query(artist)[0] for artist in selected_artists]
+        search_results = await asyncio.gather(
+            *(self.search(query) for query in artist_queries),
+            return_exceptions=True,
+        )
 
-            results = await self.search(random.choice(mode_playlists))
+        for results in search_results:
+            if isinstance(results, Exception):
+                self.logger.warning("[MUSIC] [%s] Failed to fetch a vibe artist result: %s", guild_id, results)
+                continue
             if not results or not results.tracks:
-                return [], recommended_artists
+                continue
 
-            candidate_uris = [track.uri for track in self._filter_vibe_candidates(results)]
+            candidates = self._filter_vibe_candidates(results)
+            random_candidate = random.choice(candidates) if candidates else None
+            if random_candidate:
+                candidate_uris.append(random_candidate.uri)
 
         if not candidate_uris:
             return [], recommended_artists
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Awaitable, Callable
+
+from lavalink import AudioTrack, LoadResult, LoadType
+
+from utils.Metrics import record_cache_lookup
+
+YOUTUBE_VIDEO_ID = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/)([\w\-]{11})")
+SEARCH_PREFIX = re.compile(r"^\w+search:", re.IGNORECASE)
+# Identifiers looked up per query when counting which tracks are new, below SQLite's limit on query parameters
+LOOKUP_CHUNK_SIZE = 500
+
+
+class TrackStore:
+    """Persistent on-disk store of Lavalink lookups, shared by the music services.
+
+    Holds normalised query -> load result and track identifier -> track data in SQLite, so hot queries survive
+    restarts and are shared across guilds. Query results expire after query_ttl_seconds, and both tables are
+    bounded, evicting the least recently used rows first.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_tracks: int = 200_000,
+        query_ttl_seconds: int = 24 * 60 * 60,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_tracks = max_tracks
+        self.query_ttl_seconds = query_ttl_seconds
+
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._size = 0
+        self._track_count = 0
+
+        try:
+            self._open()
+        except (OSError, sqlite3.Error) as e:
+            self.logger.error("[TRACK STORE] Could not open %s, lookups will not be persisted: %s", path, e)
+            self._db = None
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queries "
+            "(query TEXT PRIMARY KEY, result BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tracks "
+            "(identifier TEXT PRIMARY KEY, track TEXT NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS queries_accessed ON queries (accessed_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS tracks_accessed ON tracks (accessed_at)")
+
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM queries").fetchone()[0]
+        self._track_count = self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    @staticmethod
+    def normalise_query(query: str) -> str:
+        """Normalise a query so equivalent searches share an entry. URLs are left untouched as they are case
+        sensitive."""
+        query = " ".join(query.split())
+        if SEARCH_PREFIX.match(query):
+            return query.lower()
+        return query
+
+    async def get_tracks(self, query: str, load: Callable[[str], Awaitable[LoadResult]]) -> LoadResult:
+        """Get the load result for a query from the store, falling back to load and storing its result."""
+        cached = await self.get(query)
+        record_cache_lookup("track_store", cached is not None)
+        if cached is not None:
+            return cached
+
+        result = await load(query)
+        if result and result.tracks and result.load_type != LoadType.ERROR:
+            await self.put(query, result)
+
+        return result
+
+    async def get(self, query: str) -> LoadResult | None:
+        """Get a stored load result for a query, or None if it is not stored."""
+        if self._db is None:
+            return None
+        return await asyncio.to_thread(self._get, self.normalise_query(query))
+
+    async def put(self, query: str, result: LoadResult):
+        """Store the load result for a query, and the data of each of its tracks."""
+        if self._db is None:
+            return
+        await asyncio.to_thread(self._put, self.normalise_query(query), result)
+
+    def get_track(self, identifier: str) -> AudioTrack | None:
+        """Get a stored track by its source identifier."""
+        if self._db is None:
+            return None
+
+        with self._lock:
+            row = self._db.execute("SELECT track FROM tracks WHERE identifier = ?", (identifier,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE tracks SET accessed_at = ? WHERE identifier = ?", (time.time(), identifier))
+
+        return AudioTrack(json.loads(row[0]), 0)
+
+    def _get(self, query: str) -> LoadResult | None:
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._db.execute("SELECT result, created_at FROM queries WHERE query = ?", (query,)).fetchone()
+                if row is not None and now - row[1] < self.query_ttl_seconds:
+                    self._db.execute("UPDATE queries SET accessed_at = ? WHERE query = ?", (now, query))
+                    return LoadResult.from_dict(json.loads(zlib.decompress(row[0])))
+
+            # A single video URL can be served from any earlier lookup that returned the same track
+            match = YOUTUBE_VIDEO_ID.search(query)
+            if match and "list=" not in query:
+                track = self.get_track(match.group(1))
+                if track is not None:
+                    return LoadResult.from_track(track)
+        except (sqlite3.Error, zlib.error, ValueError, KeyError) as e:
+            self.logger.warning("[TRACK STORE] Failed to read %s: %s", query, e)
+
+        return None
+
+    def _put(self, query: str, result: LoadResult):
+        blob = zlib.compress(json.dumps(self._serialise(result)).encode("utf-8"))
+        # Skip anything that would take up a large share of the store, e.g. huge playlists
+        if len(blob) > self.max_bytes // 10:
+            return
+
+        now = time.time()
+        tracks = [(track.identifier, json.dumps(track.raw), now) for track in result.tracks]
+        try:
+            with self._lock:
+                old = self._db.execute("SELECT size FROM queries WHERE query = ?", (query,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO queries (query, result, size, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (query, blob, len(blob), now, now),
+                )
+                self._size += len(blob) - (old[0] if old else 0)
+                # Counted before inserting, as the row count of the insert includes tracks replacing one already stored
+                self._track_count += self._count_new_tracks({identifier for identifier, _, _ in tracks})
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO tracks (identifier, track, accessed_at) VALUES (?, ?, ?)", tracks
+                )
+                self._evict()
+        except sqlite3.Error as e:
+            self.logger.warning("[TRACK STORE] Failed to store %s: %s", query, e)
+
+    def _count_new_tracks(self, identifiers: set[str]) -> int:
+        """Count the identifiers that are not stored yet, by primary key lookups."""
+        ordered = list(identifiers)
+        stored = 0
+        for i in range(0, len(ordered), LOOKUP_CHUNK_SIZE):
+            chunk = ordered[i:i + LOOKUP_CHUNK_SIZE]
+            stored += self._db.execute(
+                f"SELECT COUNT(*) FROM tracks WHERE identifier IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchone()[0]
+        return len(ordered) - stored
+
+    def _evict(self):
+        """Evict least recently used rows until both tables are back under 90% of their bounds."""
+        if self._size > self.max_bytes:
+            target = self.max_bytes * 0.9
+            rows = self._db.execute("SELECT query, size FROM queries ORDER BY accessed_at").fetchall()
+            evicted = []
+            for query, size in rows:
+                if self._size <= target:
+                    break
+                evicted.append((query,))
+                self._size -= size
+            self._db.executemany("DELETE FROM queries WHERE query = ?", evicted)
+
+        if self._track_count > self.max_tracks:
+            self._track_count -= self._db.execute(
+                "DELETE FROM tracks WHERE identifier IN (SELECT identifier FROM tracks ORDER BY accessed_at LIMIT ?)",
+                (self._track_count - int(self.max_tracks * 0.9),),
+            ).rowcount
+
+    @staticmethod
+    def _serialise(result: LoadResult) -> dict:
+        """Serialise a load result into the structure Lavalink returns, so it can be rebuilt with from_dict."""
+        tracks = [track.raw for track in result.tracks]
+        if result.load_type == LoadType.TRACK:
+            data = tracks[0]
+        elif result.load_type == LoadType.PLAYLIST:
+            data = {
+                "info": {"name": result.playlist_info.name, "selectedTrack": result.playlist_info.selected_track},
+                "pluginInfo": result.plugin_info or {},
+                "tracks": tracks,
+            }
+        else:
+            data = tracks
+
+        return {"loadType": result.load_type.value, "data": data}
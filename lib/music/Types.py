@@ -1,7 +1,9 @@
-from typing import TypedDict, Literal
-from ytmusicapi.models import LyricLine
+from typing import TYPE_CHECKING, TypedDict, Literal
 from lavalink import AudioTrack, DefaultPlayer
 
+if TYPE_CHECKING:
+    from ytmusicapi.models import LyricLine
+
 AutoplayMode = Literal["Off", "Related", "Recommended"]
 LoopMode = Literal["Off", "Song", "Queue"]
 
@@ -14,6 +16,9 @@ class MusicServiceDefaults(TypedDict):
     max_history: int
     seek_time: int
     volume: int
+    max_queue_size: int
+    ingest_chunk_size: int
+    ingest_update_interval: int
 
 
 class TrackInfo(TypedDict):
@@ -35,6 +40,7 @@ class PlayResponse(TypedDict):
     playlist_name: str | None
     playlist_length: int | None
     playlist_url: str | None
+    playlist_truncated: int | None  # tracks not queued because the queue size cap was reached
 
 
 class PlayMultipleResponse(TypedDict):
@@ -109,6 +115,6 @@ class LyricsResponse(TypedDict):
 class TimedLyricsResponse(TypedDict):
     """Response structure for lyrics method with timestamps"""
 
-    lyrics: list[LyricLine]
+    lyrics: list["LyricLine"]
     title: str
     artists: list[str]
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable
+
+from lavalink import AudioTrack, LoadResult
+
+from utils.ConfigHandler import Config
+
+
+class VibePoolService:
+    """Service that keeps a warm, in-memory pool of track URIs for each vibe mode.
+    Playlists are loaded through Lavalink at startup and refreshed in the background, so /vibe can sample from memory.
+    """
+
+    def __init__(
+        self,
+        search: Callable[[str], Awaitable[LoadResult | None]],
+        filter_candidates: Callable[[LoadResult], list[AudioTrack]],
+        refresh_interval_seconds: int = 6 * 60 * 60,
+        refresh_jitter_seconds: int = 30 * 60,
+        retry_interval_seconds: int = 60,
+        max_retry_interval_seconds: int = 30 * 60,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.search = search
+        self.filter_candidates = filter_candidates
+
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.refresh_jitter_seconds = refresh_jitter_seconds
+        self.retry_interval_seconds = retry_interval_seconds
+        self.max_retry_interval_seconds = max_retry_interval_seconds
+
+        # mode -> playlist URLs, from config.yaml
+        self.playlists: dict[str, list[str]] = Config.fetch().get("VIBE_PLAYLISTS", {})
+        # mode -> track URIs that passed filtering
+        self._pool: dict[str, list[str]] = {}
+        self._refresher: asyncio.Task | None = None
+
+    def start(self):
+        """Start the background task that loads and refreshes every vibe mode."""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        """Load every mode, then refresh them on a jittered schedule. Failed modes are retried on their own, backing
+        off up to max_retry_interval_seconds, until the next full refresh."""
+        loop = asyncio.get_running_loop()
+        while True:
+            next_refresh = loop.time() + self.refresh_interval_seconds + random.uniform(
+                -self.refresh_jitter_seconds, self.refresh_jitter_seconds
+            )
+            modes = list(self.playlists)
+            retry_delay = self.retry_interval_seconds
+            while modes:
+                modes = await self._load_modes(modes)
+                if not modes or loop.time() + retry_delay >= next_refresh:
+                    break
+
+                self.logger.warning(
+                    "[VIBE] Failed to load modes %s, retrying in %ss", ", ".join(modes), retry_delay
+                )
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, self.max_retry_interval_seconds)
+
+            await asyncio.sleep(max(next_refresh - loop.time(), 0))
+
+    async def _load_modes(self, modes: list[str]) -> list[str]:
+        """Load modes concurrently, returning those that failed or loaded no tracks."""
+        results = await asyncio.gather(*(self.load_mode(mode) for mode in modes), return_exceptions=True)
+        return [mode for mode, result in zip(modes, results) if isinstance(result, Exception) or not result]
+
+    async def load_mode(self, mode: str) -> list[str]:
+        """Load and filter every playlist for a mode, replacing its pool. Keeps the old pool if nothing loaded."""
+        results = await asyncio.gather(*(self.search(url) for url in self.playlists.get(mode, [])),
+                                       return_exceptions=True)
+
+        uris: list[str] = []
+        seen: set[str] = set()
+        for result in results:
+            if isinstance(result, Exception):
+                self.logger.warning("[VIBE] Failed to load a %s playlist: %s", mode, result)
+                continue
+            if not result or not result.tracks:
+                continue
+
+            for track in self.filter_candidates(result):
+                if track.uri not in seen:
+                    seen.add(track.uri)
+                    uris.append(track.uri)
+
+        if uris:
+            self._pool[mode] = uris
+            self.logger.info("[VIBE] Loaded %s tracks for %s mode", len(uris), mode)
+
+        return uris
+
+    async def sample(self, mode: str, count: int) -> list[str]:
+        """Sample track URIs for a mode from the pool, loading the mode first if it is not warm yet."""
+        uris = self._pool.get(mode)
+        if not uris:
+            uris = await self.load_mode(mode)
+
+        return random.sample(uris, k=min(count, len(uris)))
@@ -45,6 +45,8 @@ class QueueAddContainer(BaseMusicContainer):
                 discord.ui.TextDisplay(f"### Added {playlist_text}")
             )
             metadata_text = f"-# Tracks Added\n**{result['playlist_length']}**\n"
+            if result.get("playlist_truncated"):
+                metadata_text += f"-# Skipped (Queue Full)\n**{result['playlist_truncated']}**\n"
         else:
             self.add_item(discord.ui.TextDisplay(f"**{title}**")).add_item(
                 discord.ui.TextDisplay(f"### [{track.title}]({track.uri})")
@@ -1,5 +1,5 @@
 import asyncio
-from typing import Dict, Any, List
+from typing import List
 from datetime import datetime
 import discord
 
@@ -9,6 +9,7 @@ from lib.music.MusicService import MusicService
 from lib.music.containers.base import PaginatedContainer
 from lib.music.containers.queue_add import QueueAddContainer
 from lib.music.views import AutoDeleteLayoutView
+from utils.APIModels import RecentTracks, TrackPlay
 from utils.Music import format_duration
 
 
@@ -18,7 +19,7 @@ class RecentsContainer(PaginatedContainer):
     def __init__(self,
                  service: MusicService,
                  bot: MOCBOT,
-                 recents_data: Dict[str, Any],
+                 recents_data: RecentTracks,
                  is_server: bool = False,
                  page: int = 0,
                  per_page: int = 5
@@ -32,7 +33,7 @@ class RecentsContainer(PaginatedContainer):
         self.recents_data = recents_data
         self.is_server = is_server
 
-        track_plays = recents_data.get("trackPlays", [])
+        track_plays = recents_data.track_plays
         total_tracks = len(track_plays)
         max_pages, start_idx, end_idx = self._calculate_pagination(total_tracks)
 
@@ -52,7 +53,7 @@ class RecentsContainer(PaginatedContainer):
 
     def _build_header(self, is_server: bool):
         """Build the header section."""
-        guild_name = self.bot.get_guild(self.recents_data.get("guildId")).name if is_server else ""
+        guild_name = self.bot.get_guild(self.recents_data.guild_id).name if is_server else ""
         title = f"**`{guild_name}`'s Recently Played Tracks**" if is_server else "**Your Recently Listened Tracks**"
 
         self.add_item(discord.ui.Section(
@@ -61,23 +62,23 @@ class RecentsContainer(PaginatedContainer):
         ))
         self.add_item(discord.ui.Separator())
 
-    def _build_recent_items(self, track_plays: List[Dict[str, Any]], start_idx: int):
+    def _build_recent_items(self, track_plays: List[TrackPlay], start_idx: int):
         """Build the recent track items with add buttons."""
         for idx, track_play in enumerate(track_plays):
             track_num = start_idx + idx + 1
-            duration = format_duration(track_play.get("DurationMs", 0))
+            duration = format_duration(track_play.duration_ms)
 
-            url = track_play.get("URL", "")
+            url = track_play.url
 
-            title = track_play.get("Title", "Unknown Title")
-            artist = track_play.get("Artist", "Unknown Artist")
+            title = track_play.title
+            artist = track_play.artist
 
             # show requested by getting server recents
-            queued_by = track_play.get("QueuedByUser", {})
+            queued_by = track_play.queued_by_user
 
             # show which server the track was played on if not getting server recents
-            guild_name = self.bot.get_guild(track_play.get("GuildID")).name if not self.is_server else ""
-            relative_time = datetime.fromisoformat(track_play.get("StartedAt")).timestamp()
+            guild_name = self.bot.get_guild(track_play.guild_id).name if not self.is_server else ""
+            relative_time = datetime.fromisoformat(track_play.started_at).timestamp()
 
             middle_metadata = f' • `{guild_name}`' if guild_name else f' • <@{queued_by}>'
 
@@ -109,7 +110,7 @@ class RecentsContainer(PaginatedContainer):
     def _build_action_row(self,
                           page: int,
                           max_pages: int,
-                          track_plays: List[Dict[str, Any]],
+                          track_plays: List[TrackPlay],
                           show_page_buttons: bool = True,
                           show_add_all_button: bool = False):
         """Build action row with add all and/or pagination buttons."""
@@ -132,13 +133,13 @@ class RecentsContainer(PaginatedContainer):
         if show_page_buttons or show_add_all_button:
             self.add_item(buttons)
 
-    def _make_add_callback(self, track_play: Dict[str, Any]):
+    def _make_add_callback(self, track_play: TrackPlay):
         """Create a callback function for adding a specific track."""
         async def add_callback(interaction: discord.Interaction):
             await self.handle_add(interaction, track_play)
         return add_callback
 
-    def _make_add_all_callback(self, track_plays: List[Dict[str, Any]]):
+    def _make_add_all_callback(self, track_plays: List[TrackPlay]):
         """Create a callback function for adding all tracks."""
         async def add_all_callback(interaction: discord.Interaction):
             await self.handle_add_all(interaction, track_plays)
@@ -146,7 +147,7 @@ class RecentsContainer(PaginatedContainer):
 
     def _get_total_items(self) -> int:
         """Get total number of items for pagination."""
-        return len(self.recents_data.get("trackPlays", []))
+        return len(self.recents_data.track_plays)
 
     def _refresh_view(self, page: int) -> discord.ui.LayoutView:
         """Create a new view with updated recents container."""
@@ -163,11 +164,11 @@ class RecentsContainer(PaginatedContainer):
         return view
 
     @message_error_handler(ephemeral=True, followup=True)
-    async def handle_add(self, interaction: discord.Interaction, track_play: Dict[str, Any]):
+    async def handle_add(self, interaction: discord.Interaction, track_play: TrackPlay):
         """Handle add button press for a specific track."""
         await interaction.response.defer(ephemeral=True)
 
-        url = track_play.get("URL", "")
+        url = track_play.url
 
         result = await self.service.play_track(
             interaction.guild.id,
@@ -183,11 +184,11 @@ class RecentsContainer(PaginatedContainer):
             await self.send_queue_add(interaction, container)
 
     @message_error_handler(ephemeral=True, followup=True)
-    async def handle_add_all(self, interaction: discord.Interaction, track_plays: List[Dict[str, Any]]):
+    async def handle_add_all(self, interaction: discord.Interaction, track_plays: List[TrackPlay]):
         """Handle add all button press."""
         await interaction.response.defer(ephemeral=True)
 
-        urls = [track_play.get("URL", "") for track_play in track_plays if track_play.get("URL", "")]
+        urls = [track_play.url for track_play in track_plays if track_play.url]
 
         result = await self.service.play_tracks(
             interaction.guild.id,
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from typing import Any, Optional
+
+import socketio
+from aiohttp import web
+from socketio.exceptions import ConnectionRefusedError as SocketIOConnectionRefusedError
+
+from lib.socket.SocketKey import SocketKey
+
+# Namespaces proxied to the workers, and the key in each event's data that holds the guild ID
+ROUTED_NAMESPACES = {
+    "/music": "guild_id",
+    "/verification": "GuildID",
+    "/roles": "GuildID",
+}
+# How long an event waits for its worker's connection, started by the dashboard connecting, before it is dropped
+CONNECT_TIMEOUT_SECONDS = 10
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    """The shard Discord assigns a guild to."""
+    return (guild_id >> 22) % shard_count
+
+
+class RouterNamespace(socketio.AsyncNamespace):
+    """Accepts dashboard connections for a namespace and forwards every event to the worker owning its guild."""
+
+    def __init__(self, namespace: str, router: "SocketRouter") -> None:
+        super().__init__(namespace)
+        self.router = router
+
+    async def trigger_event(self, event: str, *args: Any) -> Any:
+        if event == "connect":
+            _socket_id, environ, *auth = args
+            return await self.router.authenticate(self.namespace, environ, auth[0] if auth else None)
+        if event == "disconnect":
+            return None
+
+        await self.router.forward(self.namespace, event, args[1] if len(args) > 1 else None)
+        return None
+
+
+class SocketRouter:
+    """Public Socket.IO server for sharded deployments running several worker processes.
+
+    Each worker runs its own Socket.IO server on a local port. Events from the dashboard are forwarded to the worker
+    whose shards own the event's guild, or to every worker if the event has no guild. Events emitted by any worker
+    are relayed back to the dashboard. Workers are connected to with the credentials the dashboard presented, as the
+    router only knows the key's hash, so events sent while those connections are being made wait for them.
+    """
+
+    def __init__(self, shard_count: int, worker_shards: list[list[int]], worker_urls: list[str]) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.shard_count = shard_count
+        self.worker_urls = worker_urls
+        # shard_id -> index of the worker that owns it
+        self.shard_workers = {shard: worker for worker, shards in enumerate(worker_shards) for shard in shards}
+
+        self.sio = socketio.AsyncServer()
+        self.app = web.Application()
+        self.runner = web.AppRunner(self.app)
+        self.sio.attach(self.app)
+        for namespace in ROUTED_NAMESPACES:
+            self.sio.register_namespace(RouterNamespace(namespace, self))
+
+        # (worker, namespace) -> client connected to that worker
+        self._clients: dict[tuple[int, str], socketio.AsyncClient] = {}
+        self._connecting: dict[tuple[int, str], asyncio.Task] = {}
+
+    async def start(self, host: str, port: int) -> None:
+        self.sio.eio.cors_allowed_origins = [f"http://[{host}:{port}", "http://localhost:3000"]
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        self.logger.info("[SOCKET] Routing %s shards across %s workers on %s:%s",
+                         self.shard_count, len(self.worker_urls), host, port)
+
+    async def authenticate(self, namespace: str, environ: dict, auth: Optional[dict]) -> None:
+        """Authenticate a dashboard connection the same way the workers do, then connect to every worker for the
+        namespace with the same credentials."""
+        if namespace == "/music":
+            key = (auth or {}).get("token")
+            connect_kwargs = {"auth": {"token": key}}
+        else:
+            key = environ.get("HTTP_SOCKET_KEY")
+            connect_kwargs = {"headers": {"Socket-Key": key}}
+
+        if not SocketKey.is_authorised(key):
+            self.logger.warning("Unauthorised connection to %s from %s", namespace, environ.get("REMOTE_ADDR", None))
+            raise SocketIOConnectionRefusedError("Unauthorised")
+
+        for worker in range(len(self.worker_urls)):
+            task = self._connecting.get((worker, namespace))
+            if (worker, namespace) not in self._clients and (task is None or task.done()):
+                self._connecting[(worker, namespace)] = asyncio.create_task(
+                    self._connect_worker(worker, namespace, connect_kwargs)
+                )
+
+    async def _connect_worker(self, worker: int, namespace: str, connect_kwargs: dict) -> None:
+        """Connect to a worker, retrying until it is up. The client reconnects by itself after that."""
+        client = socketio.AsyncClient()
+
+        async def relay(event: str, *args: Any) -> None:
+            await self.sio.emit(event, args[0] if args else None, namespace=namespace)
+
+        client.on("*", relay, namespace=namespace)
+
+        delay = 1
+        while True:
+            try:
+                await client.connect(self.worker_urls[worker], namespaces=[namespace], **connect_kwargs)
+                break
+            except socketio.exceptions.ConnectionError as e:
+                self.logger.warning("Could not connect to worker %s for %s, retrying: %s", worker, namespace, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+        self._clients[(worker, namespace)] = client
+        self.logger.info("[SOCKET] Connected to worker %s for %s", worker, namespace)
+
+    async def forward(self, namespace: str, event: str, data: Any) -> None:
+        """Forward an event to the worker owning its guild, or to every worker if it has no guild."""
+        guild_id = data.get(ROUTED_NAMESPACES[namespace]) if isinstance(data, dict) else None
+        if guild_id is not None:
+            workers = [self.shard_workers[shard_for_guild(int(guild_id), self.shard_count)]]
+        else:
+            workers = range(len(self.worker_urls))
+
+        for worker in workers:
+            client = self._clients.get((worker, namespace))
+            task = self._connecting.get((worker, namespace))
+            if client is None and task is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(task), CONNECT_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                client = self._clients.get((worker, namespace))
+            if client is None or not client.connected:
+                self.logger.warning("Dropping %s on %s, worker %s is not connected", event, namespace, worker)
+                continue
+            await client.emit(event, data, namespace=namespace)
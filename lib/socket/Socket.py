@@ -3,16 +3,14 @@ import socketio
 
 from aiohttp import web
 from utils.ConfigHandler import Config
+from utils.Metrics import metrics
 
 from .namespaces.Music import MusicSocket
+from .namespaces.Roles import Roles
 from .namespaces.Verification import Verification
 
-SIO = socketio.AsyncServer(
-    cors_allowed_origins=[
-        f'http://[{Config.fetch()["SOCKET"]["HOST"]}:{Config.fetch()["SOCKET"]["PORT"]}',
-        "http://localhost:3000",
-    ]
-)
+# Allowed origins are set in Socket.start, so importing this module does not read the config file
+SIO = socketio.AsyncServer()
 
 APP = web.Application()
 RUNNER = web.AppRunner(APP)
@@ -21,18 +19,34 @@ SIO.attach(APP)
 NAMESPACE_REGISTRY = {
     "music": MusicSocket,
     "verification": Verification,
+    "roles": Roles,
 }
 
 
 class Socket:
-    """Manages the Socket.IO server and its namespaces."""
+    """Manages the Socket.IO server and its namespaces, and serves health checks and metrics on the same app."""
 
-    HOST = Config.fetch()["SOCKET"]["HOST"]
-    PORT = Config.fetch()["SOCKET"]["PORT"]
+    HOST = None
+    PORT = None
+    BOT = None
+    # Set once the namespaces are registered
+    READY = False
 
     @staticmethod
-    async def start(bot):
-        """Starts the Socket.IO server and registers namespaces."""
+    async def start(bot, host: str = None, port: int = None):
+        """Starts the server, then registers namespaces once the bot is ready. host and port default to the
+        config."""
+        Socket.HOST = host or Config.fetch()["SOCKET"]["HOST"]
+        Socket.PORT = port or Config.fetch()["SOCKET"]["PORT"]
+        Socket.BOT = bot
+        SIO.eio.cors_allowed_origins = [f"http://[{Socket.HOST}:{Socket.PORT}", "http://localhost:3000"]
+
+        # Start serving before the bot is ready, so health checks and metrics are available during startup
+        await RUNNER.setup()
+        site = web.TCPSite(RUNNER, Socket.HOST, Socket.PORT)
+        await site.start()
+        logging.getLogger(__name__).info("[SOCKET] Listening on %s:%s", Socket.HOST, Socket.PORT)
+
         await bot.wait_until_ready()
 
         for name, cls in NAMESPACE_REGISTRY.items():
@@ -44,12 +58,33 @@ class Socket:
             SIO.register_namespace(namespace_instance)
             logging.getLogger(__name__).info("Initialized /%s namespace", name)
 
-        await RUNNER.setup()
-        site = web.TCPSite(RUNNER, Socket.HOST, Socket.PORT)
-        await site.start()
-        logging.getLogger(__name__).info("[SOCKET] Listening on %s:%s", Socket.HOST, Socket.PORT)
+        Socket.READY = True
+
+    @staticmethod
+    async def metrics(_request: web.Request) -> web.Response:
+        """Serve every metric in the Prometheus text format."""
+        return web.Response(text=metrics.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    @staticmethod
+    async def healthz(_request: web.Request) -> web.Response:
+        """Liveness check. Answering at all shows the event loop is running."""
+        if Socket.BOT is None or Socket.BOT.is_closed():
+            return web.Response(status=503, text="closed")
+        return web.Response(text="ok")
+
+    @staticmethod
+    async def readyz(_request: web.Request) -> web.Response:
+        """Readiness check. Ready once the bot is connected to Discord and the namespaces are registered."""
+        if Socket.BOT is None or not Socket.BOT.is_ready() or not Socket.READY:
+            return web.Response(status=503, text="starting")
+        return web.Response(text="ready")
 
     @staticmethod
     async def emit(*args, **kwargs):
         """Emits an event to all connected clients."""
         await SIO.emit(*args, **kwargs)
+
+
+APP.router.add_get("/metrics", Socket.metrics)
+APP.router.add_get("/healthz", Socket.healthz)
+APP.router.add_get("/readyz", Socket.readyz)
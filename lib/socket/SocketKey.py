@@ -0,0 +1,29 @@
+import os
+from hashlib import sha256
+from typing import Optional
+
+
+class SocketKey:
+    """The SHA-256 hash of the Socket.IO key, read from the file at $SOCKET_KEY.
+
+    The hash is kept in memory and only read again when the file's modification time changes, so the key can be
+    rotated without a restart and connections do not read the file.
+    """
+
+    _hash: Optional[str] = None
+    _mtime: Optional[int] = None
+
+    @staticmethod
+    def get() -> str:
+        path = os.environ["SOCKET_KEY"]
+        mtime = os.stat(path).st_mtime_ns
+        if SocketKey._hash is None or mtime != SocketKey._mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                SocketKey._hash = f.read().strip()
+            SocketKey._mtime = mtime
+        return SocketKey._hash
+
+    @staticmethod
+    def is_authorised(key: Optional[str]) -> bool:
+        """Whether a key presented by a client hashes to the configured key."""
+        return key is not None and sha256(key.encode("utf-8")).hexdigest() == SocketKey.get()
@@ -1,9 +1,7 @@
 import asyncio
 import logging
-import os
 
 from dataclasses import dataclass
-from hashlib import sha256
 from typing import Optional, TYPE_CHECKING, Any, Dict, List, Set, Callable
 from functools import wraps
 
@@ -11,6 +9,7 @@ import socketio
 from socketio.exceptions import ConnectionRefusedError as SocketIOConnectionRefusedError
 from lavalink import DefaultPlayer, AudioTrack
 from lib.music.Decorators import event_handler
+from lib.socket.SocketKey import SocketKey
 from lib.music.Exceptions import UserError, InternalError
 from lib.music.Types import TimedLyricsResponse
 
@@ -120,11 +119,7 @@ class MusicSocket(socketio.AsyncNamespace):
             )
             raise SocketIOConnectionRefusedError("Missing auth token")
 
-        socket_key = auth["token"]
-        with open(os.environ["SOCKET_KEY"], "r", encoding="utf-8") as f:
-            config_key = f.read().strip()
-
-        if sha256(socket_key.encode("utf-8")).hexdigest() != config_key:
+        if not SocketKey.is_authorised(auth["token"]):
             self.logger.warning("Unauthorised connection from %s - invalid token", environ.get("REMOTE_ADDR", None))
             raise SocketIOConnectionRefusedError("Invalid token")
 
@@ -0,0 +1,25 @@
+import logging
+import socketio
+from socketio.exceptions import ConnectionRefusedError
+
+from lib.levels.LevelRoles import level_roles
+from lib.socket.SocketKey import SocketKey
+
+
+class Roles(socketio.AsyncNamespace):
+    async def on_connect(self, socketID, environ):
+        if not SocketKey.is_authorised(environ.get("HTTP_SOCKET_KEY")):
+            logging.getLogger(__name__).warning(f"Unauthorised connection from {environ.get('REMOTE_ADDR', None)}")
+            raise ConnectionRefusedError("Unauthorised")
+
+    async def on_disconnect(self, socketID):
+        pass
+
+    async def on_roles_updated(self, socketID, data):
+        """Sent by the website when a guild's roles are edited, so the cached level roles are fetched again."""
+        try:
+            guild_id = int(data["GuildID"])
+        except (TypeError, KeyError, ValueError):
+            logging.getLogger(__name__).warning("Ignoring roles_updated without a valid GuildID: %s", data)
+            return
+        level_roles.invalidate(guild_id)
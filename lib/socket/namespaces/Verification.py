@@ -1,19 +1,69 @@
 import asyncio
-from hashlib import sha256
 import logging
-import sys
-import os
+from typing import Awaitable, Callable
+
 import socketio
 from socketio.exceptions import ConnectionRefusedError
 
+from lib.socket.SocketKey import SocketKey
+from utils.Metrics import metrics
+
+
+class VerificationQueue:
+    """Dispatches verification requests from the dashboard to the Verification cog.
+
+    Requests wait until the cog has loaded and marked the queue ready, rather than each polling for it. They are
+    processed in the order received within a guild, with at most concurrency guilds processed at once.
+    """
+
+    def __init__(self, concurrency: int = 4):
+        self.logger = logging.getLogger(__name__)
+        self.ready = asyncio.Event()
+        self.pending = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._guild_locks: dict[str, asyncio.Lock] = {}
+        self._guild_pending: dict[str, int] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+        metrics.gauge(
+            "mocbot_verification_queue_depth",
+            "Verification requests from the dashboard waiting or being processed",
+            function=lambda: self.pending,
+        )
+
+    def submit(self, guild_id: str, func: Callable[[], Awaitable[None]]):
+        """Queue a request for a guild. func is called once the cog is ready and the guild's earlier requests are
+        done."""
+        self.pending += 1
+        self._guild_pending[guild_id] = self._guild_pending.get(guild_id, 0) + 1
+        lock = self._guild_locks.setdefault(guild_id, asyncio.Lock())
+        task = asyncio.create_task(self._process(guild_id, lock, func))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, guild_id: str, lock: asyncio.Lock, func: Callable[[], Awaitable[None]]):
+        try:
+            # The guild lock is taken first, so requests keep their order while waiting for the cog
+            async with lock:
+                await self.ready.wait()
+                async with self._slots:
+                    await func()
+        except Exception:
+            self.logger.exception("Failed to process verification request for guild %s", guild_id)
+        finally:
+            self.pending -= 1
+            self._guild_pending[guild_id] -= 1
+            if not self._guild_pending[guild_id]:
+                del self._guild_pending[guild_id]
+                del self._guild_locks[guild_id]
+
+
+verification_queue = VerificationQueue()
+
 
 class Verification(socketio.AsyncNamespace):
     async def on_connect(self, socketID, environ):
-        socketKey = environ.get("HTTP_SOCKET_KEY")
-        with open(os.environ["SOCKET_KEY"], "r", encoding="utf-8") as f:
-            config_key = f.read().strip()
-
-        if socketKey is None or (socketKey is not None and sha256(socketKey.encode("utf-8")).hexdigest() != config_key):
+        if not SocketKey.is_authorised(environ.get("HTTP_SOCKET_KEY")):
             logging.getLogger(__name__).warning(f"Unauthorised connection from {environ.get('REMOTE_ADDR', None)}")
             raise ConnectionRefusedError("Unauthorised")
 
@@ -21,9 +71,7 @@ class Verification(socketio.AsyncNamespace):
         pass
 
     async def on_verify_user(self, socketID, data):
-        async def waitForVerification():
-            while "lib.cogs.Verification" not in sys.modules:
-                await asyncio.sleep(1)
+        async def verify():
             from lib.cogs.Verification import Verification as VerificationCog
 
             await VerificationCog.web_verify_user(
@@ -33,14 +81,12 @@ class Verification(socketio.AsyncNamespace):
                 adminID=data.get("AdminID"),
             )
 
-        asyncio.ensure_future(waitForVerification())
+        verification_queue.submit(str(data.get("GuildID")), verify)
 
     async def on_verify_kick_user(self, socketID, data):
-        async def waitForVerification():
-            while "lib.cogs.Verification" not in sys.modules:
-                await asyncio.sleep(1)
+        async def kick():
             from lib.cogs.Verification import Verification as VerificationCog
 
             await VerificationCog.web_kick_user(data.get("UserID"), data.get("GuildID"), data.get("AdminID"))
 
-        asyncio.ensure_future(waitForVerification())
+        verification_queue.submit(str(data.get("GuildID")), kick)
@@ -0,0 +1,180 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from requests.exceptions import HTTPError
+
+from utils.APIHandler import API
+from utils.Metrics import metrics
+
+# Members who have not verified, or are still in lockdown, this long after joining are kicked
+EXPIRY_SECONDS = 7 * 24 * 60 * 60
+# Upper bound on a single sleep, so a changed system clock is noticed within this long
+MAX_SLEEP_SECONDS = 60 * 60
+# Expiries that fail are retried after this long, doubling with each failure up to MAX_RETRY_SECONDS
+RETRY_SECONDS = 60
+MAX_RETRY_SECONDS = 60 * 60
+
+EXPIRED = metrics.counter(
+    "mocbot_verification_expired_total",
+    "Expired verifications, by outcome: kicked, skipped if already resolved, or failed",
+    ["outcome"],
+)
+
+
+class LockdownSweeper:
+    """Kicks members who have not verified within 7 days of joining, close to when their time runs out.
+
+    Pending verifications are kept in a min-heap keyed by when they expire. Hydrated once from the API at startup,
+    then kept current by the Verification cog as members join, leave and verify. Removed entries are left in the
+    heap and skipped when popped. Expired entries are handed to the expire callback, at most concurrency at once, and
+    are added back to be retried with backoff if it fails.
+    """
+
+    def __init__(self, concurrency: int = 4):
+        self.logger = logging.getLogger(__name__)
+        # Min-heap of (expiry time, guild ID, user ID). Entries are stale if they no longer match _entries
+        self._heap: list[tuple[float, int, int]] = []
+        # (guild_id, user_id) -> (expiry time, verification record)
+        self._entries: dict[tuple[int, int], tuple[float, dict]] = {}
+        # (guild_id, user_id) -> consecutive failed expiries
+        self._failures: dict[tuple[int, int], int] = {}
+        # Keys being expired that have not been changed locally since, so can be retried if expiring them fails
+        self._expiring: set[tuple[int, int]] = set()
+        # Keys changed locally while hydrating, which the hydrated records are older than
+        self._changed: Optional[set[tuple[int, int]]] = None
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self._running: set[asyncio.Task] = set()
+        self.hydrated = False
+
+    def start(self, expire: Callable[[int, int, dict], Awaitable[bool]]):
+        """Start firing expiries. expire is called with the guild ID, user ID and verification record, and returns
+        whether the member was kicked."""
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run(expire))
+
+    def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+
+    async def hydrate(self, owns_guild: Callable[[int], bool] = lambda _: True):
+        """Load every pending verification of the guilds owns_guild accepts from the API, keeping any changes made
+        while they were fetched."""
+        self._changed = set()
+        try:
+            records = await asyncio.to_thread(API.get, "/verification")
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            records = []
+        finally:
+            changed, self._changed = self._changed, None
+
+        for record in records:
+            key = (int(record.get("GuildID")), int(record.get("UserID")))
+            if key not in changed and owns_guild(key[0]):
+                self.add(*key, record)
+
+        self.hydrated = True
+        self.logger.info("[VERIFICATION] Loaded %s pending verifications", len(self._entries))
+
+    def add(self, guild_id: int, user_id: int, record: dict):
+        """Add or replace a pending verification. Records without a JoinTime never expire."""
+        if record.get("JoinTime") is None:
+            self.remove(guild_id, user_id)
+            return
+
+        self._touch(guild_id, user_id)
+        self._schedule(guild_id, user_id, int(record.get("JoinTime")) + EXPIRY_SECONDS, record)
+
+    def _schedule(self, guild_id: int, user_id: int, expires_at: float, record: dict):
+        self._entries[(guild_id, user_id)] = (expires_at, record)
+        heapq.heappush(self._heap, (expires_at, guild_id, user_id))
+        if self._heap[0][0] == expires_at:
+            self._wakeup.set()
+
+    def update(self, guild_id: int, user_id: int, **changes):
+        """Update fields of a pending verification's record, e.g. once they are placed in lockdown."""
+        entry = self._entries.get((guild_id, user_id))
+        if entry is not None:
+            self._touch(guild_id, user_id)
+            self._entries[(guild_id, user_id)] = (entry[0], {**entry[1], **changes})
+
+    def remove(self, guild_id: int, user_id: int):
+        self._touch(guild_id, user_id)
+        self._entries.pop((guild_id, user_id), None)
+
+    def _touch(self, guild_id: int, user_id: int):
+        """Record a local change to a pending verification, which resets its failed expiries."""
+        self._failures.pop((guild_id, user_id), None)
+        self._expiring.discard((guild_id, user_id))
+        if self._changed is not None:
+            self._changed.add((guild_id, user_id))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _pop_due(self, now: float) -> list[tuple[int, int, dict]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, guild_id, user_id = heapq.heappop(self._heap)
+            entry = self._entries.get((guild_id, user_id))
+            if entry is not None and entry[0] == expires_at:
+                del self._entries[(guild_id, user_id)]
+                self._expiring.add((guild_id, user_id))
+                if self._changed is not None:
+                    self._changed.add((guild_id, user_id))
+                due.append((guild_id, user_id, entry[1]))
+        # Drop stale entries at the top, so the next sleep is not cut short by one
+        while self._heap and self._entries.get(self._heap[0][1:], (None,))[0] != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return due
+
+    async def _run(self, expire: Callable[[int, int, dict], Awaitable[bool]]):
+        while True:
+            for guild_id, user_id, record in self._pop_due(time.time()):
+                await self._slots.acquire()
+                task = asyncio.create_task(self._expire(expire, guild_id, user_id, record))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+            self._wakeup.clear()
+            timeout = min(self._heap[0][0] - time.time(), MAX_SLEEP_SECONDS) if self._heap else MAX_SLEEP_SECONDS
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _expire(self, expire: Callable[[int, int, dict], Awaitable[bool]], guild_id: int, user_id: int,
+                      record: dict):
+        key = (guild_id, user_id)
+        try:
+            kicked = await expire(guild_id, user_id, record)
+        except Exception:
+            EXPIRED.inc(outcome="failed")
+            failures = self._failures.get(key, 0)
+            retry_in = min(RETRY_SECONDS * 2**failures, MAX_RETRY_SECONDS)
+            self.logger.exception(
+                "[VERIFICATION] Failed to expire verification of %s in %s, retrying in %ss", user_id, guild_id, retry_in
+            )
+            # Unless it was added again or resolved while this ran
+            if key in self._expiring:
+                self._schedule(guild_id, user_id, time.time() + retry_in, record)
+                self._failures[key] = failures + 1
+        else:
+            self._failures.pop(key, None)
+            EXPIRED.inc(outcome="kicked" if kicked else "skipped")
+        finally:
+            self._expiring.discard(key)
+            self._slots.release()
+
+
+lockdown_sweeper = LockdownSweeper()
+metrics.gauge(
+    "mocbot_verification_pending", "Pending verifications waiting to expire", function=lambda: len(lockdown_sweeper)
+)
@@ -0,0 +1,68 @@
+"""Reports what importing MOCBOT costs, using Python's -X importtime.
+
+Usage: python scripts/import_audit.py [--top N] [--module MODULE ...]
+
+Run from the repository root with the same environment variables the bot needs.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_MODULES = ["lib.bot"] + sorted(f"lib.cogs.{path.stem}" for path in (ROOT / "lib" / "cogs").glob("*.py"))
+
+
+def audit(modules: list[str]) -> list[tuple[str, int, int]]:
+    """Import modules in a fresh interpreter, returning (module, self us, cumulative us) for every import."""
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit the import cost of MOCBOT.")
+    parser.add_argument("--top", type=int, default=20, help="Number of entries to show in each table.")
+    parser.add_argument("--module", action="append", help="Module to import. Defaults to the bot and every cog.")
+    args = parser.parse_args()
+
+    imports = audit(args.module or DEFAULT_MODULES)
+
+    # Self time summed by top level package shows which dependencies are worth importing lazily
+    packages = defaultdict(int)
+    for name, self_us, _ in imports:
+        packages[name.split(".")[0]] += self_us
+    total_us = sum(packages.values())
+
+    print(f"Total import time: {total_us / 1000:.1f}ms across {len(imports)} modules\n")
+    print(f"{'Package':<40}{'Self (ms)':>12}{'Share':>9}")
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[: args.top]:
+        print(f"{package:<40}{self_us / 1000:>12.1f}{self_us / total_us:>9.1%}")
+
+    print(f"\n{'Module':<60}{'Cumulative (ms)':>16}")
+    for name, _, cumulative_us in sorted(imports, key=lambda item: item[2], reverse=True)[: args.top]:
+        print(f"{name:<60}{cumulative_us / 1000:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Reports how much resident memory MOCBOT's guild and member cache costs per 1k guilds under each memory profile.
+
+Usage: python scripts/memory_benchmark.py [--guilds N] [--members N] [--lazy-share FRACTION] [--cogs COG ...]
+
+Feeds synthetic GUILD_CREATE payloads, shaped the way Discord sends them for each profile's intents, into
+discord.py's connection state and measures RSS before and after. Guilds chunked at startup get their full member
+list. Under the lean profile, --lazy-share of the guilds are chunked, standing in for the guilds that use Levels or
+Lobbies. Each profile is measured in a fresh interpreter. Run from the repository root. Linux only.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import discord  # noqa: E402
+
+from utils.MemoryProfile import PROFILES, MemoryProfile  # noqa: E402
+
+DEFAULT_COGS = sorted(path.stem for path in (ROOT / "lib" / "cogs").glob("*.py") if path.stem != "Template")
+BOT_ID = 1 << 60
+LARGE_THRESHOLD = 250
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm", "r", encoding="utf-8") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def user_payload(user_id: int) -> dict:
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id}",
+        "global_name": f"User {user_id}",
+        "discriminator": "0",
+        "avatar": "a" * 32,
+    }
+
+
+def member_payload(user_id: int, roles: list[str]) -> dict:
+    return {
+        "user": user_payload(user_id),
+        "roles": roles,
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def presence_payload(user_id: int) -> dict:
+    return {
+        "user": {"id": str(user_id)},
+        "status": "online",
+        "client_status": {"desktop": "online"},
+        "activities": [{"name": "Minecraft", "type": 0, "created_at": 0}],
+    }
+
+
+def guild_payload(guild_id: int, members: int, intents: discord.Intents, rng: random.Random) -> tuple[dict, list]:
+    """A GUILD_CREATE payload for a synthetic guild, and the members a chunk request would return."""
+    roles = [str(guild_id + i) for i in range(1, 21)]
+    channels = [
+        {"id": str(guild_id + 100 + i), "type": 0, "name": f"channel-{i}", "position": i} for i in range(25)
+    ] + [
+        {"id": str(guild_id + 125 + i), "type": 2, "name": f"voice-{i}", "position": i, "bitrate": 64000,
+         "user_limit": 0}
+        for i in range(5)
+    ]
+    user_ids = [guild_id + 1000 + i for i in range(members)] + [BOT_ID]
+    everyone = [member_payload(user_id, rng.sample(roles, 2)) for user_id in user_ids]
+    online = {user_id for user_id in user_ids if rng.random() < 0.3}
+    in_voice = set(rng.sample(user_ids[:-1], min(members, 8)))
+
+    # Without the presences intent Discord only sends the bot and voice members. With it, large guilds get their
+    # online members and small guilds get every member
+    if not intents.presences:
+        sent = [m for m in everyone if int(m["user"]["id"]) in in_voice or int(m["user"]["id"]) == BOT_ID]
+    elif members >= LARGE_THRESHOLD:
+        sent = [m for m in everyone if int(m["user"]["id"]) in online | in_voice | {BOT_ID}]
+    else:
+        sent = everyone
+
+    payload = {
+        "id": str(guild_id),
+        "name": f"Guild {guild_id}",
+        "owner_id": str(user_ids[0]),
+        "member_count": members + 1,
+        "large": members >= LARGE_THRESHOLD,
+        "roles": [{"id": role, "name": f"role-{role}", "permissions": "0", "position": 1} for role in roles]
+        + [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0}],
+        "channels": channels,
+        "members": sent,
+        "voice_states": [
+            {"user_id": str(user_id), "channel_id": channels[-1]["id"], "session_id": "s", "deaf": False,
+             "mute": False, "self_deaf": False, "self_mute": False, "suppress": False}
+            for user_id in in_voice
+        ],
+        "presences": [presence_payload(user_id) for user_id in online] if intents.presences else [],
+        "emojis": [{"id": str(guild_id + 500 + i), "name": f"emoji{i}", "roles": []} for i in range(50)]
+        if intents.expressions else [],
+        "stickers": [],
+    }
+    return payload, everyone
+
+
+def measure(profile: MemoryProfile, guilds: int, members: int, lazy_share: float, seed: int) -> dict:
+    """Load synthetic guilds into a connection state under a profile, returning the RSS they cost."""
+    client = discord.Client(
+        intents=profile.intents,
+        member_cache_flags=profile.member_cache_flags,
+        chunk_guilds_at_startup=profile.chunk_guilds_at_startup,
+    )
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=user_payload(BOT_ID))
+    rng = random.Random(seed)
+    # Generate payloads up front so they are not counted
+    payloads = [
+        guild_payload((i + 1) << 32, max(1, int(rng.expovariate(1 / members))), profile.intents, rng)
+        for i in range(guilds)
+    ]
+
+    gc.collect()
+    before = rss_bytes()
+    chunked = 0
+    for data, everyone in payloads:
+        guild = state._add_guild_from_data(data)
+        if state._guild_needs_chunking(guild) or (profile.chunks_lazily and rng.random() < lazy_share):
+            for member_data in everyone:
+                guild._add_member(discord.Member(data=member_data, guild=guild, state=state))
+            chunked += 1
+    del payloads
+    gc.collect()
+    after = rss_bytes()
+
+    return {
+        "profile": profile.name,
+        "guilds": guilds,
+        "chunked": chunked,
+        "cached_members": sum(len(guild._members) for guild in state._guilds.values()),
+        "rss_mb_per_1k_guilds": (after - before) / (1024 * 1024) * 1000 / guilds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MOCBOT's cache memory under each memory profile.")
+    parser.add_argument("--guilds", type=int, default=2000, help="Number of synthetic guilds.")
+    parser.add_argument("--members", type=int, default=200, help="Mean members per guild.")
+    parser.add_argument(
+        "--lazy-share", type=float, default=0.2, help="Share of guilds chunked on use under the lean profile."
+    )
+    parser.add_argument("--cogs", nargs="*", default=DEFAULT_COGS, help="Enabled cogs. Defaults to every cog.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--measure", choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        profile = MemoryProfile.build(args.measure, set(args.cogs))
+        print(json.dumps(measure(profile, args.guilds, args.members, args.lazy_share, args.seed)))
+        return
+
+    print(f"{args.guilds} guilds, {args.members} mean members, cogs: {', '.join(args.cogs)}\n")
+    print(f"{'Profile':<10}{'Chunked':>10}{'Cached members':>17}{'RSS per 1k guilds (MB)':>25}")
+    for name in PROFILES:
+        result = subprocess.run(
+            [sys.executable, __file__, "--measure", name, "--guilds", str(args.guilds), "--members",
+             str(args.members), "--lazy-share", str(args.lazy_share), "--seed", str(args.seed), "--cogs", *args.cogs],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        report = json.loads(result.stdout)
+        print(
+            f"{report['profile']:<10}{report['chunked']:>10}{report['cached_members']:>17}"
+            f"{report['rss_mb_per_1k_guilds']:>25.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
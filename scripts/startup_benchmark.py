@@ -0,0 +1,86 @@
+"""Measures how long MOCBOT takes to become ready, and its peak memory while doing so.
+
+Usage: python scripts/startup_benchmark.py [--runs N] [--timeout SECONDS] [-- LAUNCHER ARGS]
+
+Starts launcher.py, waits for the bot's ready log line, then stops it. Run from the repository root with the same
+environment variables, config and secrets the bot needs, against a Lavalink and API instance that stay up between
+runs so results are comparable.
+"""
+
+import argparse
+import os
+import resource
+import selectors
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+READY_MARKER = "Connected on"
+
+
+def run_once(launcher_args: list[str], timeout: float) -> tuple[float, float]:
+    """Start the bot once, returning (seconds until ready, peak RSS in MB)."""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "launcher.py", *launcher_args],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONUNBUFFERED": "1"},
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+
+    ready_after = None
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ)
+    try:
+        while ready_after is None and time.perf_counter() - started < timeout:
+            if not selector.select(timeout=1):
+                continue
+            line = process.stdout.readline()
+            if not line:
+                break
+            if READY_MARKER in line:
+                ready_after = time.perf_counter() - started
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    if ready_after is None:
+        sys.exit(f"MOCBOT did not become ready within {timeout}s (exit code {process.returncode})")
+
+    # ru_maxrss is the peak of the largest child so far, in KB on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return ready_after, peak_rss_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MOCBOT startup.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to measure.")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for each start.")
+    parser.add_argument("launcher_args", nargs="*", help="Arguments passed to launcher.py, e.g. --dev.")
+    args = parser.parse_args()
+
+    ready_times = []
+    for run in range(1, args.runs + 1):
+        ready_after, peak_rss_mb = run_once(args.launcher_args, args.timeout)
+        ready_times.append(ready_after)
+        print(f"Run {run}: ready in {ready_after:.2f}s, peak RSS so far {peak_rss_mb:.1f}MB")
+
+    print(
+        f"\nTime to ready: median {statistics.median(ready_times):.2f}s, "
+        f"min {min(ready_times):.2f}s, max {max(ready_times):.2f}s"
+    )
+    print(f"Peak RSS: {peak_rss_mb:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+
+import requests
+
+from utils.Metrics import metrics
+
+CIRCUIT_STATE = metrics.gauge(
+    "mocbot_api_circuit_state", "State of each API client's circuit breaker: 0 closed, 1 half open, 2 open", ["client"]
+)
+CIRCUIT_OPENED = metrics.counter("mocbot_api_circuit_opened_total", "Times an API circuit breaker opened", ["client"])
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of making a request while an API's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops requests to an API after failure_threshold consecutive failures, for recovery_seconds.
+
+    Once that time has passed, a single probe request is let through. The circuit closes again if it succeeds, and
+    stays open for another recovery_seconds if it fails. Only failures of the API itself count, such as timeouts and
+    5xx responses, not 4xx responses. Safe to use from any thread.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_seconds: float = 30):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        # When the probe in flight was let through. A probe that never reports back is replaced after recovery_seconds
+        self._probe_started = 0.0
+        CIRCUIT_STATE.set(self._state, client=name)
+
+    @property
+    def is_open(self) -> bool:
+        return self._state == self.OPEN and time.monotonic() - self._opened_at < self.recovery_seconds
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a request through again, or 0 if it already does."""
+        if self._state != self.OPEN:
+            return 0
+        return max(self._opened_at + self.recovery_seconds - time.monotonic(), 0)
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now. While half open, only the probe is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if now - self._opened_at < self.recovery_seconds:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            elif now - self._probe_started < self.recovery_seconds:
+                return False
+            self._probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state != self.CLOSED:
+                self.logger.info("[API] %s circuit closed", self.name)
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self.logger.warning(
+                    "[API] %s circuit opened after %s failures, pausing requests for %ss",
+                    self.name, self._failures, self.recovery_seconds,
+                )
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+                CIRCUIT_OPENED.inc(client=self.name)
+
+    def _set_state(self, state: int):
+        self._state = state
+        CIRCUIT_STATE.set(state, client=self.name)
+
+
+class RetryBudget:
+    """Limits retries to a share of requests, so retries cannot multiply the load on an API that is struggling.
+
+    Every request deposits ratio of a token and every retry withdraws a whole one. min_per_second tokens are added
+    regardless, so occasional failures are retried even when there is little traffic. Safe to use from any thread.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1, max_tokens: float = 10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+
+    def _refill(self, amount: float = 0):
+        now = time.monotonic()
+        self._tokens = min(self._tokens + amount + (now - self._updated) * self.min_per_second, self.max_tokens)
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill(self.ratio)
+
+    def withdraw(self) -> bool:
+        """Take a token for a retry, returning whether one was available."""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
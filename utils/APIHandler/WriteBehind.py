@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+
+import requests
+from requests.exceptions import HTTPError
+
+from utils.APIHandler import IDEMPOTENT_METHODS
+from utils.APIHandler.CircuitBreaker import CircuitOpenError
+
+# How long to wait before retrying writes that failed while the API's circuit was still closed
+RETRY_SECONDS = 5
+
+
+class WriteBehindQueue:
+    """API writes sent in the background by a single task, in the order they were queued.
+
+    Writes that fail because the API is unavailable, including while its circuit breaker is open, are kept and retried
+    once it lets requests through again, rather than dropped. Writes the API rejects are logged and dropped. Meant to
+    be used from the event loop, where the task is started by the first write.
+    """
+
+    def __init__(self, client, name: str):
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.name = name
+        self._writes: deque[tuple[str, str, object]] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def put(self, method: str, route: str, body: object = None):
+        self._writes.append((method, route, body))
+        self._wakeup.set()
+        self.start()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            if not self._writes:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            batch = list(self._writes)
+            sent = await asyncio.to_thread(self.send, batch)
+            for _ in range(sent):
+                self._writes.popleft()
+            if sent < len(batch):
+                await asyncio.sleep(self.client.breaker.retry_after() or RETRY_SECONDS)
+
+    def send(self, batch: list[tuple[str, str, object]]) -> int:
+        """Send writes now, in order, returning how many were sent or dropped before the API became unavailable. Makes
+        blocking requests, so is run in a thread."""
+        for sent, (method, route, body) in enumerate(batch):
+            try:
+                self.client._make_request(method, route, body)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if self._may_resend(method, e):
+                    self.logger.warning("[%s] API unavailable, keeping %s writes: %s", self.name, len(batch) - sent, e)
+                    return sent
+                self.logger.error("[%s] Failed to send %s %s, which may have been applied: %s", self.name, method,
+                                  route, e)
+            except HTTPError as e:
+                if e.response is not None and e.response.status_code >= 500 and self._may_resend(method, e):
+                    return sent
+                self.logger.error("[%s] Failed to send %s %s: %s", self.name, method, route, e)
+            except Exception as e:
+                self.logger.error("[%s] Failed to send %s %s: %s", self.name, method, route, e)
+        return len(batch)
+
+    @staticmethod
+    def _may_resend(method: str, error: Exception) -> bool:
+        """Whether a failed write can be sent again: if it is safe to send twice, or cannot have reached the API."""
+        return method in IDEMPOTENT_METHODS or isinstance(
+            error, (CircuitOpenError, requests.exceptions.ConnectTimeout)
+        )
@@ -1,96 +1,278 @@
+import asyncio
 import logging
 import os
+import random
+import threading
+import time
+from collections import OrderedDict
 from requests.exceptions import HTTPError
 import requests
+from typing import Optional
+
+from utils.APIHandler.CircuitBreaker import CircuitBreaker, CircuitOpenError, RetryBudget
+from utils.APIModels import APIModel
+from utils.Metrics import metrics, route_template
+
+API_REQUESTS = metrics.counter(
+    "mocbot_api_requests_total",
+    "API requests by client, method, route and status",
+    ["client", "method", "route", "status"],
+)
+API_REQUEST_SECONDS = metrics.histogram(
+    "mocbot_api_request_seconds", "API request latency by client, method and route", ["client", "method", "route"]
+)
+API_RETRIES = metrics.counter(
+    "mocbot_api_retries_total", "API request retries by client, and whether the retry budget allowed them",
+    ["client", "result"],
+)
+API_STALE_FALLBACKS = metrics.counter(
+    "mocbot_api_stale_fallbacks_total", "Reads served from the last response while an API was unavailable",
+    ["client", "route"],
+)
+
+# Methods that are safe to retry after a request may have reached the API
+IDEMPOTENT_METHODS = ("GET", "PUT", "DELETE")
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
 
 
 class BaseAPIClient:
-    """Base API client with common HTTP methods."""
+    """Base API client with common HTTP methods.
+
+    Each client has its own circuit breaker, which fails requests fast while its API is down. Requests that fail
+    because the API is unavailable are retried with jittered backoff, within a retry budget shared by the client, and
+    GETs fall back to the last response of their route if they still fail. Retries are skipped on the event loop,
+    where waiting would hold up the whole bot.
+    """
 
     BASE_URL = None
+    # Path to the file holding the API key. The key is read on the first request rather than at import
+    API_KEY_FILE = None
     API_KEY = None
     LOGGER = logging.getLogger(__name__)
 
+    # Seconds to wait for a response, by route template, e.g. /xp/:id
+    TIMEOUT = 5
+    ROUTE_TIMEOUTS: dict[str, float] = {}
+    MAX_ATTEMPTS = 3
+    BACKOFF_SECONDS = 0.25
+    MAX_BACKOFF_SECONDS = 2
+    # Number of GET routes whose last response is kept to fall back to
+    MAX_LAST_RESPONSES = 2048
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.breaker = CircuitBreaker(cls.__name__)
+        cls.retry_budget = RetryBudget()
+        cls._last_responses: OrderedDict[str, object] = OrderedDict()
+        cls._last_responses_lock = threading.Lock()
+
+    @classmethod
+    def _api_key(cls) -> str:
+        if cls.API_KEY is None:
+            with open(cls.API_KEY_FILE, "r", encoding="utf-8") as f:
+                cls.API_KEY = f.read().strip()
+        return cls.API_KEY
+
+    @staticmethod
+    def _to_int(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
+
     @staticmethod
     def convert_to_int(data):
-        """Recursively convert string values to integers where possible."""
+        """Convert top level string values to integers where possible, returning a copy. Only used for routes
+        without a model, as it also converts strings that merely look like numbers, such as names."""
         if isinstance(data, dict):
-            for key in data:
-                try:
-                    temp = int(data[key])
-                except (TypeError, ValueError):
-                    continue
+            return {key: BaseAPIClient._to_int(value) for key, value in data.items()}
+        if isinstance(data, list):
+            return [BaseAPIClient._to_int(item) for item in data]
+        return data
+
+    @staticmethod
+    def decode(data, model: Optional[type[APIModel]]):
+        """Decode a response into model, or a list of them if it is a list. Empty responses decode to None."""
+        if model is None:
+            return BaseAPIClient.convert_to_int(data)
+        if isinstance(data, list):
+            return model.decode_many(data)
+        return model.decode(data) if data else None
+
+    @classmethod
+    def _make_request(self, method: str, route: str, body: object = None, model: Optional[type[APIModel]] = None):
+        """Internal method to make HTTP requests. Responses are decoded into model if one is given."""
+        if not self.breaker.allow():
+            return self._fall_back(method, route, model, CircuitOpenError(f"{self.__name__} circuit is open"))
+
+        self.retry_budget.deposit()
+        attempts = 1 if _on_event_loop() else self.MAX_ATTEMPTS
+        for attempt in range(attempts):
+            try:
+                req = self._send(method, route, body)
+            except requests.exceptions.HTTPError as err:
+                status_code = err.response.status_code if err.response is not None else 500
+                unavailable = status_code >= 500
+                if unavailable:
+                    self.breaker.record_failure()
                 else:
-                    data[key] = temp
-        elif isinstance(data, list):
-            for i, item in enumerate(data):
-                try:
-                    temp = int(item)
-                except (TypeError, ValueError):
+                    self.breaker.record_success()
+                retryable = (unavailable or status_code == 429) and method in IDEMPOTENT_METHODS
+                if retryable and self._retry(attempt, attempts):
                     continue
+                if unavailable and self._has_last_response(method, route):
+                    return self._fall_back(method, route, model, err)
+                if status_code == 404:
+                    self._forget_response(route)
+
+                status = err.args[0].split(":")[0]
+                self.LOGGER.error("[API] Request to %s failed with status %s", route, status)
+                raise HTTPError(f"{status}", response=getattr(err, 'response', None)) from err
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                self.breaker.record_failure()
+                # Only retried if the request cannot have reached the API, unless it is safe to send twice
+                retryable = method in IDEMPOTENT_METHODS or isinstance(err, requests.exceptions.ConnectTimeout)
+                if retryable and self._retry(attempt, attempts):
+                    continue
+                return self._fall_back(method, route, model, err)
+            else:
+                self.breaker.record_success()
+                data = None if req.status_code == 204 else req.json()
+                try:
+                    decoded = self.decode(data, model) if data is not None else None
+                except (TypeError, ValueError) as err:
+                    # Raised as an HTTPError, which callers already handle, rather than failing them in a new way
+                    self.LOGGER.error("[API] Response of %s could not be decoded: %s", route, err)
+                    raise HTTPError(f"Invalid response: {err}", response=req) from err
+                if method == "GET":
+                    self._remember_response(route, data)
                 else:
-                    data[i] = temp
-        return data
+                    self._forget_response(route)
+                return decoded
 
     @classmethod
-    def _make_request(self, method: str, route: str, body: object = None):
-        """Internal method to make HTTP requests."""
+    def _send(self, method: str, route: str, body: object = None) -> requests.Response:
+        """Make a single request, raising HTTPError for error responses."""
+        labels = {"client": self.__name__, "method": method, "route": route_template(route)}
+        # Stays "error" if no response is received, e.g. on a timeout
+        status_code = "error"
+        started = time.perf_counter()
         try:
             url = self.BASE_URL + route
-            headers = {"X-API-KEY": self.API_KEY}
+            headers = {"X-API-KEY": self._api_key()}
+            timeout = self.ROUTE_TIMEOUTS.get(labels["route"].split("?")[0], self.TIMEOUT)
 
             if method in ["POST", "PATCH", "PUT"]:
-                req = requests.request(method, url, headers=headers, json=body if body is not None else {}, timeout=10)
+                req = requests.request(
+                    method, url, headers=headers, json=body if body is not None else {}, timeout=timeout
+                )
             else:
-                req = requests.request(method, url, headers=headers, timeout=10)
+                req = requests.request(method, url, headers=headers, timeout=timeout)
 
+            status_code = req.status_code
             req.raise_for_status()
-        except requests.exceptions.HTTPError as err:
-            status = err.args[0].split(":")[0]
-            self.LOGGER.error("[API] Request to %s failed with status %s", route, status)
-            raise HTTPError(f"{status}", response=getattr(err, 'response', None)) from err
-        else:
-            if req.status_code == 204:
-                return None
-            return self.convert_to_int(req.json())
+            return req
+        finally:
+            API_REQUEST_SECONDS.observe(time.perf_counter() - started, **labels)
+            API_REQUESTS.inc(status=status_code, **labels)
+
+    @classmethod
+    def _retry(self, attempt: int, attempts: int) -> bool:
+        """Wait before retrying a failed attempt, returning False instead if it should not be retried."""
+        if attempt + 1 >= attempts or self.breaker.is_open:
+            return False
+        if not self.retry_budget.withdraw():
+            API_RETRIES.inc(client=self.__name__, result="budget_exhausted")
+            return False
+
+        API_RETRIES.inc(client=self.__name__, result="retried")
+        # Full jitter, so clients that failed together do not retry together
+        time.sleep(random.uniform(0, min(self.MAX_BACKOFF_SECONDS, self.BACKOFF_SECONDS * 2**attempt)))
+        return True
+
+    @classmethod
+    def _has_last_response(self, method: str, route: str) -> bool:
+        return method == "GET" and route in self._last_responses
+
+    @classmethod
+    def _fall_back(self, method: str, route: str, model: Optional[type[APIModel]], err: Exception):
+        """Serve the last response of a GET route while the API is unavailable, or raise err if there is none."""
+        with self._last_responses_lock:
+            data = self._last_responses.get(route) if method == "GET" else None
+        if data is None:
+            # Requests refused by an open circuit are not logged one by one, as it opening already is
+            log = self.LOGGER.debug if isinstance(err, CircuitOpenError) else self.LOGGER.error
+            log("[API] Request to %s failed: %s", route, err)
+            raise err
+
+        API_STALE_FALLBACKS.inc(client=self.__name__, route=route_template(route))
+        self.LOGGER.warning("[API] %s is unavailable, serving the last response of %s", self.__name__, route)
+        return self.decode(data, model)
+
+    @classmethod
+    def _remember_response(self, route: str, data: object):
+        if data is None:
+            return self._forget_response(route)
+        with self._last_responses_lock:
+            self._last_responses[route] = data
+            self._last_responses.move_to_end(route)
+            if len(self._last_responses) > self.MAX_LAST_RESPONSES:
+                self._last_responses.popitem(last=False)
+
+    @classmethod
+    def _forget_response(self, route: str):
+        """Drop the last response of a route, e.g. once it is written to, so it is never served out of date."""
+        with self._last_responses_lock:
+            self._last_responses.pop(route, None)
 
     @classmethod
-    def post(self, route: str, body: object = None):
+    def post(self, route: str, body: object = None, model: Optional[type[APIModel]] = None):
         """Send a POST request."""
-        return self._make_request("POST", route, body)
+        return self._make_request("POST", route, body, model)
 
     @classmethod
-    def get(self, route: str):
+    def get(self, route: str, model: Optional[type[APIModel]] = None):
         """Send a GET request."""
-        return self._make_request("GET", route)
+        return self._make_request("GET", route, model=model)
 
     @classmethod
-    def patch(self, route: str, body: object = None):
+    def patch(self, route: str, body: object = None, model: Optional[type[APIModel]] = None):
         """Send a PATCH request."""
-        return self._make_request("PATCH", route, body)
+        return self._make_request("PATCH", route, body, model)
 
     @classmethod
-    def put(self, route: str, body: object = None):
+    def put(self, route: str, body: object = None, model: Optional[type[APIModel]] = None):
         """Send a PUT request."""
-        return self._make_request("PUT", route, body)
+        return self._make_request("PUT", route, body, model)
 
     @classmethod
-    def delete(self, route: str):
+    def delete(self, route: str, model: Optional[type[APIModel]] = None):
         """Send a DELETE request."""
-        return self._make_request("DELETE", route)
+        return self._make_request("DELETE", route, model=model)
 
 
 class API(BaseAPIClient):
     """Main API client."""
 
     BASE_URL = os.environ["API_URL"]
-    with open(os.environ["API_KEY"], "r", encoding="utf-8") as f:
-        API_KEY = f.read().strip()
+    API_KEY_FILE = os.environ["API_KEY"]
 
 
 class ArchiveAPI(BaseAPIClient):
     """Archive API client."""
 
     BASE_URL = os.environ["ARCHIVE_API_URL"]
-    with open(os.environ["ARCHIVE_API_KEY"], "r", encoding="utf-8") as f:
-        API_KEY = f.read().strip()
+    API_KEY_FILE = os.environ["ARCHIVE_API_KEY"]
+    # Aggregations over play history, which take longer than lookups
+    ROUTE_TIMEOUTS = {
+        "/guilds/:id/artists/recommended": 10,
+        "/guilds/:id/tracks/recent": 10,
+        "/users/:id/tracks/recent": 10,
+    }
@@ -0,0 +1,181 @@
+import dataclasses
+from dataclasses import dataclass
+from typing import Any, Callable, ClassVar, Optional, TypeVar, Union, get_args, get_origin, get_type_hints
+
+T = TypeVar("T", bound="APIModel")
+
+# Words the API writes in capitals when converting a field name to its key
+ACRONYMS = {"id": "ID", "xp": "XP", "url": "URL"}
+
+
+def api_key(name: str) -> str:
+    """The API's key for a field name, e.g. voice_channel_xp_lock -> VoiceChannelXPLock."""
+    return "".join(ACRONYMS.get(part, part.capitalize()) for part in name.split("_"))
+
+
+def key(name: str, **kwargs) -> Any:
+    """A field whose API key does not follow api_key, e.g. camelCase keys of the archive API."""
+    return dataclasses.field(metadata={"key": name}, **kwargs)
+
+
+def _converter(annotation) -> Callable[[Any], Any]:
+    """Build the function converting a JSON value to a field's type."""
+    origin = get_origin(annotation)
+    if origin is Union:
+        (inner,) = [arg for arg in get_args(annotation) if arg is not type(None)]
+        convert = _converter(inner)
+
+        def optional(value):
+            # The API sends unset values as empty strings or objects in places, and a value that does not convert is
+            # treated as unset rather than failing the whole response
+            if value is None or value == "" or value == {}:
+                return None
+            try:
+                return convert(value)
+            except (TypeError, ValueError):
+                return None
+
+        return optional
+    if origin is list:
+        convert = _converter(get_args(annotation)[0])
+        return lambda value: [convert(item) for item in value]
+    if isinstance(annotation, type) and issubclass(annotation, APIModel):
+        return annotation.decode
+    if annotation is bool:
+        return lambda value: value if isinstance(value, bool) else bool(int(value))
+    if annotation in (int, float, str):
+        return annotation
+    return lambda value: value
+
+
+class APIModel:
+    """Base of typed API responses. Subclasses are slotted dataclasses whose fields name the keys they are read from.
+
+    Each model's decoder is compiled on first use from its field types, then reused for every response. Keys the
+    model does not declare are dropped, and values are converted to the field's type.
+    """
+
+    __slots__ = ()
+    _decoder: ClassVar[Optional[Callable[[dict], Any]]] = None
+
+    @classmethod
+    def decode(cls: type[T], data: dict) -> T:
+        decoder = cls.__dict__.get("_decoder")
+        if decoder is None:
+            decoder = cls._decoder = cls._compile()
+        return decoder(data)
+
+    @classmethod
+    def decode_many(cls: type[T], data: Optional[list]) -> list[T]:
+        decode = cls.decode
+        return [decode(item) for item in data or []]
+
+    @classmethod
+    def _compile(cls) -> Callable[[dict], Any]:
+        hints = get_type_hints(cls)
+        fields = tuple(
+            (
+                field.name,
+                field.metadata.get("key", api_key(field.name)),
+                _converter(hints[field.name]),
+                field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING,
+            )
+            for field in dataclasses.fields(cls)
+        )
+
+        def decode(data: dict):
+            values = {}
+            for name, field_key, convert, required in fields:
+                value = data.get(field_key)
+                if value is None:
+                    if required:
+                        raise ValueError(f"{cls.__name__} response is missing {field_key}")
+                    continue
+                try:
+                    values[name] = convert(value)
+                except (TypeError, ValueError):
+                    # Fields with a default fall back to it rather than failing the whole response
+                    if required:
+                        raise
+            return cls(**values)
+
+        return decode
+
+
+@dataclass(slots=True)
+class XPRow(APIModel):
+    """A member's XP in a guild, from /xp."""
+
+    user_id: Optional[int] = None
+    xp: int = 0
+    level: int = 0
+    # Timestamps until which message and voice XP are not given
+    xp_lock: Optional[float] = None
+    voice_channel_xp_lock: Optional[float] = None
+
+
+@dataclass(slots=True)
+class VerificationSettings(APIModel):
+    """A guild's verification settings. Roles the guild has not set up yet are None."""
+
+    verification_role_id: Optional[int] = None
+    verified_role_id: Optional[int] = None
+    lockdown_role_id: Optional[int] = None
+    lockdown_approvals_channel_id: Optional[int] = None
+
+
+@dataclass(slots=True)
+class GuildSettings(APIModel):
+    """A guild's settings, from /settings."""
+
+    enabled_modules: list[str] = dataclasses.field(default_factory=list)
+    verification: Optional[VerificationSettings] = None
+    xp_level_up_message: bool = False
+    music_channel: Optional[int] = None
+    lobby_category: Optional[int] = None
+
+
+@dataclass(slots=True)
+class Lobby(APIModel):
+    """A lobby, from /lobbies."""
+
+    leader_id: int
+    voice_channel_id: int
+    text_channel_id: int
+    role_id: int
+    lobby_name: str = ""
+    invite_only: bool = False
+    # Only sent when listing lobbies across guilds
+    guild_id: Optional[int] = None
+
+
+@dataclass(slots=True)
+class AFKEntry(APIModel):
+    """A member who is AFK, from /afk."""
+
+    message_id: int
+    channel_id: int
+    old_name: str
+    user_id: Optional[int] = None
+    reason: Optional[str] = None
+
+
+@dataclass(slots=True)
+class TrackPlay(APIModel):
+    """A play of a track, from the archive API."""
+
+    url: str = ""
+    title: str = "Unknown Title"
+    artist: str = "Unknown Artist"
+    duration_ms: int = 0
+    guild_id: Optional[int] = None
+    queued_by_user: Optional[int] = None
+    started_at: Optional[str] = None
+
+
+@dataclass(slots=True)
+class RecentTracks(APIModel):
+    """Recently played tracks of a guild or user, from the archive API."""
+
+    guild_id: Optional[int] = key("guildId", default=None)
+    track_plays: list[TrackPlay] = key("trackPlays", default_factory=list)
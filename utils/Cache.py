@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import random
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, Hashable, Iterable, Optional, TypeVar
+
+from utils.Metrics import CACHE_REQUESTS, metrics
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Returned by Cache.get for keys with no usable entry, as None is a valid, negatively cached, value
+MISSING: Any = object()
+
+CACHE_EVICTIONS = metrics.counter(
+    "mocbot_cache_evictions_total", "Entries dropped from the bot's caches, by cache and reason", ["cache", "reason"]
+)
+CACHE_REFRESHES = metrics.counter(
+    "mocbot_cache_refreshes_total", "Background refreshes of stale cache entries, by cache and outcome",
+    ["cache", "outcome"],
+)
+
+
+def sizeof(value, _seen: Optional[set[int]] = None) -> int:
+    """Estimate the memory used by a value in bytes, including the containers, instance dicts and slots it holds."""
+    seen = _seen if _seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        return size + sum(sizeof(k, seen) + sizeof(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(sizeof(item, seen) for item in value)
+    if hasattr(value, "__dict__"):
+        size += sizeof(vars(value), seen)
+    for cls in type(value).__mro__:
+        for slot in cls.__dict__.get("__slots__", ()):
+            if hasattr(value, slot):
+                size += sizeof(getattr(value, slot), seen)
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "expires_at", "size")
+
+    def __init__(self, value, fresh_until: float, expires_at: float, size: int):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.expires_at = expires_at
+        self.size = size
+
+
+class Cache(Generic[K, V]):
+    """An LRU cache whose entries expire after ttl seconds.
+
+    Entries stay usable for stale_ttl seconds more, during which get_or_load serves them as is and refreshes them in
+    the background, so callers never wait on a refetch of a key they have used recently. None values are cached for
+    negative_ttl seconds instead, so lookups of things that do not exist are not refetched on every call. Each ttl is
+    spread by up to jitter of itself, so entries loaded together do not all expire together. If maxbytes is set, least
+    recently used entries are also evicted once the estimated memory of the entries exceeds it.
+
+    Caches are registered by name on creation, and report their lookups, evictions, size and memory as metrics. Meant
+    to be used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float,
+        stale_ttl: float = 0,
+        negative_ttl: float = 0,
+        jitter: float = 0.1,
+        maxbytes: Optional[int] = None,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.jitter = jitter
+        self.maxbytes = maxbytes
+        # Estimated memory of every entry, kept only if maxbytes is set
+        self.bytes = 0
+        self._entries: OrderedDict[K, _Entry] = OrderedDict()
+        # key -> load in progress, so concurrent misses and refreshes of a key share one request
+        self._loads: dict[K, asyncio.Task] = {}
+        caches.register(self)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        """Whether key has an entry that can still be served, fresh or stale."""
+        entry = self._entries.get(key)
+        return entry is not None and entry.expires_at > time.monotonic()
+
+    def _lookup(self, key: K) -> tuple[Optional[_Entry], bool]:
+        """Get the entry of a key and whether it is fresh, dropping it if it has expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            CACHE_REQUESTS.inc(cache=self.name, result="miss")
+            return None, False
+
+        now = time.monotonic()
+        if entry.expires_at <= now:
+            self._remove(key)
+            CACHE_EVICTIONS.inc(cache=self.name, reason="expired")
+            CACHE_REQUESTS.inc(cache=self.name, result="miss")
+            return None, False
+
+        self._entries.move_to_end(key)
+        fresh = entry.fresh_until > now
+        CACHE_REQUESTS.inc(cache=self.name, result="hit" if fresh else "stale")
+        return entry, fresh
+
+    def get(self, key: K, default=MISSING):
+        """Get the value of a key, fresh or stale, or default if it has none."""
+        entry, _ = self._lookup(key)
+        return entry.value if entry is not None else default
+
+    def peek(self, key: K, default=MISSING):
+        """Like get, but without counting as a lookup or use of the key, e.g. for background tasks."""
+        entry = self._entries.get(key)
+        return entry.value if entry is not None and entry.expires_at > time.monotonic() else default
+
+    def set(self, key: K, value: V):
+        """Store the value of a key, evicting the least recently used entry if the cache is full. A value of None
+        records that the key does not exist, and is only stored if negative_ttl is set."""
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0:
+            self.invalidate(key)
+            return
+
+        ttl *= 1 + random.uniform(-self.jitter, self.jitter)
+        now = time.monotonic()
+        stale_ttl = self.stale_ttl if value is not None else 0
+        size = sizeof(key) + sizeof(value) if self.maxbytes is not None else 0
+        self._remove(key)
+        self._entries[key] = _Entry(value, now + ttl, now + ttl + stale_ttl, size)
+        self.bytes += size
+        # The entry just stored is kept even if it alone exceeds maxbytes
+        while len(self._entries) > self.maxsize or (
+            self.maxbytes is not None and self.bytes > self.maxbytes and len(self._entries) > 1
+        ):
+            self._remove(next(iter(self._entries)))
+            CACHE_EVICTIONS.inc(cache=self.name, reason="size")
+
+    def _remove(self, key: K):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def invalidate(self, key: K):
+        self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    async def get_or_load(self, key: K, loader: Callable[[], Awaitable[V]]) -> V:
+        """Get the value of a key, loading it with loader if it has none. Stale values are returned at once and
+        refreshed with loader in the background."""
+        entry, fresh = self._lookup(key)
+        if entry is None:
+            return await self.refresh(key, loader)
+
+        if not fresh and key not in self._loads:
+            task = self._load(key, loader)
+            task.add_done_callback(self._log_refresh)
+        return entry.value
+
+    async def refresh(self, key: K, loader: Callable[[], Awaitable[V]]) -> V:
+        """Load the value of a key with loader and store it, sharing any load of the key already in progress."""
+        task = self._loads.get(key)
+        if task is None:
+            task = self._load(key, loader)
+        # Shielded, so a caller that is cancelled does not cancel the load for everyone else waiting on it
+        return await asyncio.shield(task)
+
+    def _load(self, key: K, loader: Callable[[], Awaitable[V]]) -> asyncio.Task:
+        # Local writes made while the load is in progress are newer than what it returns, so they are kept
+        entry = self._entries.get(key)
+
+        async def load() -> V:
+            try:
+                value = await loader()
+                if self._entries.get(key) is entry:
+                    self.set(key, value)
+                return value
+            finally:
+                self._loads.pop(key, None)
+
+        task = self._loads[key] = asyncio.create_task(load())
+        return task
+
+    def _log_refresh(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            CACHE_REFRESHES.inc(cache=self.name, outcome="failed")
+            self.logger.warning("[CACHE] Failed to refresh a %s entry: %s", self.name, task.exception())
+        else:
+            CACHE_REFRESHES.inc(cache=self.name, outcome="refreshed")
+
+
+class CacheRegistry:
+    """Every cache by name, so their sizes can be reported together. A cache replaces any of the same name, e.g.
+    when a cog is reloaded."""
+
+    def __init__(self):
+        self._caches: dict[str, Cache] = {}
+
+    def register(self, cache: Cache):
+        self._caches[cache.name] = cache
+
+    def get(self, name: str) -> Optional[Cache]:
+        return self._caches.get(name)
+
+    def samples(self) -> Iterable[tuple[tuple[str, ...], float]]:
+        return [((name,), len(cache)) for name, cache in list(self._caches.items())]
+
+    def byte_samples(self) -> Iterable[tuple[tuple[str, ...], float]]:
+        return [((name,), cache.bytes) for name, cache in list(self._caches.items()) if cache.maxbytes is not None]
+
+
+caches = CacheRegistry()
+metrics.gauge("mocbot_cache_entries", "Entries held by each of the bot's caches", ["cache"], function=caches.samples)
+metrics.gauge(
+    "mocbot_cache_bytes", "Estimated memory of the caches bounded by memory, in bytes", ["cache"],
+    function=caches.byte_samples,
+)
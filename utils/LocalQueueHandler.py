@@ -0,0 +1,16 @@
+import copy
+import logging.handlers
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """Queues records for a QueueListener in the same process.
+
+    Only the message is rendered before queueing, so its arguments cannot change before the listener gets to it.
+    Unlike QueueHandler, exception info is kept so the listener's handlers can format it themselves.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+
+from utils.Metrics import EVENT_LOOP_LAG, metrics
+
+ROOT = Path(__file__).resolve().parent.parent
+
+STALLS = metrics.counter("mocbot_event_loop_stalls_total", "Event loop stalls, by the call site blocking it", ["site"])
+STALL_SECONDS = metrics.histogram(
+    "mocbot_event_loop_stall_seconds",
+    "How long the event loop was blocked for, per stall",
+    buckets=(0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+
+class LoopWatchdog:
+    """Measures event loop lag from a background thread, and reports what is blocking the loop when it stalls.
+
+    Every interval, the thread schedules a callback on the loop and times how long it takes to run. If it has not
+    run within threshold, the loop thread's stack is captured. The call site blamed is the innermost frame in lib/,
+    so a blocking API call is blamed on the cog making it rather than on the API client, falling back to the
+    innermost frame of this repository. Stalls are counted per call site.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float = 0.25, interval: float = 0.5):
+        self.logger = logging.getLogger(__name__)
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval
+        self.stall_counts: Counter[str] = Counter()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+
+    def start(self):
+        """Start watching. Must be called from the thread running the loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._beat.clear()
+            sent = time.perf_counter()
+            try:
+                self.loop.call_soon_threadsafe(self._beat.set)
+            except RuntimeError:
+                # The loop is closed
+                return
+
+            if not self._beat.wait(self.threshold):
+                site, stack = self._capture()
+                # Keep checking for the stop signal in case the loop never recovers
+                while not self._beat.wait(self.threshold) and not self._stopped.is_set():
+                    pass
+                self._report(site, stack, time.perf_counter() - sent)
+
+            EVENT_LOOP_LAG.observe(time.perf_counter() - sent)
+
+    def _capture(self) -> tuple[str, list[str]]:
+        """Find the call site blocking the loop thread, and its stack."""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return "unknown", []
+
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+
+        ours = [frame for frame in frames if self._in_repo(frame)]
+        in_lib = [frame for frame in ours if Path(frame.f_code.co_filename).resolve().is_relative_to(ROOT / "lib")]
+        blamed = (in_lib or ours or frames)[0]
+        site = f"{self._relative(blamed.f_code.co_filename)}:{blamed.f_code.co_name}"
+        return site, traceback.format_stack(frames[0])[-15:]
+
+    def _report(self, site: str, stack: list[str], duration: float):
+        self.stall_counts[site] += 1
+        STALLS.inc(site=site)
+        STALL_SECONDS.observe(duration)
+        self.logger.warning(
+            "[WATCHDOG] Event loop blocked for %.0fms by %s (%s stalls there so far). Stack when detected:\n%s",
+            duration * 1000,
+            site,
+            self.stall_counts[site],
+            "".join(stack).rstrip(),
+        )
+
+    @staticmethod
+    def _in_repo(frame: FrameType) -> bool:
+        path = Path(frame.f_code.co_filename).resolve()
+        return path.is_relative_to(ROOT) and path != Path(__file__).resolve() and "site-packages" not in path.parts
+
+    @staticmethod
+    def _relative(filename: str) -> str:
+        path = Path(filename).resolve()
+        return str(path.relative_to(ROOT)) if path.is_relative_to(ROOT) else path.name
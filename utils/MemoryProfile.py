@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+
+import discord
+
+PROFILES = ("full", "lean")
+
+# Needed whatever cogs are enabled: guild and channel state, developer commands sent by DM, and the bot's own voice
+# connection for Lavalink
+BASE_INTENTS = ("guilds", "dm_messages", "voice_states")
+
+# Intents each cog needs on top of BASE_INTENTS. Slash commands need no intents. No cog reads message content
+COG_INTENTS = {
+    "AFK": ("guild_messages",),
+    "Levels": ("guild_messages", "members", "presences"),
+    # Invite, kick and transfer prompts wait for a message mentioning the member
+    "Lobbies": ("guild_messages", "members", "presences"),
+    "Roles": ("members",),
+    "Verification": ("members",),
+}
+
+# Cogs that read member presence. Guilds using them have their members chunked on first use
+CHUNKING_COGS = {"Levels", "Lobbies"}
+
+
+@dataclass
+class MemoryProfile:
+    """The intents and member caching the bot runs with.
+
+    The full profile requests every intent, caches every member and chunks every guild at startup. The lean profile
+    requests only the intents the enabled cogs need and never chunks at startup. Members are only kept when a
+    presence reading cog is enabled, and guilds are chunked the first time one of those cogs uses them.
+    """
+
+    name: str
+    intents: discord.Intents
+    member_cache_flags: discord.MemberCacheFlags
+    chunk_guilds_at_startup: bool
+
+    @classmethod
+    def build(cls, name: str, cogs: set[str]) -> "MemoryProfile":
+        if name not in PROFILES:
+            raise ValueError(f"Unknown memory profile {name}, expected one of {', '.join(PROFILES)}")
+
+        if name == "full":
+            intents = discord.Intents.all()
+            return cls(name, intents, discord.MemberCacheFlags.from_intents(intents), True)
+
+        intents = discord.Intents.none()
+        for intent in BASE_INTENTS + tuple(intent for cog in cogs for intent in COG_INTENTS.get(cog, ())):
+            setattr(intents, intent, True)
+
+        member_cache_flags = discord.MemberCacheFlags.none()
+        member_cache_flags.voice = True
+        # Presence updates are dropped for members that are not cached, so presence readers need joined members kept
+        member_cache_flags.joined = bool(cogs & CHUNKING_COGS)
+        return cls(name, intents, member_cache_flags, False)
+
+    @property
+    def chunks_lazily(self) -> bool:
+        return self.member_cache_flags.joined and not self.chunk_guilds_at_startup
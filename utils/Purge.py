@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+import discord
+import asyncio
+import time
+
+from utils.RestScheduler import Priority, RestScheduler
+
+# Discord only bulk deletes messages younger than 14 days. Keep a margin for messages aging out mid-purge
+BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+BULK_DELETE_CHUNK_SIZE = 100
+# Rough time per single delete, used to estimate how long deleting old messages will take
+SINGLE_DELETE_ESTIMATE_SECONDS = 0.75
+
+
+class PurgeEngine:
+    """Collects and deletes messages for a channel purge.
+
+    The history scan is bounded by max_scan and an optional after cutoff. Recent messages are bulk deleted in
+    chunks of 100. Older messages are deleted individually by a few concurrent workers, paced by discord.py's
+    rate limit handling, which follows the bucket headers Discord returns, rather than a fixed sleep. If a scheduler
+    is given, single deletes go through it as background requests, so a large purge yields to interactive traffic.
+    """
+
+    def __init__(
+        self,
+        channel: discord.abc.Messageable,
+        quantity: int,
+        user: Optional[discord.abc.User] = None,
+        after: Optional[datetime] = None,
+        max_scan: int = 10_000,
+        concurrency: int = 3,
+        progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+        progress_interval: float = 2,
+        scheduler: Optional[RestScheduler] = None,
+    ):
+        self.channel = channel
+        self.quantity = quantity
+        self.user = user
+        self.after = after
+        self.max_scan = max_scan
+        self.concurrency = concurrency
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.scheduler = scheduler
+
+        self.recent_messages: list[discord.Message] = []
+        self.older_messages: list[discord.Message] = []
+        self.scanned = 0
+        self.deleted = 0
+        self.failed = 0
+        self._last_progress = 0.0
+
+    @property
+    def total(self) -> int:
+        return len(self.recent_messages) + len(self.older_messages)
+
+    @property
+    def scan_limit_reached(self) -> bool:
+        """Whether the scan stopped at max_scan before finding quantity messages."""
+        return self.scanned >= self.max_scan and self.total < self.quantity
+
+    def estimate_seconds(self) -> float:
+        return SINGLE_DELETE_ESTIMATE_SECONDS * len(self.older_messages) / self.concurrency
+
+    async def collect(self):
+        """Scan the channel history, newest first, for up to quantity messages to purge."""
+        bulk_cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        async for message in self.channel.history(limit=self.max_scan, after=self.after, oldest_first=False):
+            self.scanned += 1
+            if self.user and message.author != self.user:
+                continue
+
+            if message.created_at > bulk_cutoff:
+                self.recent_messages.append(message)
+            else:
+                self.older_messages.append(message)
+            if self.total == self.quantity:
+                break
+
+    async def delete(self, reason: str) -> int:
+        """Delete every collected message, returning how many were deleted."""
+        single_deletes = list(self.older_messages)
+        for i in range(0, len(self.recent_messages), BULK_DELETE_CHUNK_SIZE):
+            chunk = self.recent_messages[i:i + BULK_DELETE_CHUNK_SIZE]
+            try:
+                await self.channel.delete_messages(chunk, reason=reason)
+            except discord.NotFound:
+                # Some messages were already deleted, fall back to deleting the chunk one by one
+                single_deletes.extend(chunk)
+            else:
+                self.deleted += len(chunk)
+            await self._report_progress()
+
+        queue: asyncio.Queue[discord.Message] = asyncio.Queue()
+        for message in single_deletes:
+            queue.put_nowait(message)
+        workers = [asyncio.create_task(self._delete_worker(queue)) for _ in range(min(self.concurrency, queue.qsize()))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+        await self._report_progress(force=True)
+        return self.deleted
+
+    async def _delete_worker(self, queue: asyncio.Queue):
+        while not queue.empty():
+            message = queue.get_nowait()
+            try:
+                if self.scheduler is not None:
+                    await self.scheduler.run(Priority.BACKGROUND, message.delete, sheddable=False)
+                else:
+                    await message.delete()
+            except discord.NotFound:
+                pass
+            except discord.HTTPException:
+                self.failed += 1
+            else:
+                self.deleted += 1
+            await self._report_progress()
+
+    async def _report_progress(self, force: bool = False):
+        if self.progress is None:
+            return
+
+        now = time.monotonic()
+        if force or now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            try:
+                await self.progress(self.deleted, self.total)
+            except discord.HTTPException:
+                # Progress is best effort, e.g. the interaction may have expired on a long purge
+                pass
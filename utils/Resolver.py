@@ -0,0 +1,52 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, Union
+
+import discord
+
+from utils.Metrics import record_cache_lookup
+
+GuildChannel = Union[discord.abc.GuildChannel, discord.Thread]
+
+
+class Resolver:
+    """Resolves guilds, members and channels from the gateway cache, falling back to the REST API on a miss.
+
+    Concurrent REST lookups of the same object share a single request. Fetched objects are not kept, as the cache
+    is kept up to date by gateway events and they would not be.
+    """
+
+    def __init__(self, bot: discord.Client):
+        self.bot = bot
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+    async def guild(self, guild_id: Union[int, str]) -> discord.Guild:
+        guild_id = int(guild_id)
+        guild = self.bot.get_guild(guild_id)
+        record_cache_lookup("discord_guilds", guild is not None)
+        if guild is not None:
+            return guild
+        return await self._coalesce(("guild", guild_id), lambda: self.bot.fetch_guild(guild_id))
+
+    async def member(self, guild: discord.Guild, member_id: Union[int, str]) -> discord.Member:
+        member_id = int(member_id)
+        member = guild.get_member(member_id)
+        record_cache_lookup("discord_members", member is not None)
+        if member is not None:
+            return member
+        return await self._coalesce(("member", guild.id, member_id), lambda: guild.fetch_member(member_id))
+
+    async def channel(self, guild: discord.Guild, channel_id: Union[int, str]) -> GuildChannel:
+        channel_id = int(channel_id)
+        channel = guild.get_channel_or_thread(channel_id)
+        record_cache_lookup("discord_channels", channel is not None)
+        if channel is not None:
+            return channel
+        return await self._coalesce(("channel", channel_id), lambda: guild.fetch_channel(channel_id))
+
+    async def _coalesce(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        if key not in self._inflight:
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so a cancelled caller does not cancel the request for everyone else waiting on it
+        return await asyncio.shield(self._inflight[key])
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from utils.Metrics import metrics
+
+
+class Priority(IntEnum):
+    """Classes of outbound Discord requests, most urgent first."""
+
+    INTERACTION = 0
+    PLAYBACK = 1
+    BACKGROUND = 2
+
+
+# Sheddable jobs still queued after this many seconds are dropped, as their result would be stale
+MAX_WAIT_SECONDS = {Priority.INTERACTION: None, Priority.PLAYBACK: 15, Priority.BACKGROUND: 120}
+# Once a class has this many jobs queued, its oldest sheddable jobs are dropped
+MAX_PENDING = {Priority.INTERACTION: None, Priority.PLAYBACK: 200, Priority.BACKGROUND: 1000}
+# How far into each queue to look for a job whose bucket has budget left
+SCAN_LIMIT = 50
+
+WAIT_SECONDS = metrics.histogram(
+    "mocbot_rest_wait_seconds",
+    "Time outbound Discord requests wait in the scheduler before being sent, by priority class",
+    ["priority"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+JOBS = metrics.counter(
+    "mocbot_rest_jobs_total",
+    "Outbound Discord requests by priority class and outcome: sent, failed, merged or shed",
+    ["priority", "outcome"],
+)
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, in bursts of up to capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, force: bool = False) -> bool:
+        """Take a token if one is available. force takes one regardless, going into debt up to capacity."""
+        self._refill()
+        if self.tokens < 1 and not force:
+            return False
+        self.tokens = max(self.tokens - 1, -self.capacity)
+        return True
+
+    def delay(self) -> float:
+        """Seconds until a token is available."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+@dataclass(eq=False)
+class Job:
+    priority: Priority
+    func: Callable[[], Awaitable[Any]]
+    bucket: Optional[Hashable]
+    key: Optional[Hashable]
+    sheddable: bool
+    future: asyncio.Future
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class RestScheduler:
+    """Central scheduler for outbound Discord requests made outside of interaction responses.
+
+    Jobs are sent highest priority first, within a global request budget kept below Discord's global rate limit, so
+    background work cannot push interactive traffic into 429 backoff. Jobs can name a bucket, such as a channel or
+    member, which gets its own smaller budget, and a key: a job submitted while another with the same key is queued
+    is merged into it, so only the latest version is sent, at the highest priority of any merged. Sheddable jobs are
+    dropped when they have waited too long or their class has too many queued. discord.py still handles the actual
+    rate limit headers of each request.
+
+    Interaction responses are sent directly, since they have a deadline, but are counted against the global budget.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 40,
+        bucket_rate: float = 1,
+        bucket_capacity: float = 5,
+        concurrency: int = 8,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.bucket_rate = bucket_rate
+        self.bucket_capacity = bucket_capacity
+        self._global = TokenBucket(global_rate, global_rate)
+        self._buckets: dict[Hashable, TokenBucket] = {}
+        self._queues: dict[Priority, deque[Job]] = {priority: deque() for priority in Priority}
+        self._keys: dict[Hashable, Job] = {}
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: set[asyncio.Task] = set()
+
+        metrics.gauge(
+            "mocbot_rest_queued", "Outbound Discord requests waiting in the scheduler, by priority class", ["priority"],
+            function=lambda: [((priority.name.lower(),), len(queue)) for priority, queue in self._queues.items()],
+        )
+
+    def start(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for queue in self._queues.values():
+            while queue:
+                queue.popleft().future.cancel()
+        self._keys.clear()
+
+    async def run(
+        self,
+        priority: Priority,
+        func: Callable[[], Awaitable[Any]],
+        *,
+        bucket: Optional[Hashable] = None,
+        key: Optional[Hashable] = None,
+        sheddable: Optional[bool] = None,
+    ) -> Any:
+        """Queue a request and wait for its result. Returns None if the request was shed. sheddable defaults to
+        True for background requests only."""
+        return await self._submit(priority, func, bucket, key, sheddable)
+
+    def schedule(
+        self,
+        priority: Priority,
+        func: Callable[[], Awaitable[Any]],
+        *,
+        bucket: Optional[Hashable] = None,
+        key: Optional[Hashable] = None,
+        sheddable: Optional[bool] = None,
+    ):
+        """Queue a request without waiting for it. Failures are logged."""
+        self._submit(priority, func, bucket, key, sheddable).add_done_callback(self._log_failure)
+
+    def note_interaction(self):
+        """Count an interaction response, sent outside the scheduler, against the global budget."""
+        self._global.take(force=True)
+
+    def _submit(self, priority, func, bucket, key, sheddable) -> asyncio.Future:
+        sheddable = priority == Priority.BACKGROUND if sheddable is None else sheddable
+        if key is not None and key in self._keys:
+            job = self._keys[key]
+            job.func = func
+            JOBS.inc(priority=job.priority.name.lower(), outcome="merged")
+            # The merged job is sent as urgently, and kept as surely, as the most demanding job merged into it
+            job.sheddable = job.sheddable and sheddable
+            if priority < job.priority:
+                self._queues[job.priority].remove(job)
+                job.priority = priority
+                self._queues[priority].append(job)
+                self._wakeup.set()
+            return job.future
+
+        job = Job(priority, func, bucket, key, sheddable, asyncio.get_running_loop().create_future())
+        queue = self._queues[priority]
+        queue.append(job)
+        if key is not None:
+            self._keys[key] = job
+
+        limit = MAX_PENDING[priority]
+        if limit is not None and len(queue) > limit:
+            oldest = next((queued for queued in queue if queued.sheddable), None)
+            if oldest is not None:
+                queue.remove(oldest)
+                self._shed(oldest)
+
+        self._wakeup.set()
+        return job.future
+
+    async def _dispatch(self):
+        while True:
+            await self._slots.acquire()
+            # Wait for global budget before choosing a job, so anything more urgent queued meanwhile goes first
+            while (delay := self._global.delay()) > 0:
+                await asyncio.sleep(delay)
+
+            job = self._next_job()
+            if job is None:
+                self._slots.release()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._next_delay())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._global.take()
+            task = asyncio.create_task(self._execute(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def _next_job(self) -> Optional[Job]:
+        """Pop the most urgent job whose bucket has budget, shedding expired jobs on the way."""
+        now = time.monotonic()
+        for priority, queue in self._queues.items():
+            max_wait = MAX_WAIT_SECONDS[priority]
+            i = 0
+            while i < min(len(queue), SCAN_LIMIT):
+                job = queue[i]
+                if job.sheddable and max_wait is not None and now - job.queued_at > max_wait:
+                    del queue[i]
+                    self._shed(job)
+                    continue
+                if job.bucket is None or self._bucket(job.bucket).take():
+                    del queue[i]
+                    self._forget(job)
+                    return job
+                i += 1
+        return None
+
+    def _next_delay(self) -> Optional[float]:
+        """Seconds until a queued job's bucket has budget again, or None if nothing is queued."""
+        delays = [
+            self._bucket(job.bucket).delay() if job.bucket is not None else 0
+            for queue in self._queues.values()
+            for job in list(queue)[:SCAN_LIMIT]
+        ]
+        return min(max(min(delays), 0.01), 1) if delays else None
+
+    def _bucket(self, bucket: Hashable) -> TokenBucket:
+        if bucket not in self._buckets:
+            if len(self._buckets) > 10_000:
+                # Forget buckets with nothing owed, they would start full again anyway
+                self._buckets = {key: value for key, value in self._buckets.items() if not value.idle}
+            self._buckets[bucket] = TokenBucket(self.bucket_rate, self.bucket_capacity)
+        return self._buckets[bucket]
+
+    async def _execute(self, job: Job):
+        label = job.priority.name.lower()
+        WAIT_SECONDS.observe(time.monotonic() - job.queued_at, priority=label)
+        try:
+            result = await job.func()
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            JOBS.inc(priority=label, outcome="failed")
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            JOBS.inc(priority=label, outcome="sent")
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def _shed(self, job: Job):
+        self._forget(job)
+        JOBS.inc(priority=job.priority.name.lower(), outcome="shed")
+        if not job.future.done():
+            job.future.set_result(None)
+
+    def _forget(self, job: Job):
+        if job.key is not None and self._keys.get(job.key) is job:
+            del self._keys[job.key]
+
+    def _log_failure(self, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            self.logger.error("[REST] Scheduled request failed: %s", future.exception(), exc_info=future.exception())
@@ -0,0 +1,26 @@
+import logging
+import random
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a share of the low level records from noisy loggers.
+
+    rates maps a logger name to the share of its records, and its children's, to keep. Records above level are
+    always kept.
+    """
+
+    def __init__(self, rates: dict[str, float], level: str = "DEBUG"):
+        super().__init__()
+        self.rates = rates
+        self.level = logging.getLevelName(level)
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+
+        name = record.name
+        while name:
+            if name in self.rates:
+                return random.random() < self.rates[name]
+            name = name.rpartition(".")[0]
+        return True